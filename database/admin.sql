@@ -0,0 +1,20 @@
+USE [权限实验];
+GO
+
+-- =========================================
+-- 管理员名单（auth.require_admin）
+-- [User].user_type 是会员等级（0 普通 / 1 白银 / 2 VIP），由 trg_UpdateUserLevelOnOrderComplete
+-- 按累计消费自动调整，不能用来判断管理员。管理员只记录在这张表中，没有触发器或接口写入，
+-- 只能由 DBA 手动授予 / 撤销：
+--   INSERT INTO dbo.AdminUser (user_id) VALUES (@user_id);
+--   DELETE FROM dbo.AdminUser WHERE user_id = @user_id;
+-- 可重复执行。
+-- =========================================
+
+IF OBJECT_ID('dbo.AdminUser', 'U') IS NULL
+    CREATE TABLE dbo.AdminUser (
+        user_id INT NOT NULL,
+        grant_time DATETIME2(0) NOT NULL CONSTRAINT DF_AdminUser_GrantTime DEFAULT SYSDATETIME(),
+        CONSTRAINT PK_AdminUser PRIMARY KEY (user_id)
+    );
+GO
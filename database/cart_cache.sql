@@ -0,0 +1,53 @@
+USE [权限实验];
+GO
+
+-- =========================================
+-- 购物车快照缓存：商品版本号
+-- 商品任意字段（价格、库存、上下架等）变化时 row_version 自动递增，
+-- 应用端按 row_version 水位轮询变化的商品，判断缓存的购物车是否过期。
+-- =========================================
+
+IF COL_LENGTH('dbo.Product', 'row_version') IS NULL
+    ALTER TABLE dbo.Product ADD row_version ROWVERSION;
+GO
+
+-- 轮询：WHERE row_version > @watermark
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Product_RowVersion' AND object_id = OBJECT_ID('dbo.Product'))
+    CREATE NONCLUSTERED INDEX IX_Product_RowVersion
+        ON dbo.Product (row_version);
+GO
+
+-- =========================================
+-- 购物车版本号：每个用户一行，Cart 上每条实际改动了该用户行的语句（加购、改数量、删除、
+-- 下单清空购物车等，不论来自哪个进程）使 version 加 1。
+-- 应用端读取购物车时比较快照记录的 version；本进程写入后快照只在 version 恰好增加了
+-- 本进程写入的次数时继续使用，否则说明期间有其他写入，丢弃快照重新查询。
+-- =========================================
+
+IF OBJECT_ID('dbo.CartVersion', 'U') IS NULL
+    CREATE TABLE dbo.CartVersion (
+        user_id INT NOT NULL,
+        version BIGINT NOT NULL,
+        CONSTRAINT PK_CartVersion PRIMARY KEY (user_id)
+    );
+GO
+
+IF OBJECT_ID('dbo.trg_Cart_Version', 'TR') IS NOT NULL
+    DROP TRIGGER dbo.trg_Cart_Version;
+GO
+CREATE TRIGGER dbo.trg_Cart_Version
+ON dbo.Cart
+AFTER INSERT, UPDATE, DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    -- 一条语句对涉及的每个用户只加 1；没有影响任何行时 inserted/deleted 为空，不改变版本
+    MERGE dbo.CartVersion WITH (HOLDLOCK) AS t
+    USING (SELECT user_id FROM inserted UNION SELECT user_id FROM deleted) AS s
+    ON t.user_id = s.user_id
+    WHEN MATCHED THEN UPDATE SET version = t.version + 1
+    WHEN NOT MATCHED BY TARGET THEN
+        INSERT (user_id, version) VALUES (s.user_id, 1);
+END
+GO
@@ -0,0 +1,266 @@
+USE [权限实验];
+GO
+
+-- =========================================
+-- 主键序列：替代 ISNULL(MAX(id), 0) + 1
+-- 应用端通过 sys.sp_sequence_get_range 一次预留一段 ID（hi/lo 分配），
+-- 存储过程内部使用 NEXT VALUE FOR。两种方式取号互不冲突。
+-- 序列起始值取各表当前最大值 + 1，可重复执行。
+-- =========================================
+
+DECLARE @seqs TABLE (seq_name SYSNAME, table_name SYSNAME, column_name SYSNAME);
+INSERT INTO @seqs VALUES
+    ('seq_User',      '[User]',    'user_id'),
+    ('seq_Address',   'Address',   'address_id'),
+    ('seq_Cart',      'Cart',      'cart_id'),
+    ('seq_Order',     '[Order]',   'order_id'),
+    ('seq_OrderItem', 'OrderItem', 'item_id'),
+    ('seq_Payment',   'Payment',   'payment_id');
+
+DECLARE @seq_name SYSNAME, @table_name SYSNAME, @column_name SYSNAME, @sql NVARCHAR(MAX);
+DECLARE seq_cursor CURSOR LOCAL FAST_FORWARD FOR SELECT seq_name, table_name, column_name FROM @seqs;
+OPEN seq_cursor;
+FETCH NEXT FROM seq_cursor INTO @seq_name, @table_name, @column_name;
+WHILE @@FETCH_STATUS = 0
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM sys.sequences WHERE name = @seq_name)
+    BEGIN
+        SET @sql = N'DECLARE @start INT = (SELECT ISNULL(MAX(' + @column_name + N'), 0) + 1 FROM dbo.' + @table_name + N');
+            DECLARE @ddl NVARCHAR(400) = N''CREATE SEQUENCE dbo.' + @seq_name + N' AS INT START WITH ''
+                + CAST(@start AS NVARCHAR(20)) + N'' INCREMENT BY 1 CACHE 100'';
+            EXEC sp_executesql @ddl;';
+        EXEC sp_executesql @sql;
+    END
+    FETCH NEXT FROM seq_cursor INTO @seq_name, @table_name, @column_name;
+END
+CLOSE seq_cursor;
+DEALLOCATE seq_cursor;
+GO
+
+-- =========================================
+-- 存储过程改用序列取号
+-- =========================================
+
+ALTER PROCEDURE [dbo].[sp_RegisterUser]
+    @username VARCHAR(50),
+    @password VARCHAR(255),
+    @phone VARCHAR(20),
+    @email VARCHAR(100),
+    @user_type SMALLINT = 0,
+    @new_user_id INT OUTPUT
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    BEGIN TRY
+        BEGIN TRANSACTION;
+
+        -- 生成新用户ID
+        DECLARE @next_id INT = NEXT VALUE FOR dbo.seq_User;
+
+        -- 插入用户数据
+        INSERT INTO [dbo].[User]
+            (user_id, username, password, phone, email, user_type, register_time)
+        VALUES
+            (@next_id, @username, @password, @phone, @email, @user_type, GETDATE());
+
+        SET @new_user_id = @next_id;
+
+        -- 自动创建默认地址（地址ID单独取号，避免与应用端分配的地址ID冲突）
+        INSERT INTO [dbo].[Address]
+            (address_id, user_id, receiver_name, receiver_phone, detail_address, is_default)
+        VALUES
+            (NEXT VALUE FOR dbo.seq_Address, @next_id, @username, @phone, '请完善地址信息', 1);
+
+        COMMIT TRANSACTION;
+
+        PRINT '用户注册成功！';
+    END TRY
+    BEGIN CATCH
+        ROLLBACK TRANSACTION;
+        DECLARE @ErrorMessage NVARCHAR(4000) = ERROR_MESSAGE();
+        RAISERROR('注册失败：%s', 16, 1, @ErrorMessage);
+    END CATCH
+END
+GO
+
+ALTER PROCEDURE [dbo].[sp_AddToCart]
+    @user_id INT,
+    @product_id INT,
+    @quantity INT = 1
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    -- 检查用户是否存在
+    IF NOT EXISTS(SELECT 1 FROM [dbo].[User] WHERE user_id = @user_id)
+    BEGIN
+        RAISERROR('用户不存在！', 16, 1);
+        RETURN;
+    END
+
+    -- 检查商品是否存在且有库存
+    IF NOT EXISTS(SELECT 1 FROM [dbo].[Product] WHERE product_id = @product_id AND product_status = 1)
+    BEGIN
+        RAISERROR('商品不存在或已下架！', 16, 1);
+        RETURN;
+    END
+
+    DECLARE @available_stock INT;
+    SELECT @available_stock = stock_quantity FROM [dbo].[Product] WHERE product_id = @product_id;
+
+    IF @available_stock < @quantity
+    BEGIN
+        RAISERROR('库存不足！当前库存：%d', 16, 1, @available_stock);
+        RETURN;
+    END
+
+    -- 检查购物车是否已有该商品
+    IF EXISTS(SELECT 1 FROM [dbo].[Cart] WHERE user_id = @user_id AND product_id = @product_id)
+    BEGIN
+        -- 更新数量
+        UPDATE [dbo].[Cart]
+        SET cart_quantity = cart_quantity + @quantity,
+            add_time = GETDATE()
+        WHERE user_id = @user_id AND product_id = @product_id;
+
+        PRINT '购物车商品数量已更新！';
+    END
+    ELSE
+    BEGIN
+        -- 新增记录
+        INSERT INTO [dbo].[Cart]
+            (cart_id, user_id, product_id, cart_quantity, add_time)
+        VALUES
+            (NEXT VALUE FOR dbo.seq_Cart, @user_id, @product_id, @quantity, GETDATE());
+
+        PRINT '商品已添加到购物车！';
+    END
+
+    -- 返回购物车信息
+    EXEC sp_GetCart @user_id = @user_id;
+END
+GO
+
+-- @prices：应用端按购物车同一套促销定价（pricing.py）算出的成交单价，
+--   JSON [{"product_id": 1, "list_price": "99.00", "unit_price": "89.10"}, ...]。
+--   传入时购物车中每个商品都必须有一项，且 list_price 等于当前 Product.price、
+--   0 < unit_price <= list_price，否则说明定价后商品或购物车已变化，整单拒绝；
+--   不传时按原价下单（兼容旧调用方）。
+ALTER PROCEDURE [dbo].[sp_CreateOrder]
+    @user_id INT,
+    @address_id INT,
+    @order_id INT OUTPUT,
+    @prices NVARCHAR(MAX) = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    BEGIN TRY
+        BEGIN TRANSACTION;
+
+        -- 验证用户和地址
+        IF NOT EXISTS(SELECT 1 FROM [dbo].[User] WHERE user_id = @user_id)
+        BEGIN
+            RAISERROR('用户不存在！', 16, 1);
+            ROLLBACK TRANSACTION;
+            RETURN;
+        END
+
+        IF NOT EXISTS(SELECT 1 FROM [dbo].[Address] WHERE address_id = @address_id AND user_id = @user_id)
+        BEGIN
+            RAISERROR('地址不存在或不属于该用户！', 16, 1);
+            ROLLBACK TRANSACTION;
+            RETURN;
+        END
+
+        -- 获取购物车商品
+        IF NOT EXISTS(SELECT 1 FROM [dbo].[Cart] WHERE user_id = @user_id)
+        BEGIN
+            RAISERROR('购物车为空，无法创建订单！', 16, 1);
+            ROLLBACK TRANSACTION;
+            RETURN;
+        END
+
+        -- 成交单价：按应用端定价，商品行加 HOLDLOCK 保持到事务结束，防止校验后改价
+        DECLARE @item_prices TABLE (product_id INT PRIMARY KEY, unit_price DECIMAL(10,2));
+        IF @prices IS NOT NULL
+        BEGIN
+            INSERT INTO @item_prices (product_id, unit_price)
+            SELECT c.product_id, j.unit_price
+            FROM [dbo].[Cart] c
+            INNER JOIN [dbo].[Product] p WITH (HOLDLOCK) ON c.product_id = p.product_id
+            INNER JOIN OPENJSON(@prices) WITH (
+                product_id INT, list_price DECIMAL(10,2), unit_price DECIMAL(10,2)
+            ) j ON j.product_id = c.product_id
+            WHERE c.user_id = @user_id
+              AND j.list_price = p.price
+              AND j.unit_price > 0 AND j.unit_price <= p.price;
+
+            IF EXISTS(
+                SELECT 1 FROM [dbo].[Cart] c
+                WHERE c.user_id = @user_id
+                  AND NOT EXISTS(SELECT 1 FROM @item_prices ip WHERE ip.product_id = c.product_id)
+            )
+            BEGIN
+                RAISERROR('购物车价格已变化，请刷新后重试！', 16, 1);
+                ROLLBACK TRANSACTION;
+                RETURN;
+            END
+        END
+
+        -- 生成订单ID
+        DECLARE @new_order_id INT = NEXT VALUE FOR dbo.seq_Order;
+
+        -- 创建订单
+        INSERT INTO [dbo].[Order]
+            (order_id, user_id, address_id, total_amount, create_time, order_status)
+        VALUES
+            (@new_order_id, @user_id, @address_id, 0, GETDATE(), 0);
+
+        -- 从购物车转移商品到订单项（订单项ID按购物车顺序从序列取号）
+        INSERT INTO [dbo].[OrderItem]
+            (item_id, order_id, product_id, order_quantity, unit_price, subtotal)
+        SELECT
+            NEXT VALUE FOR dbo.seq_OrderItem OVER (ORDER BY c.cart_id),
+            @new_order_id,
+            c.product_id,
+            c.cart_quantity,
+            ISNULL(ip.unit_price, p.price),
+            ISNULL(ip.unit_price, p.price) * c.cart_quantity
+        FROM [dbo].[Cart] c
+        INNER JOIN [dbo].[Product] p ON c.product_id = p.product_id
+        LEFT JOIN @item_prices ip ON ip.product_id = c.product_id
+        WHERE c.user_id = @user_id;
+
+        -- 计算订单总金额
+        DECLARE @total_amount DECIMAL(10,2);
+        SELECT @total_amount = SUM(subtotal) FROM [dbo].[OrderItem] WHERE order_id = @new_order_id;
+
+        UPDATE [dbo].[Order]
+        SET total_amount = @total_amount
+        WHERE order_id = @new_order_id;
+
+        -- 清空购物车
+        DELETE FROM [dbo].[Cart] WHERE user_id = @user_id;
+
+        SET @order_id = @new_order_id;
+
+        COMMIT TRANSACTION;
+
+        PRINT '订单创建成功！订单号：' + CAST(@new_order_id AS VARCHAR);
+
+        -- 返回订单详情
+        SELECT * FROM [dbo].[Order] WHERE order_id = @new_order_id;
+    END TRY
+    BEGIN CATCH
+        ROLLBACK TRANSACTION;
+        DECLARE @ErrorMessage NVARCHAR(4000) = ERROR_MESSAGE();
+        RAISERROR('创建订单失败：%s', 16, 1, @ErrorMessage);
+    END CATCH
+END
+GO
+
+-- sp_PayOrder 的支付记录同样使用 seq_Payment 取号，但该存储过程只在 product_sales.sql 中定义
+-- （支付时还要累加 ProductSales 销量）。这里不再重复 ALTER，避免重复执行本脚本后覆盖掉销量维护；
+-- 执行顺序：先 id_allocator.sql（创建 seq_Payment），再 product_sales.sql。
@@ -0,0 +1,29 @@
+USE [权限实验];
+GO
+
+-- =========================================
+-- 下单 / 支付的幂等键（idempotency.py）
+-- 客户端在 POST /orders/、POST /orders/{id}/pay 上带 Idempotency-Key 请求头，
+-- 同一用户同一个键只执行一次，之后原样返回第一次的响应，不再调用 sp_CreateOrder / sp_PayOrder。
+--   request_hash： 请求内容（接口 + 参数）的 SHA-256，同一个键换了请求内容时拒绝
+--   status_code：  NULL 表示正在处理中；处理完成后为响应状态码，response 为响应体（JSON）
+--   expire_time：  处理中为占用截止时间，完成后为结果保留截止时间，过期记录由后台任务分批删除
+-- 可重复执行。
+-- =========================================
+
+IF OBJECT_ID('dbo.IdempotencyKey', 'U') IS NULL
+    CREATE TABLE dbo.IdempotencyKey (
+        user_id INT NOT NULL,
+        idempotency_key VARCHAR(64) NOT NULL,
+        request_hash BINARY(32) NOT NULL,
+        status_code SMALLINT NULL,
+        response VARBINARY(MAX) NULL,
+        expire_time DATETIME2(0) NOT NULL,
+        CONSTRAINT PK_IdempotencyKey PRIMARY KEY (user_id, idempotency_key)
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_IdempotencyKey_Expire' AND object_id = OBJECT_ID('dbo.IdempotencyKey'))
+    CREATE NONCLUSTERED INDEX IX_IdempotencyKey_Expire
+        ON dbo.IdempotencyKey (expire_time);
+GO
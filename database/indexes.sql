@@ -0,0 +1,20 @@
+USE [权限实验];
+GO
+
+-- =========================================
+-- 游标（seek）分页所需索引
+-- =========================================
+
+-- 订单列表：WHERE user_id = ? ORDER BY create_time DESC, order_id DESC
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Order_User_CreateTime' AND object_id = OBJECT_ID('dbo.[Order]'))
+    CREATE NONCLUSTERED INDEX IX_Order_User_CreateTime
+        ON dbo.[Order] (user_id, create_time DESC, order_id DESC)
+        INCLUDE (address_id, total_amount, order_status, pay_time, ship_time);
+GO
+
+-- 商品列表：WHERE product_status = 1 ORDER BY product_id DESC
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Product_Status_Id' AND object_id = OBJECT_ID('dbo.Product'))
+    CREATE NONCLUSTERED INDEX IX_Product_Status_Id
+        ON dbo.Product (product_status, product_id DESC)
+        INCLUDE (category_id, price);
+GO
@@ -0,0 +1,51 @@
+USE [权限实验];
+GO
+
+-- =========================================
+-- 商品批量导入（product_import.py / POST /api/admin/import/products）
+--   seq_Product：新商品 ID 序列，导入程序按批预留号段，sp_AddProduct 改用 NEXT VALUE FOR
+-- 序列起始值取当前最大商品 ID + 1，可重复执行。
+-- =========================================
+
+IF NOT EXISTS (SELECT 1 FROM sys.sequences WHERE name = 'seq_Product')
+BEGIN
+    DECLARE @start INT = (SELECT ISNULL(MAX(product_id), 0) + 1 FROM dbo.Product);
+    DECLARE @ddl NVARCHAR(400) = N'CREATE SEQUENCE dbo.seq_Product AS INT START WITH '
+        + CAST(@start AS NVARCHAR(20)) + N' INCREMENT BY 1 CACHE 100';
+    EXEC sp_executesql @ddl;
+END
+GO
+
+ALTER PROCEDURE [dbo].[sp_AddProduct]
+    @category_id INT,
+    @product_name VARCHAR(100),
+    @description VARCHAR(100) = NULL,
+    @price DECIMAL(10,2),
+    @stock_quantity INT = 0,
+    @image VARCHAR(225) = NULL,
+    @new_product_id INT OUTPUT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    
+    -- 验证分类是否存在
+    IF NOT EXISTS(SELECT 1 FROM [dbo].[Category] WHERE category_id = @category_id)
+    BEGIN
+        RAISERROR('商品分类不存在！', 16, 1);
+        RETURN;
+    END
+    
+    -- 生成商品ID
+    DECLARE @next_id INT = NEXT VALUE FOR dbo.seq_Product;
+    
+    INSERT INTO [dbo].[Product]
+        (product_id, category_id, product_name, description, price, 
+         stock_quantity, image, product_status)
+    VALUES
+        (@next_id, @category_id, @product_name, @description, @price,
+         @stock_quantity, @image, 1);
+    
+    SET @new_product_id = @next_id;
+    PRINT '商品添加成功！';
+END
+GO
@@ -0,0 +1,255 @@
+USE [权限实验];
+GO
+
+-- =========================================
+-- 商品销量计数（替代商品列表/详情中写死的 0 AS sold_quantity）
+--   ProductSales：每个商品一行，sold_quantity 为已支付订单（order_status IN (1,2,3)）中的销量，
+--                 与 vw_TopSellingProducts.total_sold_quantity 口径一致
+-- 维护方式：
+--   1. sp_PayOrder 支付成功时按订单明细累加（同一事务）
+--   2. trg_Order_ProductSales：订单从已支付状态改为其他状态（退款/取消）时扣减；
+--      从 0 以外的未支付状态改回已支付时累加（0 → 1 由 sp_PayOrder 负责）
+--   3. trg_OrderItem_ProductSales：已支付订单的明细增删改时按差值修正
+--      （订单明细被删除后订单才能删除，删除已支付订单的销量在删除明细时已扣减）
+--   4. trg_Product_ProductSales：新商品自动插入计数行
+--   5. sp_ReconcileProductSales：与 vw_TopSellingProducts 对账，@fix = 1 时修正
+-- 单独建表而不是在 Product 上加列：避免每次支付都更新 Product（推进 row_version、触发审计）。
+-- sp_PayOrder 只在本脚本中定义（支付记录用 seq_Payment 取号），须在 id_allocator.sql 之后执行。
+-- =========================================
+
+IF OBJECT_ID('dbo.ProductSales', 'U') IS NULL
+    CREATE TABLE dbo.ProductSales (
+        product_id INT NOT NULL PRIMARY KEY,
+        sold_quantity INT NOT NULL DEFAULT 0,
+        update_time DATETIME NOT NULL DEFAULT GETDATE()
+    );
+GO
+
+-- 销量排序：ORDER BY sold_quantity DESC, product_id DESC 直接按索引顺序读取
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ProductSales_Sold' AND object_id = OBJECT_ID('dbo.ProductSales'))
+    CREATE NONCLUSTERED INDEX IX_ProductSales_Sold
+        ON dbo.ProductSales (sold_quantity DESC, product_id DESC);
+GO
+
+-- 回填：所有商品一行，已有销量按订单明细汇总
+INSERT INTO dbo.ProductSales (product_id, sold_quantity)
+SELECT p.product_id, ISNULL(x.sold_quantity, 0)
+FROM dbo.Product p
+LEFT JOIN (
+    SELECT oi.product_id, SUM(oi.order_quantity) AS sold_quantity
+    FROM dbo.OrderItem oi
+    INNER JOIN dbo.[Order] o ON o.order_id = oi.order_id
+    WHERE o.order_status IN (1, 2, 3)
+    GROUP BY oi.product_id
+) x ON x.product_id = p.product_id
+WHERE NOT EXISTS (SELECT 1 FROM dbo.ProductSales s WHERE s.product_id = p.product_id);
+GO
+
+-- 按 (product_id, delta) 累加销量，缺行时补行
+IF OBJECT_ID('dbo.sp_ApplyProductSalesDelta', 'P') IS NOT NULL
+    DROP PROCEDURE dbo.sp_ApplyProductSalesDelta;
+IF TYPE_ID('dbo.ProductSalesDelta') IS NULL
+    CREATE TYPE dbo.ProductSalesDelta AS TABLE (product_id INT NOT NULL PRIMARY KEY, delta INT NOT NULL);
+GO
+CREATE PROCEDURE dbo.sp_ApplyProductSalesDelta
+    @deltas dbo.ProductSalesDelta READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    MERGE dbo.ProductSales WITH (HOLDLOCK) AS t
+    USING (SELECT product_id, delta FROM @deltas WHERE delta <> 0) AS s
+    ON t.product_id = s.product_id
+    WHEN MATCHED THEN UPDATE SET
+        sold_quantity = t.sold_quantity + s.delta,
+        update_time = GETDATE()
+    WHEN NOT MATCHED BY TARGET THEN
+        INSERT (product_id, sold_quantity) VALUES (s.product_id, s.delta);
+END
+GO
+
+IF OBJECT_ID('dbo.trg_Order_ProductSales', 'TR') IS NOT NULL
+    DROP TRIGGER dbo.trg_Order_ProductSales;
+GO
+CREATE TRIGGER dbo.trg_Order_ProductSales
+ON dbo.[Order]
+AFTER UPDATE
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    IF NOT UPDATE(order_status)
+        RETURN;
+
+    DECLARE @deltas dbo.ProductSalesDelta;
+    INSERT INTO @deltas (product_id, delta)
+    SELECT oi.product_id,
+        SUM(CASE WHEN i.order_status IN (1, 2, 3) THEN oi.order_quantity ELSE -oi.order_quantity END)
+    FROM inserted i
+    INNER JOIN deleted d ON d.order_id = i.order_id
+    INNER JOIN dbo.OrderItem oi ON oi.order_id = i.order_id
+    WHERE oi.product_id IS NOT NULL
+      AND (
+          -- 退款/取消：离开已支付状态
+          (d.order_status IN (1, 2, 3) AND i.order_status NOT IN (1, 2, 3))
+          -- 从 0 以外的未支付状态恢复为已支付
+          OR (d.order_status NOT IN (0, 1, 2, 3) AND i.order_status IN (1, 2, 3))
+      )
+    GROUP BY oi.product_id;
+
+    IF EXISTS (SELECT 1 FROM @deltas)
+        EXEC dbo.sp_ApplyProductSalesDelta @deltas;
+END
+GO
+
+IF OBJECT_ID('dbo.trg_OrderItem_ProductSales', 'TR') IS NOT NULL
+    DROP TRIGGER dbo.trg_OrderItem_ProductSales;
+GO
+CREATE TRIGGER dbo.trg_OrderItem_ProductSales
+ON dbo.OrderItem
+AFTER INSERT, UPDATE, DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @deltas dbo.ProductSalesDelta;
+    INSERT INTO @deltas (product_id, delta)
+    SELECT x.product_id, SUM(x.quantity)
+    FROM (
+        SELECT i.product_id, i.order_id, i.order_quantity AS quantity FROM inserted i
+        UNION ALL
+        SELECT d.product_id, d.order_id, -d.order_quantity FROM deleted d
+    ) x
+    INNER JOIN dbo.[Order] o ON o.order_id = x.order_id
+    WHERE o.order_status IN (1, 2, 3)
+      AND x.product_id IS NOT NULL
+    GROUP BY x.product_id;
+
+    IF EXISTS (SELECT 1 FROM @deltas WHERE delta <> 0)
+        EXEC dbo.sp_ApplyProductSalesDelta @deltas;
+END
+GO
+
+IF OBJECT_ID('dbo.trg_Product_ProductSales', 'TR') IS NOT NULL
+    DROP TRIGGER dbo.trg_Product_ProductSales;
+GO
+CREATE TRIGGER dbo.trg_Product_ProductSales
+ON dbo.Product
+AFTER INSERT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO dbo.ProductSales (product_id, sold_quantity)
+    SELECT i.product_id, 0
+    FROM inserted i
+    WHERE NOT EXISTS (SELECT 1 FROM dbo.ProductSales s WHERE s.product_id = i.product_id);
+END
+GO
+
+-- 支付成功时累加销量（sp_PayOrder 的唯一定义，修改支付流程请改这里）
+ALTER PROCEDURE [dbo].[sp_PayOrder]
+    @order_id INT,
+    @payment_method VARCHAR(50),
+    @transaction_id VARCHAR(100) = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    BEGIN TRANSACTION;
+
+    -- 检查订单状态
+    DECLARE @current_status SMALLINT, @user_id INT, @total_amount DECIMAL(10,2);
+
+    SELECT
+        @current_status = order_status,
+        @user_id = user_id,
+        @total_amount = total_amount
+    FROM [dbo].[Order]
+    WHERE order_id = @order_id;
+
+    IF @current_status IS NULL
+    BEGIN
+        ROLLBACK TRANSACTION;
+        RAISERROR('订单不存在！', 16, 1);
+        RETURN;
+    END
+
+    IF @current_status <> 0
+    BEGIN
+        ROLLBACK TRANSACTION;
+        RAISERROR('订单状态不正确，无法支付！', 16, 1);
+        RETURN;
+    END
+
+    -- 更新订单状态为已支付
+    UPDATE [dbo].[Order]
+    SET order_status = 1,
+        pay_time = GETDATE()
+    WHERE order_id = @order_id;
+
+    -- 创建支付记录
+    INSERT INTO [dbo].[Payment]
+        (payment_id, order_id, payment_method, payment_amount,
+         payment_status, payment_time, transaction_id)
+    VALUES
+        (NEXT VALUE FOR dbo.seq_Payment, @order_id, @payment_method, @total_amount,
+         1, GETDATE(), @transaction_id);
+
+    -- 累加商品销量
+    DECLARE @deltas dbo.ProductSalesDelta;
+    INSERT INTO @deltas (product_id, delta)
+    SELECT product_id, SUM(order_quantity)
+    FROM [dbo].[OrderItem]
+    WHERE order_id = @order_id AND product_id IS NOT NULL
+    GROUP BY product_id;
+    EXEC dbo.sp_ApplyProductSalesDelta @deltas;
+
+    COMMIT TRANSACTION;
+
+    PRINT '支付成功！';
+    SELECT '支付成功' AS Result, @order_id AS OrderId, @total_amount AS Amount;
+END
+GO
+
+-- 对账：与 vw_TopSellingProducts 比较（该视图只包含有分类的商品，无分类商品不参与对账）
+IF OBJECT_ID('dbo.sp_ReconcileProductSales', 'P') IS NOT NULL
+    DROP PROCEDURE dbo.sp_ReconcileProductSales;
+GO
+CREATE PROCEDURE dbo.sp_ReconcileProductSales
+    @fix BIT = 0
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @diff TABLE (
+        product_id INT PRIMARY KEY,
+        stored_quantity INT NULL,
+        expected_quantity INT NOT NULL
+    );
+
+    INSERT INTO @diff (product_id, stored_quantity, expected_quantity)
+    SELECT p.product_id, s.sold_quantity, ISNULL(v.total_sold_quantity, 0)
+    FROM dbo.Product p
+    INNER JOIN dbo.Category c ON c.category_id = p.category_id
+    LEFT JOIN dbo.ProductSales s ON s.product_id = p.product_id
+    LEFT JOIN dbo.vw_TopSellingProducts v ON v.product_id = p.product_id
+    WHERE s.sold_quantity IS NULL
+       OR s.sold_quantity <> ISNULL(v.total_sold_quantity, 0);
+
+    IF @fix = 1 AND EXISTS (SELECT 1 FROM @diff)
+    BEGIN
+        MERGE dbo.ProductSales WITH (HOLDLOCK) AS t
+        USING @diff AS d
+        ON t.product_id = d.product_id
+        WHEN MATCHED THEN UPDATE SET
+            sold_quantity = d.expected_quantity,
+            update_time = GETDATE()
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT (product_id, sold_quantity) VALUES (d.product_id, d.expected_quantity);
+    END
+
+    SELECT product_id, stored_quantity, expected_quantity
+    FROM @diff
+    ORDER BY product_id;
+END
+GO
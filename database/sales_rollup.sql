@@ -0,0 +1,178 @@
+USE [权限实验];
+GO
+
+-- =========================================
+-- 销售汇总表（替代实时扫描 vw_DailySales / vw_TopSellingProducts / sp_SalesReport）
+--   SalesDailyRollup：        每日订单数、明细数、销售额、销量
+--   SalesProductDailyRollup： 每日每商品销量、销售额、订单数（按分类/商品排行由此汇总）
+-- 后台任务（sales_rollup.py）定期执行 sp_RefreshSalesRollup：
+-- 只取 row_version 大于水位的订单，找出受影响的日期，按天重算这些日期的汇总。
+-- 订单明细的增删改会经 trg_UpdateOrderTotalAmount 更新订单，从而推进订单的 row_version；
+-- 删除的订单由 trg_Order_SalesRollupDelete 记入 SalesRollupDirtyDay。
+-- 统计口径与原视图一致：order_status IN (1,2,3)，按下单日期归属。
+-- =========================================
+
+IF COL_LENGTH('dbo.[Order]', 'row_version') IS NULL
+    ALTER TABLE dbo.[Order] ADD row_version ROWVERSION;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Order_RowVersion' AND object_id = OBJECT_ID('dbo.[Order]'))
+    CREATE NONCLUSTERED INDEX IX_Order_RowVersion
+        ON dbo.[Order] (row_version) INCLUDE (create_time);
+GO
+
+-- 按天重算时按下单时间范围查找（可走索引，不再 CONVERT(DATE, create_time)）
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Order_CreateTime' AND object_id = OBJECT_ID('dbo.[Order]'))
+    CREATE NONCLUSTERED INDEX IX_Order_CreateTime
+        ON dbo.[Order] (create_time) INCLUDE (order_status, total_amount);
+GO
+
+IF OBJECT_ID('dbo.SalesDailyRollup', 'U') IS NULL
+    CREATE TABLE dbo.SalesDailyRollup (
+        sale_date DATE NOT NULL PRIMARY KEY,
+        order_count INT NOT NULL,
+        item_count INT NOT NULL,
+        total_sales DECIMAL(18, 2) NOT NULL,
+        total_quantity INT NOT NULL
+    );
+GO
+
+IF OBJECT_ID('dbo.SalesProductDailyRollup', 'U') IS NULL
+    CREATE TABLE dbo.SalesProductDailyRollup (
+        sale_date DATE NOT NULL,
+        product_id INT NOT NULL,
+        order_count INT NOT NULL,
+        total_quantity INT NOT NULL,
+        total_sales DECIMAL(18, 2) NOT NULL,
+        CONSTRAINT PK_SalesProductDailyRollup PRIMARY KEY (sale_date, product_id)
+    );
+GO
+
+IF OBJECT_ID('dbo.SalesRollupDirtyDay', 'U') IS NULL
+    CREATE TABLE dbo.SalesRollupDirtyDay (
+        sale_date DATE NOT NULL PRIMARY KEY
+    );
+GO
+
+IF OBJECT_ID('dbo.SalesRollupState', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.SalesRollupState (
+        rollup_name VARCHAR(50) NOT NULL PRIMARY KEY,
+        watermark BIGINT NOT NULL,
+        last_run DATETIME NULL,
+        last_orders INT NOT NULL DEFAULT 0,
+        last_days INT NOT NULL DEFAULT 0,
+        last_duration_ms INT NOT NULL DEFAULT 0
+    );
+    INSERT INTO dbo.SalesRollupState (rollup_name, watermark) VALUES ('sales', 0);
+END
+GO
+
+IF OBJECT_ID('dbo.trg_Order_SalesRollupDelete', 'TR') IS NOT NULL
+    DROP TRIGGER dbo.trg_Order_SalesRollupDelete;
+GO
+CREATE TRIGGER dbo.trg_Order_SalesRollupDelete
+ON dbo.[Order]
+AFTER DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    INSERT INTO dbo.SalesRollupDirtyDay (sale_date)
+    SELECT DISTINCT CAST(d.create_time AS DATE)
+    FROM deleted d
+    WHERE NOT EXISTS (
+        SELECT 1 FROM dbo.SalesRollupDirtyDay x WHERE x.sale_date = CAST(d.create_time AS DATE)
+    );
+END
+GO
+
+IF OBJECT_ID('dbo.sp_RefreshSalesRollup', 'P') IS NOT NULL
+    DROP PROCEDURE dbo.sp_RefreshSalesRollup;
+GO
+CREATE PROCEDURE dbo.sp_RefreshSalesRollup
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DECLARE @started DATETIME2 = SYSDATETIME();
+    DECLARE @watermark BIGINT, @upper BIGINT, @lock INT;
+    DECLARE @days TABLE (sale_date DATE PRIMARY KEY);
+
+    BEGIN TRANSACTION;
+
+    -- 多个进程同时运行时只有一个执行，其余直接返回
+    EXEC @lock = sp_getapplock @Resource = 'sales_rollup', @LockMode = 'Exclusive',
+        @LockOwner = 'Transaction', @LockTimeout = 0;
+    IF @lock < 0
+    BEGIN
+        ROLLBACK TRANSACTION;
+        SELECT CAST(0 AS BIT) AS refreshed, NULL AS watermark, 0 AS changed_orders, 0 AS dirty_days;
+        RETURN;
+    END
+
+    SELECT @watermark = watermark FROM dbo.SalesRollupState WHERE rollup_name = 'sales';
+    -- 只处理已提交的版本：大于等于 MIN_ACTIVE_ROWVERSION 的行可能属于未提交事务
+    SET @upper = CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1;
+
+    DECLARE @changed TABLE (sale_date DATE NOT NULL);
+    INSERT INTO @changed (sale_date)
+    SELECT CAST(o.create_time AS DATE)
+    FROM dbo.[Order] o
+    WHERE o.row_version > CAST(@watermark AS BINARY(8))
+      AND o.row_version <= CAST(@upper AS BINARY(8));
+
+    INSERT INTO @days (sale_date)
+    SELECT sale_date FROM @changed
+    UNION
+    SELECT sale_date FROM dbo.SalesRollupDirtyDay;
+
+    DELETE r FROM dbo.SalesDailyRollup r INNER JOIN @days d ON d.sale_date = r.sale_date;
+    DELETE r FROM dbo.SalesProductDailyRollup r INNER JOIN @days d ON d.sale_date = r.sale_date;
+
+    -- 订单级汇总：销售额按订单累加一次（vw_DailySales 在明细连接后求和会按明细行数重复计算）
+    INSERT INTO dbo.SalesDailyRollup (sale_date, order_count, item_count, total_sales, total_quantity)
+    SELECT d.sale_date, COUNT(*), SUM(x.item_count), SUM(o.total_amount), SUM(x.total_quantity)
+    FROM @days d
+    INNER JOIN dbo.[Order] o
+        ON o.create_time >= d.sale_date AND o.create_time < DATEADD(DAY, 1, d.sale_date)
+    CROSS APPLY (
+        SELECT COUNT(*) AS item_count, ISNULL(SUM(oi.order_quantity), 0) AS total_quantity
+        FROM dbo.OrderItem oi
+        WHERE oi.order_id = o.order_id
+    ) x
+    WHERE o.order_status IN (1, 2, 3)
+      AND x.item_count > 0
+    GROUP BY d.sale_date;
+
+    INSERT INTO dbo.SalesProductDailyRollup (sale_date, product_id, order_count, total_quantity, total_sales)
+    SELECT d.sale_date, oi.product_id, COUNT(DISTINCT o.order_id), SUM(oi.order_quantity), ISNULL(SUM(oi.subtotal), 0)
+    FROM @days d
+    INNER JOIN dbo.[Order] o
+        ON o.create_time >= d.sale_date AND o.create_time < DATEADD(DAY, 1, d.sale_date)
+    INNER JOIN dbo.OrderItem oi ON oi.order_id = o.order_id
+    WHERE o.order_status IN (1, 2, 3)
+      AND oi.product_id IS NOT NULL
+    GROUP BY d.sale_date, oi.product_id;
+
+    DELETE x FROM dbo.SalesRollupDirtyDay x INNER JOIN @days d ON d.sale_date = x.sale_date;
+
+    DECLARE @changed_orders INT = (SELECT COUNT(*) FROM @changed);
+    DECLARE @dirty_days INT = (SELECT COUNT(*) FROM @days);
+
+    UPDATE dbo.SalesRollupState
+    SET watermark = CASE WHEN @upper > watermark THEN @upper ELSE watermark END,
+        last_run = GETDATE(),
+        last_orders = @changed_orders,
+        last_days = @dirty_days,
+        last_duration_ms = DATEDIFF(MILLISECOND, @started, SYSDATETIME())
+    WHERE rollup_name = 'sales';
+
+    COMMIT TRANSACTION;
+
+    SELECT CAST(1 AS BIT) AS refreshed, @upper AS watermark, @changed_orders AS changed_orders, @dirty_days AS dirty_days;
+END
+GO
+
+-- 首次执行：水位为 0，会按天回填全部历史
+-- EXEC dbo.sp_RefreshSalesRollup;
@@ -0,0 +1,38 @@
+USE [权限实验];
+GO
+
+-- =========================================
+-- 商品搜索
+--   SEARCH_BACKEND=fulltext：全文目录 + Product 全文索引（中文断词器 LANGUAGE 2052）
+--   SEARCH_BACKEND=memory：  Product 表开启变更跟踪，供进程内倒排索引增量同步
+-- 需要安装“全文搜索”组件；变更跟踪需要数据库级开启。
+-- =========================================
+
+IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = 'ftc_Product')
+    CREATE FULLTEXT CATALOG ftc_Product;
+GO
+
+-- 全文索引的 KEY INDEX 必须是单列、非空的唯一索引，这里使用主键 PK_PRODUCT
+IF NOT EXISTS (SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('dbo.Product'))
+    CREATE FULLTEXT INDEX ON dbo.Product
+    (
+        product_name LANGUAGE 2052,
+        description LANGUAGE 2052
+    )
+    KEY INDEX PK_PRODUCT
+    ON ftc_Product
+    WITH CHANGE_TRACKING AUTO;
+GO
+
+-- 数据库级变更跟踪（保留 2 天，过期后应用端自动全量重建）
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_databases WHERE database_id = DB_ID())
+    ALTER DATABASE CURRENT SET CHANGE_TRACKING = ON (CHANGE_RETENTION = 2 DAYS, AUTO_CLEANUP = ON);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.change_tracking_tables WHERE object_id = OBJECT_ID('dbo.Product'))
+    ALTER TABLE dbo.Product ENABLE CHANGE_TRACKING;
+GO
+
+-- 示例：
+-- SELECT TOP 20 ft.[KEY], ft.RANK FROM FREETEXTTABLE(dbo.Product, (product_name, description), N'苹果手机') ft ORDER BY ft.RANK DESC;
+-- SELECT ct.product_id, ct.SYS_CHANGE_OPERATION FROM CHANGETABLE(CHANGES dbo.Product, 0) ct;
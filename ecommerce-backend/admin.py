@@ -0,0 +1,201 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import Literal, Optional
+from datetime import date, timedelta
+from collections import OrderedDict
+import uuid
+
+from database import async_db
+from responses import FastJSONRoute
+from auth import require_admin
+from streaming import stream_rows, accepts_gzip
+from product_import import ProductImporter, aiter_lines, aiter_records, import_stream
+
+router = APIRouter(prefix="/admin", tags=["管理"], route_class=FastJSONRoute)
+
+# 可导出的报表视图：名称 -> (视图, 排序)
+REPORT_VIEWS = {
+    "order-summary": ("vw_OrderSummary", "order_id"),
+    "order-items": ("vw_OrderItemsDetails", "order_id, item_id"),
+    "payments": ("vw_PaymentRecords", "payment_id"),
+    "top-selling": ("vw_TopSellingProducts", "sales_rank, product_id"),
+    "daily-sales": ("vw_DailySales", "sale_date"),
+    "inventory": ("vw_InventoryStatus", "product_id"),
+    "user-order-statistics": ("vw_UserOrderStatistics", "user_id"),
+}
+
+# 可批量导出的表：名称 -> (FROM 子句, 主键, 列)
+# 日期范围统一按订单创建时间过滤，同一范围导出的三张表相互对应
+EXPORT_TABLES = {
+    "orders": (
+        "[Order] o",
+        "o.order_id",
+        ["order_id", "user_id", "address_id", "total_amount", "create_time",
+         "pay_time", "ship_time", "order_status"],
+    ),
+    "order-items": (
+        "OrderItem t INNER JOIN [Order] o ON t.order_id = o.order_id",
+        "t.item_id",
+        ["item_id", "order_id", "product_id", "order_quantity", "unit_price", "subtotal"],
+    ),
+    "payments": (
+        "Payment t INNER JOIN [Order] o ON t.order_id = o.order_id",
+        "t.payment_id",
+        ["payment_id", "order_id", "payment_method", "payment_amount", "payment_status",
+         "payment_time", "transaction_id"],
+    ),
+}
+
+@router.get("/views")
+async def list_report_views(admin: dict = Depends(require_admin)):
+    """可流式导出的报表视图"""
+    return {
+        "code": 200,
+        "message": "success",
+        "data": [
+            {"name": name, "view": view, "order_by": order_by}
+            for name, (view, order_by) in REPORT_VIEWS.items()
+        ]
+    }
+
+@router.get("/views/{view_name}")
+async def stream_report_view(
+    view_name: str,
+    format: Literal["json", "ndjson"] = "json",
+    limit: Optional[int] = Query(None, ge=1),
+    admin: dict = Depends(require_admin)
+):
+    """流式读取报表视图
+
+    服务端按批 fetchmany、边读边写响应，内存占用与结果行数无关。
+    format=json 返回统一格式的 JSON（data 为数组），format=ndjson 每行一个 JSON 对象。
+    """
+    if view_name not in REPORT_VIEWS:
+        raise HTTPException(status_code=404, detail="报表不存在")
+    view, order_by = REPORT_VIEWS[view_name]
+    
+    top = "TOP (?) " if limit else ""
+    sql = f"SELECT {top}* FROM dbo.{view} ORDER BY {order_by}"
+    params = (limit,) if limit else ()
+    
+    try:
+        return await stream_rows(
+            async_db.stream_query(sql, params, row_format="row"),
+            format=format,
+            filename=f"{view_name}.{format}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"读取报表失败: {str(e)}"
+        )
+
+@router.get("/export/{table}")
+async def export_table(
+    table: str,
+    request: Request,
+    format: Literal["csv", "ndjson"] = "csv",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    since_id: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    admin: dict = Depends(require_admin)
+):
+    """批量导出订单 / 订单明细 / 支付记录
+
+    按主键升序在一个服务端游标上顺序读取，替代逐页调用订单列表接口。
+    - start_date / end_date：订单创建日期范围（含两端）
+    - since_id：断点续传，只导出主键大于该值的行；响应头 X-Export-Key 为主键列名，
+      中断后用已收到的最后一行的主键值重新请求即可
+    - limit：单次最多导出的行数，配合 since_id 分段导出
+    请求头带 Accept-Encoding: gzip 时响应体边读边压缩。
+    """
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail="导出表不存在")
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
+    source, key, columns = EXPORT_TABLES[table]
+    alias = key.split(".")[0]
+
+    conditions = [f"{key} > ?"]
+    params = [since_id]
+    if start_date:
+        conditions.append("o.create_time >= ?")
+        params.append(start_date)
+    if end_date:
+        conditions.append("o.create_time < ?")
+        params.append(end_date + timedelta(days=1))
+
+    top = ""
+    if limit:
+        top = "TOP (?) "
+        params.insert(0, limit)
+    select_list = ", ".join(f"{alias}.{column}" for column in columns)
+    sql = f"SELECT {top}{select_list} FROM {source} WHERE {' AND '.join(conditions)} ORDER BY {key}"
+
+    gzip = accepts_gzip(request)
+    try:
+        return await stream_rows(
+            async_db.stream_query(sql, tuple(params), row_format="row"),
+            format=format,
+            filename=f"{table}.{format}",
+            columns=columns,
+            gzip=gzip,
+            headers={"X-Export-Key": columns[0]}
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"导出失败: {str(e)}"
+        )
+
+# 进行中和最近完成的导入任务：import_id -> ProductImporter
+IMPORTS = OrderedDict()
+MAX_TRACKED_IMPORTS = 20
+
+@router.post("/import/products")
+async def import_products(
+    request: Request,
+    format: Literal["csv", "jsonl"] = "csv",
+    chunk_size: Optional[int] = Query(None, ge=100, le=50000),
+    admin: dict = Depends(require_admin)
+):
+    """批量导入商品（请求体为 CSV 或 JSONL 原文）
+
+    边接收请求体边按批校验、写入，内存占用与文件大小无关。
+    有 product_id 的行按 ID 更新，没有的新增；不合法的行跳过并在 errors 中给出行号和原因。
+    导入过程中可通过 GET /admin/import/progress 查看进度。
+    """
+    importer = ProductImporter(chunk_size=chunk_size)
+    import_id = uuid.uuid4().hex[:12]
+    IMPORTS[import_id] = importer
+    while len(IMPORTS) > MAX_TRACKED_IMPORTS:
+        IMPORTS.popitem(last=False)
+
+    try:
+        records = aiter_records(aiter_lines(request.stream()), format)
+        summary = await import_stream(importer, records)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"商品导入失败: {str(e)}"
+        )
+    
+    return {
+        "code": 200,
+        "message": "导入完成",
+        "data": {"import_id": import_id, **summary}
+    }
+
+@router.get("/import/progress")
+async def import_progress(admin: dict = Depends(require_admin)):
+    """最近导入任务的进度"""
+    return {
+        "code": 200,
+        "message": "success",
+        "data": [
+            {"import_id": import_id, **importer.progress.to_dict()}
+            for import_id, importer in reversed(IMPORTS.items())
+        ]
+    }
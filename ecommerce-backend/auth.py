@@ -1,13 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from typing import Optional
+import logging
+import os
 
-from database import db
-from models import UserLogin, UserRegister, Token, APIResponse
+from database import async_db
+import queries
+from responses import FastJSONResponse, FastJSONRoute
+from models import UserLogin, UserRegister, Token
+from cache import TTLCache
+from passwords import pwd_context, password_hasher, PasswordHasherBusy
+
+logger = logging.getLogger(__name__)
 
 # 自定义业务异常类
 class BusinessException(Exception):
@@ -16,55 +22,60 @@ class BusinessException(Exception):
         self.message = message
         super().__init__(self.message)
 
-# 全局异常处理器
+# 全局异常处理器（直接输出 {code, message, data} 信封，不经 pydantic 模型）
 async def global_exception_handler(request: Request, exc: Exception):
     if isinstance(exc, BusinessException):
-        return JSONResponse(
-            status_code=exc.code,
-            content=APIResponse(
-                code=exc.code,
-                message=exc.message,
-                data=None
-            ).dict()
-        )
+        status_code, message, headers = exc.code, exc.message, None
     elif isinstance(exc, HTTPException):
-        return JSONResponse(
-            status_code=exc.status_code,
-            content=APIResponse(
-                code=exc.status_code,
-                message=exc.detail,
-                data=None
-            ).dict()
-        )
+        status_code, message, headers = exc.status_code, exc.detail, exc.headers
     else:
         # 未知异常
-        return JSONResponse(
-            status_code=500,
-            content=APIResponse(
-                code=500,
-                message=f"服务器内部错误: {str(exc)}",
-                data=None
-            ).dict()
-        )
+        status_code, message, headers = 500, f"服务器内部错误: {str(exc)}", None
+    return FastJSONResponse(
+        status_code=status_code,
+        content={"code": status_code, "message": message, "data": None},
+        headers=headers
+    )
 
-router = APIRouter(prefix="/auth", tags=["认证"])
+router = APIRouter(prefix="/auth", tags=["认证"], route_class=FastJSONRoute)
 
 # JWT配置 - 使用你的.env中的密钥
 SECRET_KEY = "your-super-secret-jwt-key-12345-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+# 已认证用户缓存：按 user_id 缓存用户信息，避免每个请求都查一次 [User]
+user_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL", "60")),
+    name="auth_user"
+)
+
+# 只读接口是否直接信任 token 中签名的 username / user_type，完全不查库
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() in ("1", "true", "yes")
+
+def invalidate_user_cache(user_id):
+    """用户信息变更后清除缓存"""
+    user_cache.invalidate(int(user_id))
+
 def verify_password(plain_password, hashed_password):
-    """验证密码"""
+    """验证密码（同步，会阻塞调用线程；接口中使用 password_hasher）"""
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    """生成密码哈希"""
+    """生成密码哈希（同步，会阻塞调用线程；接口中使用 password_hasher）"""
     return pwd_context.hash(password)
 
+def password_busy_error():
+    """密码哈希进程池排队已满：返回 503，客户端稍后重试"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="服务器繁忙，请稍后重试",
+        headers={"Retry-After": "1"}
+    )
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """创建JWT token"""
     to_encode = data.copy()
@@ -77,8 +88,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    """获取当前用户"""
+def _decode_token(token: str):
+    """校验 JWT 并返回 payload"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -91,31 +102,71 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    return payload, credentials_exception
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    """获取当前用户"""
+    payload, credentials_exception = _decode_token(token)
+    user_id = int(payload["sub"])
     
-    # 从数据库获取用户信息
-    user = db.execute_query(
-        "SELECT user_id, username, email, phone, user_type FROM [User] WHERE user_id = ?",
-        (int(user_id),)
-    )
-    if not user:
-        raise credentials_exception
+    # 先查缓存，未命中再从数据库获取用户信息
+    # 查询期间资料/密码被修改（invalidate_user_cache）时不缓存查到的旧数据
+    user = user_cache.get(user_id)
+    if user is None:
+        since = user_cache.generation()
+        result = await async_db.execute_query(queries.AUTH_USER, (user_id,))
+        if not result:
+            raise credentials_exception
+        user = result[0]
+        user_cache.set(user_id, user, since=since)
     
-    return user[0]
+    return dict(user)
+
+async def get_current_user_claims(token: str = Depends(oauth2_scheme)):
+    """只读接口使用的当前用户
+
+    开启 AUTH_TRUST_TOKEN_CLAIMS 时直接使用 token 中签名的 user_id / username / user_type，
+    不访问数据库（不含 email、phone）；否则与 get_current_user 相同。
+    """
+    if AUTH_TRUST_TOKEN_CLAIMS:
+        payload, _ = _decode_token(token)
+        if "username" in payload and "user_type" in payload:
+            return {
+                "user_id": int(payload["sub"]),
+                "username": payload["username"],
+                "user_type": payload["user_type"]
+            }
+    return await get_current_user(token)
+
+# 注册用户的会员等级；user_type 会被 trg_UpdateUserLevelOnOrderComplete 按累计消费调整，
+# 不代表管理员身份，管理员只记录在 dbo.AdminUser 中（见 database/admin.sql）
+NORMAL_USER_TYPE = 0
+
+async def require_admin(current_user: dict = Depends(get_current_user)):
+    """管理接口使用：当前用户必须在 dbo.AdminUser 中（每次查库，不使用用户缓存）"""
+    if await async_db.fetch_one(queries.AUTH_ADMIN, (current_user["user_id"],)) is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要管理员权限"
+        )
+    return current_user
 
 @router.post("/login", response_model=Token)
 async def login(user_data: UserLogin):
-    """用户登录 - 针对明文密码版本"""
+    """用户登录
+
+    密码为 bcrypt 哈希时在进程池中校验；仍为明文的旧数据校验通过后改写为哈希。
+    """
     try:
-        print(f"🔐 收到登录请求: 用户名={user_data.username}")
+        logger.debug("收到登录请求", extra={"username": user_data.username})
         
         # 1. 查询用户（兼容用户名或邮箱登录）
-        user_result = db.execute_query(
-            "SELECT user_id, username, password, user_type FROM [User] WHERE username = ? OR email = ?",
-            (user_data.username, user_data.username)
+        user_result = await async_db.execute_query(
+            queries.AUTH_LOGIN, (user_data.username, user_data.username)
         )
         
         if not user_result:
-            print(f"❌ 用户不存在: {user_data.username}")
+            logger.info("登录失败：用户不存在", extra={"username": user_data.username})
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="用户名或密码错误"
@@ -124,26 +175,36 @@ async def login(user_data: UserLogin):
         user = user_result[0]
         stored_password = user["password"]
         
-        print(f"📋 找到用户: ID={user['user_id']}, 用户名={user['username']}")
-        print(f"🔑 数据库密码: {stored_password}, 输入密码: {user_data.password}")
-        
-        # 2. 密码验证（针对明文密码 - 数据库中是admin123这样的明文）
-        if user_data.password != stored_password:
-            print("❌ 密码不匹配")
+        # 2. 密码验证
+        try:
+            valid, new_hash = await password_hasher.check(user_data.password, stored_password)
+        except PasswordHasherBusy:
+            logger.warning("登录请求过多，密码校验排队已满", extra={"user_id": user["user_id"]})
+            raise password_busy_error()
+        if not valid:
+            logger.info("登录失败：密码不匹配", extra={"user_id": user["user_id"]})
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="用户名或密码错误"
             )
         
-        print("✅ 密码验证成功")
-        
-        # 3. 更新最后登录时间
-        # test.sql 中无 last_login_time 列，移除更新
+        # 3. 明文旧密码（或轮数已调整的旧哈希）改写为新哈希；期间密码已被修改则不覆盖
+        if new_hash:
+            upgraded = await async_db.execute_update(
+                "UPDATE [User] SET password = ? WHERE user_id = ? AND password = ?",
+                (new_hash, user["user_id"], stored_password)
+            )
+            if upgraded:
+                logger.info("密码已升级为哈希存储", extra={"user_id": user["user_id"]})
         
         # 4. 创建token
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
-            data={"sub": str(user["user_id"])},
+            data={
+                "sub": str(user["user_id"]),
+                "username": user["username"],
+                "user_type": user["user_type"]
+            },
             expires_delta=access_token_expires
         )
         
@@ -155,13 +216,13 @@ async def login(user_data: UserLogin):
             "user_type": user["user_type"]
         }
         
-        print(f"✅ 登录成功，返回token: {access_token[:20]}...")
+        logger.info("登录成功", extra={"user_id": user["user_id"]})
         return response_data
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"💥 登录异常: {str(e)}")
+        logger.exception("登录异常")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"登录失败: {str(e)}"
@@ -169,30 +230,33 @@ async def login(user_data: UserLogin):
 
 @router.post("/register")
 async def register(user_data: UserRegister):
-    """用户注册"""
+    """用户注册
+
+    请求中的 user_type 仅为兼容旧前端而保留，不会被采用：自助注册的一律是普通用户。
+    """
     try:
-        print(f"📝 注册新用户: {user_data.username}")
+        logger.debug("注册新用户", extra={"username": user_data.username})
         
-        # 直接使用明文密码，不进行哈希
-        plain_password = user_data.password
+        try:
+            password_hash = await password_hasher.hash(user_data.password)
+        except PasswordHasherBusy:
+            raise password_busy_error()
         
         # 调用存储过程
-        result = db.execute_proc("sp_RegisterUser", [
+        result = await async_db.execute_proc("sp_RegisterUser", [
             user_data.username,
-            plain_password,  # 传递明文密码
+            password_hash,
             user_data.phone,
             user_data.email,
-            user_data.user_type,
+            NORMAL_USER_TYPE,  # 不信任客户端传入的 user_type
             0  # @new_user_id (output placeholder)
         ])
         
-        print(f"🔍 存储过程返回结果: {result}")
-        
         # 方法1：检查是否有返回结果
         if result and len(result) > 0:
             new_user = result[0]
             new_user_id = new_user.get('new_user_id')
-            print(f"✅ 注册成功，用户ID: {new_user_id}")
+            logger.info("注册成功", extra={"user_id": new_user_id})
             return {
                 "code": 200,
                 "message": "注册成功",
@@ -203,14 +267,14 @@ async def register(user_data: UserRegister):
             }
         
        
-        user_check = db.execute_query(
+        user_check = await async_db.execute_query(
             "SELECT user_id FROM [User] WHERE username = ?",
             (user_data.username,)
         )
         
         if user_check:
             user_id = user_check[0]['user_id']
-            print(f"✅ 用户已创建成功，用户ID: {user_id}")
+            logger.info("注册成功", extra={"user_id": user_id})
             return {
                 "code": 200,
                 "message": "注册成功",
@@ -221,14 +285,16 @@ async def register(user_data: UserRegister):
             }
         
         # 如果两种方法都失败
-        print("❌ 注册失败")
+        logger.error("注册失败：存储过程未返回用户", extra={"username": user_data.username})
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="注册失败，请稍后重试"
         )
             
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"💥 注册异常: {str(e)}")
+        logger.warning("注册异常: %s", e, extra={"username": user_data.username})
         
         # 检查错误类型，返回对应的错误信息
         error_msg = str(e)
@@ -252,17 +318,18 @@ async def update_profile(
     """更新用户信息"""
     try:
         user_id = current_user["user_id"]
-        print(f"📝 更新用户信息: ID={user_id}, 数据={user_data}")
+        logger.debug("更新用户信息", extra={"user_id": user_id, "fields": sorted(user_data)})
         
         # 调用存储过程 sp_UpdateUserInfo
-        result = db.execute_proc("sp_UpdateUserInfo", [
+        result = await async_db.execute_proc("sp_UpdateUserInfo", [
             user_id,
             user_data.get("username"),  # 可以为None
             user_data.get("phone"),     # 可以为None
             user_data.get("email")      # 可以为None
         ])
         
-        print(f"✅ 用户信息更新成功")
+        invalidate_user_cache(user_id)
+        logger.info("用户信息更新成功", extra={"user_id": user_id})
         return {
             "code": 200,
             "message": "用户信息更新成功",
@@ -273,7 +340,7 @@ async def update_profile(
         }
             
     except Exception as e:
-        print(f"💥 更新用户信息异常: {str(e)}")
+        logger.exception("更新用户信息异常")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"更新失败: {str(e)}"
@@ -282,7 +349,6 @@ async def update_profile(
 @router.get("/me")
 async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     """获取当前用户信息"""
-    print(f"👤 获取用户信息: ID={current_user['user_id']}")
     return {
         "code": 200,
         "message": "success",
@@ -306,20 +372,26 @@ async def change_password(
                 detail="当前密码和新密码不能为空"
             )
         
-        print(f"🔒 修改用户密码: ID={user_id}")
+        logger.debug("修改用户密码", extra={"user_id": user_id})
         
-        # 验证当前密码
-        user = db.fetch_one("SELECT password FROM [User] WHERE user_id = ?", [user_id])
-        if not user or user["password"] != current_password:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="当前密码错误"
-            )
+        # 验证当前密码（兼容明文旧数据），新密码哈希后保存
+        user = await async_db.fetch_one("SELECT password FROM [User] WHERE user_id = ?", [user_id])
+        try:
+            valid = user is not None and (await password_hasher.check(current_password, user["password"], upgrade=False))[0]
+            if not valid:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="当前密码错误"
+                )
+            password_hash = await password_hasher.hash(new_password)
+        except PasswordHasherBusy:
+            raise password_busy_error()
         
         # 更新密码
-        db.execute_update("UPDATE [User] SET password = ? WHERE user_id = ?", [new_password, user_id])
+        await async_db.execute_update("UPDATE [User] SET password = ? WHERE user_id = ?", [password_hash, user_id])
+        invalidate_user_cache(user_id)
         
-        print(f"✅ 密码修改成功: ID={user_id}")
+        logger.info("密码修改成功", extra={"user_id": user_id})
         return {
             "code": 200,
             "message": "密码修改成功"
@@ -328,12 +400,24 @@ async def change_password(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"💥 修改密码异常: {str(e)}")
+        logger.exception("修改密码异常")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"修改密码失败: {str(e)}"
         )
 
+@router.get("/cache-stats")
+async def get_cache_stats(admin: dict = Depends(require_admin)):
+    """已认证用户缓存的命中统计（仅管理员）"""
+    return {
+        "code": 200,
+        "message": "success",
+        "data": {
+            **user_cache.stats(),
+            "trust_token_claims": AUTH_TRUST_TOKEN_CLAIMS
+        }
+    }
+
 @router.get("/test")
 async def test_auth():
     """测试认证模块是否正常工作"""
@@ -0,0 +1,139 @@
+# bench_checkout.py
+# 并发下单测试：1000 个用户同时结算，每次结算带 Idempotency-Key，并模拟客户端超时后用同一个键重复提交；
+# 遇到 409（同键处理中）/ 503（死锁重试用尽）/ 网络错误时客户端按退避 + 随机抖动重试。
+# 结束后核对：每个用户只多出一个订单、同一个键的所有响应订单号一致，并读取 /metrics 中服务端的死锁重试次数。
+# 需先执行 database/idempotency.sql；测试用户（默认 bench_ck_0 ~ bench_ck_999）不存在时自动注册，
+# 每个用户的购物车里放 1 件 --product-id 指定的商品，库存需不少于结算次数。
+# 用法：
+#   python bench_checkout.py --url http://localhost:8000
+#   python bench_checkout.py --url http://localhost:8000 --checkouts 200 --copies 3 --product-id 5
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+async def prepare_user(client, args, index, limit):
+    '''注册（已存在则跳过）、登录、取收货地址、放一件商品到购物车，返回 (token, address_id)'''
+    username = f"{args.prefix}_{index}"
+    async with limit:
+        await client.post("/api/auth/register", json={
+            "username": username, "password": args.password,
+            "phone": f"139{index:08d}", "email": f"{username}@bench.local",
+        })
+        response = await client.post("/api/auth/login", json={"username": username, "password": args.password})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        addresses = (await client.get("/api/user/addresses", headers=headers)).json()["data"]
+        # 上一次测试残留的购物车先清空，保证每个用户恰好一件商品
+        await client.delete("/api/cart/", headers=headers)
+        response = await client.post("/api/cart/add", headers=headers,
+                                     json={"product_id": args.product_id, "quantity": 1})
+        response.raise_for_status()
+        total = (await client.get("/api/orders/?page_size=1&include_items=false", headers=headers)).json()["data"]["total"]
+        return headers, addresses[0]["address_id"], total
+
+
+async def submit(client, args, headers, body, key, stats):
+    '''带同一个幂等键提交一次结算，可重试的结果退避后重试，返回最终响应'''
+    headers = {**headers, "Idempotency-Key": key}
+    for attempt in range(1, args.attempts + 1):
+        try:
+            response = await client.post("/api/orders/", headers=headers, json=body)
+        except Exception as e:
+            stats["client_errors"][type(e).__name__] += 1
+            response = None
+        if response is not None and response.status_code not in (409, 503):
+            return response
+        if attempt == args.attempts:
+            return response
+        stats["client_retries"] += 1
+        await asyncio.sleep(random.uniform(0, min(1.0, 0.05 * 2 ** (attempt - 1))))
+
+
+async def checkout(client, args, user, stats):
+    headers, address_id, _ = user
+    body = {"address_id": address_id, "cart_ids": []}
+    key = str(uuid.uuid4())
+    started = time.perf_counter()
+    # 同一个键并发提交 copies 次（相当于客户端超时后立刻重发）
+    responses = await asyncio.gather(*(submit(client, args, headers, body, key, stats) for _ in range(args.copies)))
+    stats["latencies"].append(time.perf_counter() - started)
+
+    order_ids = set()
+    for response in responses:
+        if response is None:
+            stats["status"]["no_response"] += 1
+            continue
+        stats["status"][response.status_code] += 1
+        if response.headers.get("Idempotent-Replayed") == "true":
+            stats["replayed"] += 1
+        if response.status_code == 200:
+            order_ids.add(response.json()["data"]["order_id"])
+    if len(order_ids) > 1:
+        stats["key_mismatch"] += 1
+    return order_ids
+
+
+async def run(args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.checkouts * args.copies)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        print(f"准备 {args.checkouts} 个用户 ...")
+        limit = asyncio.Semaphore(args.setup_concurrency)
+        users = await asyncio.gather(*(prepare_user(client, args, i, limit) for i in range(args.checkouts)))
+
+        stats = {"status": Counter(), "client_errors": Counter(), "client_retries": 0,
+                 "replayed": 0, "key_mismatch": 0, "latencies": []}
+        print(f"并发结算：{args.checkouts} 个用户 × 每个键提交 {args.copies} 次")
+        started = time.perf_counter()
+        await asyncio.gather(*(checkout(client, args, user, stats) for user in users))
+        elapsed = time.perf_counter() - started
+
+        # 核对：每个用户的订单数只增加 1
+        created = Counter()
+        for headers, _, before in users:
+            after = (await client.get("/api/orders/?page_size=1&include_items=false", headers=headers)).json()["data"]["total"]
+            created[after - before] += 1
+
+        metrics_text = (await client.get("/metrics")).text
+
+    latencies = stats["latencies"]
+    print(f"用时 {elapsed:.2f}s（{args.checkouts / elapsed:.1f} 次结算/秒），"
+          f"结算耗时 p50 {percentile(latencies, 0.5) * 1000:.0f}ms / p99 {percentile(latencies, 0.99) * 1000:.0f}ms")
+    print(f"响应状态: {dict(stats['status'])}，其中重放 {stats['replayed']} 次")
+    print(f"客户端重试 {stats['client_retries']} 次，网络错误 {dict(stats['client_errors'])}")
+    print(f"每个用户新增订单数分布: {dict(created)}（应全部为 1）")
+    print(f"同一个键返回不同订单号: {stats['key_mismatch']} 次（应为 0）")
+    for line in metrics_text.splitlines():
+        if line.startswith("db_retries_total"):
+            print(f"服务端 {line}")
+    if set(created) != {1} or stats["key_mismatch"]:
+        raise SystemExit("核对失败：出现重复下单或漏单")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发下单幂等测试")
+    parser.add_argument("--url", required=True, help="运行中的服务（如 http://localhost:8000）")
+    parser.add_argument("--checkouts", type=int, default=1000)
+    parser.add_argument("--copies", type=int, default=2, help="同一个幂等键并发提交的次数")
+    parser.add_argument("--attempts", type=int, default=5, help="客户端对 409 / 503 / 网络错误的最多尝试次数")
+    parser.add_argument("--product-id", type=int, default=1)
+    parser.add_argument("--prefix", default="bench_ck")
+    parser.add_argument("--password", default="bench_passw0rd")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--setup-concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
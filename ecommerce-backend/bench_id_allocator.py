@@ -0,0 +1,77 @@
+# bench_id_allocator.py
+# ID 号段分配器并发测试：多线程插入 10k 个地址，校验主键零冲突
+# 用法（需先执行 database/id_allocator.sql）：
+#   python bench_id_allocator.py --user-id 1
+#   python bench_id_allocator.py --user-id 1 --count 10000 --threads 32 --keep
+import argparse
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from database import db
+from id_allocator import IdAllocator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ID 号段分配器并发测试")
+    parser.add_argument("--user-id", type=int, required=True, help="地址归属的用户ID（需已存在）")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--block-size", type=int, default=100)
+    parser.add_argument("--keep", action="store_true", help="测试结束后保留插入的地址")
+    args = parser.parse_args()
+
+    # 每个“worker”各自一个分配器，模拟多进程部署下的号段隔离
+    allocators = [IdAllocator("dbo.seq_Address", block_size=args.block_size)
+                  for _ in range(4)]
+    ids = []
+    ids_lock = threading.Lock()
+    errors = []
+
+    sql = """
+    INSERT INTO Address
+    (address_id, user_id, receiver_name, receiver_phone, detail_address, postal_code, is_default)
+    VALUES (?, ?, ?, ?, ?, ?, 0)
+    """
+
+    def create(i):
+        allocator = allocators[i % len(allocators)]
+        address_id = allocator.next_id()
+        try:
+            db.execute_update(sql, (address_id, args.user_id, f"压测{i}",
+                                    "13800000000", "并发测试地址", None))
+        except Exception as e:
+            errors.append((address_id, str(e)))
+            return
+        with ids_lock:
+            ids.append(address_id)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(create, range(args.count)))
+    elapsed = time.perf_counter() - start
+
+    duplicates = [k for k, v in Counter(ids).items() if v > 1]
+    reservations = sum(a.reservations for a in allocators)
+    print(f"插入 {len(ids)}/{args.count} 个地址，用时 {elapsed:.2f}s "
+          f"({len(ids) / elapsed:.0f} 条/秒)，线程数 {args.threads}")
+    print(f"号段预留次数: {reservations}（每段 {args.block_size} 个）")
+    print(f"重复ID: {len(duplicates)}，插入失败: {len(errors)}")
+    for address_id, message in errors[:5]:
+        print(f"  - {address_id}: {message}")
+
+    if not args.keep and ids:
+        for i in range(0, len(ids), 1000):
+            chunk = ids[i:i + 1000]
+            placeholders = ",".join("?" * len(chunk))
+            db.execute_update(f"DELETE FROM Address WHERE address_id IN ({placeholders})", chunk)
+        print("已清理测试地址")
+
+    db.close()
+    if duplicates or errors:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# bench_json.py
+# 响应序列化测试：100 个商品的 /api/products/ 页、50 个订单（含明细）的 /api/orders/ 页，
+# 对比 jsonable_encoder + JSONResponse（改造前）与 FastJSONResponse（orjson，跳过 jsonable_encoder）
+# 用法：
+#   python bench_json.py
+#   python bench_json.py --iterations 5000 --items-per-order 5
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from responses import FastJSONResponse, orjson
+
+
+def product_page(count=100):
+    start = datetime(2025, 1, 1, 9, 30)
+    items = [{
+        "id": i,
+        "name": f"商品 {i} 高端无线蓝牙耳机",
+        "description": "降噪 / 长续航 / 快充",
+        "price": Decimal(f"{199 + i}.90"),
+        "stock": 100 + i,
+        "image": f"/images/products/{i}.jpg",
+        "category_name": "数码配件",
+        "category_id": i % 12 + 1,
+        "sold_quantity": i * 7,
+        "create_time": start + timedelta(minutes=i),
+        "original_price": Decimal(f"{259 + i}.00"),
+        "discount_rate": Decimal("0.85"),
+    } for i in range(1, count + 1)]
+    return {"code": 200, "message": "success",
+            "data": {"items": items, "total": 5000, "page": 1, "page_size": count}}
+
+
+def order_page(count=50, items_per_order=3):
+    start = datetime(2025, 3, 1, 12, 0, 0, 123000)
+    orders = []
+    for i in range(1, count + 1):
+        items = [{
+            "item_id": i * 10 + j,
+            "order_id": i,
+            "product_id": j + 1,
+            "quantity": j + 1,
+            "unit_price": Decimal("59.90"),
+            "subtotal": Decimal("59.90") * (j + 1),
+            "product_image": f"/images/products/{j + 1}.jpg",
+            "product_name": f"商品 {j + 1}",
+        } for j in range(items_per_order)]
+        orders.append({
+            "order_id": i,
+            "user_id": 7,
+            "address_id": 3,
+            "total_amount": Decimal("359.40"),
+            "order_status": i % 4,
+            "create_time": start - timedelta(hours=i),
+            "pay_time": start - timedelta(hours=i) + timedelta(minutes=2) if i % 4 else None,
+            "ship_time": None,
+            "receiver_name": "张三",
+            "receiver_phone": "13800000000",
+            "detail_address": "北京市海淀区某某路 100 号",
+            "order_no": f"ORD{i:08d}",
+            "shipping_fee": 0.0,
+            "final_amount": Decimal("359.40"),
+            "items": items,
+            "item_count": len(items),
+        })
+    return {"code": 200, "message": "success",
+            "data": {"items": orders, "total": 500, "page": 1, "page_size": count}}
+
+
+def encoder_path(content):
+    # 改造前：FastAPI 对返回值先做 jsonable_encoder，再由 JSONResponse 调 json.dumps
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def fast_path(content):
+    return FastJSONResponse(content).body
+
+
+def bench(name, func, content, iterations):
+    func(content)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        body = func(content)
+    elapsed = time.perf_counter() - started
+    return elapsed / iterations, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应序列化测试")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--items-per-order", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"序列化器: {'orjson ' + orjson.__version__ if orjson else 'json（未安装 orjson）'}")
+    pages = {
+        "/api/products/ (100 个商品)": product_page(),
+        f"/api/orders/ (50 个订单 × {args.items_per_order} 明细)": order_page(items_per_order=args.items_per_order),
+    }
+    for page, content in pages.items():
+        # 两种方式输出的 JSON 解析后应完全一致
+        assert json.loads(encoder_path(content)) == json.loads(fast_path(content)), page
+        old, old_size = bench("jsonable_encoder", encoder_path, content, args.iterations)
+        new, new_size = bench("FastJSONResponse", fast_path, content, args.iterations)
+        print(f"{page}")
+        print(f"  jsonable_encoder + JSONResponse: {old * 1e6:8.1f} µs/次，{old_size} 字节")
+        print(f"  FastJSONResponse:                {new * 1e6:8.1f} µs/次，{new_size} 字节（{old / new:.1f}x）")
+
+
+if __name__ == "__main__":
+    main()
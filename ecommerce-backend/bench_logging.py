@@ -0,0 +1,83 @@
+# bench_logging.py
+# 日志开销测试：多线程并发写日志，对比直接 print 与 QueueHandler + 后台线程写出时调用方的耗时
+# 用法：
+#   python bench_logging.py                          # 8 线程 × 20000 条，输出写到 /dev/null
+#   python bench_logging.py --threads 32 --records 5000 --output app.log
+#   LOG_DEBUG_SAMPLE_RATE=0.01 python bench_logging.py --level debug   # DEBUG 采样
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+import logging_setup
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_threads(threads, records, emit):
+    '''每个线程写 records 条，返回每次调用的耗时（秒）'''
+    timings = [[] for _ in range(threads)]
+
+    def worker(index):
+        samples = timings[index]
+        for i in range(records):
+            started = time.perf_counter()
+            emit(index, i)
+            samples.append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return time.perf_counter() - started, [x for samples in timings for x in samples]
+
+
+def report(name, elapsed, timings):
+    print(f"{name}: {len(timings)} 条，用时 {elapsed:.2f}s（{len(timings) / elapsed:.0f} 条/秒），"
+          f"单次 p50 {percentile(timings, 0.5) * 1e6:.1f}µs / p99 {percentile(timings, 0.99) * 1e6:.1f}µs "
+          f"/ 最大 {max(timings) * 1e3:.2f}ms", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志开销测试")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--level", choices=["info", "debug"], default="info")
+    parser.add_argument("--output", default=os.devnull, help="日志输出位置（替换 stdout）")
+    args = parser.parse_args()
+
+    sys.stdout = open(args.output, "w", encoding="utf-8")
+
+    def emit_print(thread, i):
+        print(f"📝 添加地址，用户ID: {thread}, 序号: {i}", flush=True)
+
+    elapsed, timings = run_threads(args.threads, args.records, emit_print)
+    report("print", elapsed, timings)
+
+    logging_setup.setup_logging()
+    logger = logging.getLogger("bench")
+    logger.setLevel(logging.DEBUG)
+    log = logger.debug if args.level == "debug" else logger.info
+
+    def emit_log(thread, i):
+        log("添加地址", extra={"user_id": thread, "seq": i})
+
+    elapsed, timings = run_threads(args.threads, args.records, emit_log)
+    report(f"logging ({args.level}, 调用方)", elapsed, timings)
+
+    started = time.perf_counter()
+    logging_setup.shutdown_logging()
+    print(f"  后台线程写完剩余日志用时 {time.perf_counter() - started:.2f}s，"
+          f"丢弃 {sum(logging_setup.log_dropped._values.values())} 条，"
+          f"采样丢弃 {sum(logging_setup.log_sampled_out._values.values())} 条", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# bench_pagination.py
+# 分页基准：对比 OFFSET 分页与游标（seek）分页在第 1 页和深页（默认第 5000 页）的延迟
+# 需要连接真实数据库，商品/订单数量不足时自动缩小深页页码
+# 用法：python bench_pagination.py [深页页码] [每页条数] [用户ID]
+import sys
+import time
+
+from database import db
+
+REPEAT = 5
+
+
+def timed(sql, params):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        db.execute_query(sql, params)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_products(deep_page, page_size):
+    total = db.execute_query("SELECT COUNT(*) AS total FROM Product WHERE product_status = 1")[0]["total"]
+    deep_page = max(1, min(deep_page, total // page_size))
+
+    offset_sql = """
+        SELECT p.product_id, p.product_name, p.price
+        FROM Product p
+        WHERE p.product_status = 1
+        ORDER BY p.product_id DESC
+        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+    """
+    seek_sql = """
+        SELECT TOP (?) p.product_id, p.product_name, p.price
+        FROM Product p
+        WHERE p.product_status = 1 AND p.product_id < ?
+        ORDER BY p.product_id DESC
+    """
+
+    def seek_key(page):
+        # 游标模式下上一页最后一条的 product_id（不计时）
+        if page == 1:
+            return 2 ** 31 - 1
+        row = db.fetch_one(
+            "SELECT product_id FROM Product WHERE product_status = 1 "
+            "ORDER BY product_id DESC OFFSET ? ROWS FETCH NEXT 1 ROWS ONLY",
+            ((page - 1) * page_size - 1,)
+        )
+        return row["product_id"]
+
+    print(f"商品（共 {total} 条，每页 {page_size}）")
+    for page in (1, deep_page):
+        offset_ms = timed(offset_sql, ((page - 1) * page_size, page_size))
+        seek_ms = timed(seek_sql, (page_size, seek_key(page)))
+        print(f"  第 {page:>5} 页  OFFSET: {offset_ms:8.2f} ms  游标: {seek_ms:8.2f} ms")
+
+
+def bench_orders(deep_page, page_size, user_id):
+    total = db.execute_query("SELECT COUNT(*) AS total FROM [Order] WHERE user_id = ?", (user_id,))[0]["total"]
+    deep_page = max(1, min(deep_page, total // page_size))
+
+    offset_sql = """
+        SELECT o.order_id, o.create_time, o.total_amount
+        FROM [Order] o
+        WHERE o.user_id = ?
+        ORDER BY o.create_time DESC
+        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+    """
+    seek_sql = """
+        SELECT TOP (?) o.order_id, o.create_time, o.total_amount
+        FROM [Order] o
+        WHERE o.user_id = ?
+          AND (o.create_time < CAST(? AS DATETIME) OR (o.create_time = CAST(? AS DATETIME) AND o.order_id < ?))
+        ORDER BY o.create_time DESC, o.order_id DESC
+    """
+
+    def seek_key(page):
+        if page == 1:
+            return "9999-12-31", 2 ** 31 - 1
+        row = db.fetch_one(
+            "SELECT create_time, order_id FROM [Order] WHERE user_id = ? "
+            "ORDER BY create_time DESC, order_id DESC OFFSET ? ROWS FETCH NEXT 1 ROWS ONLY",
+            (user_id, (page - 1) * page_size - 1)
+        )
+        return row["create_time"], row["order_id"]
+
+    print(f"订单（用户 {user_id} 共 {total} 条，每页 {page_size}）")
+    for page in (1, deep_page):
+        offset_ms = timed(offset_sql, (user_id, (page - 1) * page_size, page_size))
+        last_time, last_id = seek_key(page)
+        seek_ms = timed(seek_sql, (page_size, user_id, last_time, last_time, last_id))
+        print(f"  第 {page:>5} 页  OFFSET: {offset_ms:8.2f} ms  游标: {seek_ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    deep_page = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    user_id = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    try:
+        bench_products(deep_page, page_size)
+        bench_orders(deep_page, page_size, user_id)
+    finally:
+        db.close()
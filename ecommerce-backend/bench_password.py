@@ -0,0 +1,122 @@
+# bench_password.py
+# 登录密码校验测试：500 个并发登录，对比在事件循环中直接 bcrypt 校验与进程池校验的吞吐和事件循环延迟
+# 用法：
+#   python bench_password.py                           # 离线：500 并发，bcrypt 12 轮，inline 与 pool 各跑一次
+#   python bench_password.py --logins 200 --rounds 10 --mode pool
+#   python bench_password.py --url http://localhost:8000 --username alice --password passw0rd   # 压测运行中的服务
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+async def measure_loop_lag(stop, interval=0.01):
+    '''每 interval 秒唤醒一次，记录实际唤醒比预期晚了多少（即事件循环被阻塞的时间）'''
+    lags = []
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - expected))
+    return lags
+
+
+async def run_logins(count, login):
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    await asyncio.sleep(0.05)
+
+    latencies = []
+    outcomes = Counter()
+
+    async def one():
+        started = time.perf_counter()
+        outcomes[await login()] += 1
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(count)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    lags = await lag_task
+    return elapsed, latencies, outcomes, lags
+
+
+def report(name, count, elapsed, latencies, outcomes, lags):
+    print(f"{name}: {count} 次登录，用时 {elapsed:.2f}s（{count / elapsed:.1f} 次/秒），结果 {dict(outcomes)}")
+    print(f"  登录耗时 p50 {percentile(latencies, 0.5) * 1000:.0f}ms / p99 {percentile(latencies, 0.99) * 1000:.0f}ms")
+    if lags:
+        print(f"  事件循环延迟 p50 {percentile(lags, 0.5) * 1000:.1f}ms / p99 {percentile(lags, 0.99) * 1000:.1f}ms "
+              f"/ 最大 {max(lags) * 1000:.0f}ms")
+
+
+async def run_offline(args):
+    from passwords import pwd_context, password_hasher, PasswordHasherBusy
+
+    password = "passw0rd"
+    stored = pwd_context.hash(password)
+
+    if args.mode in ("inline", "both"):
+        async def inline_login():
+            # 改造前的写法：在 async 接口中直接调用 bcrypt
+            return "ok" if pwd_context.verify(password, stored) else "401"
+
+        report("inline", args.logins, *await run_logins(args.logins, inline_login))
+
+    if args.mode in ("pool", "both"):
+        await password_hasher.start()
+
+        async def pool_login():
+            try:
+                valid, _ = await password_hasher.check(password, stored)
+            except PasswordHasherBusy:
+                return "503"
+            return "ok" if valid else "401"
+
+        print(f"进程池: {password_hasher.max_workers} 个进程，排队上限 {password_hasher.max_pending}")
+        report("pool", args.logins, *await run_logins(args.logins, pool_login))
+        password_hasher.shutdown()
+
+
+async def run_live(args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.logins)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        async def http_login():
+            try:
+                response = await client.post("/api/auth/login",
+                                             json={"username": args.username, "password": args.password})
+            except httpx.HTTPError as e:
+                return type(e).__name__
+            return str(response.status_code)
+
+        report(f"live {args.url}", args.logins, *await run_logins(args.logins, http_login))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登录密码校验并发测试")
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=12, help="离线模式的 bcrypt 轮数")
+    parser.add_argument("--mode", choices=["inline", "pool", "both"], default="both")
+    parser.add_argument("--url", help="压测运行中的服务（如 http://localhost:8000）")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    if args.url:
+        asyncio.run(run_live(args))
+    else:
+        # 工作进程继承环境变量，须在导入 passwords 之前设置
+        os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+        asyncio.run(run_offline(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# bench_pricing.py
+# 定价模块微基准：10 万商品批量定价，与旧的 float 逐个计算对比耗时，并与 Decimal 参考实现逐条核对
+# 用法：python bench_pricing.py [商品数]
+import random
+import sys
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+import pricing
+
+
+def make_data(count, seed=42):
+    rng = random.Random(seed)
+    promotions = []
+    for promotion_id in range(1, 201):
+        if promotion_id % 2:
+            value = Decimal(rng.choice(["0.95", "0.90", "0.85", "0.80", "88", "75"]))
+            promotions.append({"promotion_id": promotion_id, "discount_type": 1, "discount_value": value})
+        else:
+            value = Decimal(rng.randint(1, 500)).quantize(Decimal("0.01"))
+            promotions.append({"promotion_id": promotion_id, "discount_type": 2, "discount_value": value})
+
+    items = []
+    promotions_by_product = {}
+    for product_id in range(1, count + 1):
+        price = Decimal(rng.randint(100, 1000000)).scaleb(-2)
+        items.append((product_id, price))
+        if rng.random() < 0.3:
+            promotions_by_product[product_id] = rng.sample(promotions, rng.randint(1, 3))
+    return items, promotions_by_product
+
+
+def reference_price(base_price, promotions):
+    '''逐个 Decimal 计算的参考实现'''
+    best = base_price
+    for promotion in promotions:
+        value = promotion["discount_value"]
+        if promotion["discount_type"] == 1:
+            rate = value / 100 if value > 1 else value
+            price = (base_price * rate).quantize(pricing.CENT, rounding=ROUND_HALF_UP)
+        else:
+            price = base_price - value
+        price = max(price, pricing.CENT)
+        if price < best:
+            best = price
+    return best
+
+
+def legacy_price(base_price, promotions):
+    '''改造前接口里的 float 逐个计算（含标签格式化），仅作耗时对照'''
+    original_price = float(base_price)
+    best = original_price
+    best_promotion = None
+    for promotion in promotions:
+        if promotion["discount_type"] == 1:
+            current = max(0.01, round(original_price * (float(promotion["discount_value"]) / 100), 2))
+        elif promotion["discount_type"] == 2:
+            current = max(0.01, round(original_price - float(promotion["discount_value"]), 2))
+        else:
+            current = original_price
+        if current < best:
+            best = current
+            best_promotion = promotion
+    tag = None
+    if best_promotion:
+        if best_promotion["discount_type"] == 1:
+            tag = f"{int(best_promotion['discount_value'])}折"
+        else:
+            tag = f"立减¥{best_promotion['discount_value']}"
+    return best, best_promotion, tag
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    items, promotions_by_product = make_data(count)
+
+    # 预热
+    pricing.price_batch(items[:1000], promotions_by_product.get)
+
+    start = time.perf_counter()
+    priced = pricing.price_batch(items, promotions_by_product.get)
+    batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for product_id, price in items:
+        legacy_price(price, promotions_by_product.get(product_id, ()))
+    legacy_seconds = time.perf_counter() - start
+
+    expected = [reference_price(price, promotions_by_product.get(product_id, ()))
+                for product_id, price in items]
+
+    mismatches = sum(1 for item, price in zip(priced, expected) if item.price != price)
+
+    print(f"商品数: {count}，有促销: {len(promotions_by_product)}")
+    print(f"price_batch:   {batch_seconds * 1000:.1f} ms ({count / batch_seconds:,.0f} 件/秒)")
+    print(f"旧 float 逐个: {legacy_seconds * 1000:.1f} ms ({count / legacy_seconds:,.0f} 件/秒)")
+    print(f"结果不一致: {mismatches}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# bench_product_import.py
+# 商品批量导入基准：逐行 sp_AddProduct vs 分批 fast_executemany + MERGE
+# 用法：
+#   python bench_product_import.py                        # 离线：生成 50 万行 CSV，测解析 + 校验吞吐量（不连数据库）
+#   python bench_product_import.py --live                 # 在线：导入 50 万行，并用 sp_AddProduct 逐行插入 2000 行作对比
+#   python bench_product_import.py --live --count 100000 --baseline 0
+#   python bench_product_import.py --live --cleanup       # 删除导入的模拟商品（image 标记为 bench_import）
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import product_import
+
+MARKER = "bench_import"
+KINDS = ["手机", "笔记本电脑", "平板", "耳机", "电视", "冰箱", "空调", "显示器", "键盘", "鼠标"]
+
+
+def write_catalog(path, count, category_ids, seed=42):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("category_id,product_name,description,price,stock_quantity,image\n")
+        for i in range(count):
+            kind = rng.choice(KINDS)
+            f.write(f'{rng.choice(category_ids)},"{kind} 型号{i}",批量导入{kind},'
+                    f"{rng.randint(100, 999999) / 100:.2f},{rng.randint(0, 500)},{MARKER}\n")
+
+
+def run_offline(path, count):
+    write_catalog(path, count, [1, 2, 3])
+    started = time.perf_counter()
+    valid = 0
+    with open(path, encoding="utf-8", newline="") as f:
+        for _, raw in product_import.iter_records(f):
+            product_import.clean_record(raw)
+            valid += 1
+    elapsed = time.perf_counter() - started
+    print(f"解析 + 校验 {valid} 行，用时 {elapsed:.1f}s，{valid / elapsed:.0f} 行/秒")
+
+
+def run_baseline(db, count, category_id):
+    started = time.perf_counter()
+    for i in range(count):
+        db.execute_query("""
+            SET NOCOUNT ON;
+            DECLARE @id INT;
+            EXEC sp_AddProduct @category_id = ?, @product_name = ?, @price = 9.90,
+                @stock_quantity = 10, @image = ?, @new_product_id = @id OUTPUT;
+            SELECT @id AS product_id;
+        """, (category_id, f"逐行导入{i}", MARKER))
+    elapsed = time.perf_counter() - started
+    print(f"sp_AddProduct 逐行: {count} 行，用时 {elapsed:.1f}s，{count / elapsed:.0f} 行/秒")
+    return count / elapsed
+
+
+def run_live(path, args):
+    from database import db
+
+    if args.cleanup:
+        deleted = db.execute_update("DELETE FROM Product WHERE image = ?", (MARKER,))
+        print(f"已删除 {deleted} 个模拟商品")
+        db.close()
+        return
+
+    category_ids = [row["category_id"] for row in db.execute_query("SELECT category_id FROM Category")]
+    if not category_ids:
+        print("Category 表为空，无法导入")
+        return
+    write_catalog(path, args.count, category_ids)
+
+    baseline_rate = run_baseline(db, args.baseline, category_ids[0]) if args.baseline else None
+
+    importer = product_import.ProductImporter(chunk_size=args.chunk_size)
+
+    def on_progress(progress):
+        print(f"  {progress['rows_read']:>8} 行  {progress['rows_per_second']:>8.0f} 行/秒  "
+              f"数据库 {progress['db_seconds']:.1f}s")
+
+    with open(path, encoding="utf-8", newline="") as f:
+        summary = importer.run(product_import.iter_records(f), on_progress)
+    rate = summary["rows_per_second"]
+    print(f"分批导入: 新增 {summary['inserted']}，失败 {summary['failed']}，"
+          f"用时 {summary['elapsed_seconds']:.1f}s，{rate:.0f} 行/秒")
+    if baseline_rate:
+        print(f"约为逐行插入的 {rate / baseline_rate:.0f} 倍；逐行导入 {args.count} 行预计需要 "
+              f"{args.count / baseline_rate / 60:.0f} 分钟")
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="商品批量导入基准")
+    parser.add_argument("--count", type=int, default=500000)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--baseline", type=int, default=2000, help="在线模式下用 sp_AddProduct 逐行插入的行数")
+    parser.add_argument("--live", action="store_true", help="连接数据库测试")
+    parser.add_argument("--cleanup", action="store_true", help="删除导入的模拟商品")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        if args.live:
+            run_live(path, args)
+        else:
+            run_offline(path, args.count)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# bench_rows.py
+# 查询结果行格式测试：10 万行结果分别转换为 dict / Row / columns，比较分配的对象数、内存和 RSS
+# 用法：
+#   python bench_rows.py                       # 离线：进程内生成 10 万行（模拟 fetchall 返回的元组）
+#   python bench_rows.py --rows 500000
+#   python bench_rows.py --live                # 在线：由 SQL Server 交叉连接生成 10 万行，经 execute_query 读取
+import argparse
+import gc
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from rows import ROW_FORMATS, convert_rows
+
+COLUMNS = ["order_id", "user_id", "total_amount", "order_status", "create_time", "receiver_name", "detail_address"]
+
+LIVE_SQL = """
+    SELECT TOP (?)
+        ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS order_id,
+        a.object_id % 5000 AS user_id,
+        CAST(ABS(CHECKSUM(NEWID())) % 100000 AS DECIMAL(10, 2)) / 100 AS total_amount,
+        a.object_id % 4 AS order_status,
+        DATEADD(SECOND, a.object_id % 86400, '2025-01-01') AS create_time,
+        N'张三' AS receiver_name,
+        N'北京市海淀区某某路 100 号' AS detail_address
+    FROM sys.all_objects a
+    CROSS JOIN sys.all_objects b
+"""
+
+
+def current_rss_mb():
+    '''当前常驻内存（Linux 读 /proc，其它平台退回峰值）'''
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_rows(count, start=datetime(2025, 1, 1)):
+    return [
+        (i, i % 5000, Decimal(i % 100000) / 100, i % 4, start + timedelta(seconds=i), "张三", "北京市海淀区某某路 100 号")
+        for i in range(1, count + 1)
+    ]
+
+
+def measure(label, build):
+    '''返回 build() 结果常驻的内存块数、字节数，以及构建耗时和 RSS 变化'''
+    gc.collect()
+    rss_before = current_rss_mb()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    blocks = sys.getallocatedblocks() - blocks_before
+    rss = current_rss_mb() - rss_before
+    print(f"{label:8s} 新增内存块 {blocks:>9,}  常驻 {current / 1024 / 1024:7.1f} MB  峰值 {peak / 1024 / 1024:7.1f} MB  "
+          f"RSS +{rss:6.1f} MB  用时 {elapsed * 1000:6.0f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询结果行格式内存测试")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--live", action="store_true", help="从数据库读取")
+    args = parser.parse_args()
+
+    if args.live:
+        from database import db
+        for row_format in ROW_FORMATS:
+            result = measure(row_format, lambda: db.execute_query(LIVE_SQL, (args.rows,), row_format=row_format))
+            del result
+        db.close()
+        return
+
+    # 离线：原始行（相当于 fetchall 的结果）先建好，只比较转换后多出来的部分
+    raw = synthetic_rows(args.rows)
+    print(f"{args.rows} 行 × {len(COLUMNS)} 列（原始值不计入）")
+    for row_format in ROW_FORMATS:
+        result = measure(row_format, lambda: convert_rows(COLUMNS, raw, row_format))
+        del result
+
+
+if __name__ == "__main__":
+    main()
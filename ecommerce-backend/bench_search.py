@@ -0,0 +1,151 @@
+# bench_search.py
+# 商品搜索基准：倒排索引 vs LIKE '%kw%' 全表扫描
+# 用法：
+#   python bench_search.py                       # 离线：生成 100 万个模拟商品，对比进程内倒排索引与逐行子串匹配
+#   python bench_search.py --count 200000
+#   python bench_search.py --live                # 在线：对比数据库中 LIKE、全文检索（FREETEXTTABLE）与内存索引
+#   python bench_search.py --live --populate 1000000   # 先插入 100 万个模拟商品（image 标记为 bench_search）
+#   python bench_search.py --live --cleanup      # 删除插入的模拟商品
+import argparse
+import asyncio
+import random
+import time
+
+import search
+
+BRANDS = ["华为", "苹果", "小米", "联想", "戴尔", "索尼", "三星", "海尔", "美的", "格力",
+          "Apple", "Huawei", "Xiaomi", "Lenovo", "Sony"]
+KINDS = ["手机", "笔记本电脑", "平板", "耳机", "电视", "冰箱", "空调", "洗衣机", "显示器",
+         "键盘", "鼠标", "音箱", "手表", "相机"]
+ADJECTIVES = ["黑色", "白色", "银色", "蓝色", "轻薄", "旗舰", "高性能", "无线", "智能",
+              "128G", "256G", "Pro", "Max", "Plus", "Ultra"]
+QUERIES = ["华为 手机", "笔记本", "无线耳机", "x1234", "apple pro", "格力空调", "手"]
+MARKER = "bench_search"
+
+
+def make_products(count, start_id=1, seed=42):
+    rng = random.Random(seed)
+    for i in range(count):
+        name = (f"{rng.choice(BRANDS)} {rng.choice(KINDS)} {rng.choice(ADJECTIVES)} "
+                f"{rng.choice(ADJECTIVES)} X{rng.randint(1, 5000)}")
+        description = f"{rng.choice(ADJECTIVES)}{rng.choice(KINDS)}，{rng.choice(ADJECTIVES)}款"
+        yield start_id + i, name, description
+
+
+def timed(func, repeat):
+    result = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def run_offline(count, repeat):
+    products = list(make_products(count))
+    start = time.perf_counter()
+    index = search.InvertedIndex.build(products)
+    print(f"构建索引: {count} 个商品，用时 {time.perf_counter() - start:.1f}s")
+
+    print(f"{'查询':<12}{'LIKE 扫描(ms)':>14}{'命中':>9}{'倒排索引(ms)':>14}{'命中':>9}")
+    for query in QUERIES:
+        keyword = query.lower()
+
+        def like_scan():
+            # 与 LIKE '%kw%' 等价的逐行子串匹配
+            return [product_id for product_id, name, description in products
+                    if keyword in name.lower() or keyword in description.lower()]
+
+        like_ms, like_hits = timed(like_scan, 1)
+        index_ms, index_hits = timed(lambda: index.search(query, limit=1000), repeat)
+        print(f"{query:<12}{like_ms:>14.1f}{len(like_hits):>9}{index_ms:>14.1f}{len(index_hits):>9}")
+
+
+def populate(db, count):
+    row = db.fetch_one("SELECT ISNULL(MAX(product_id), 0) AS max_id FROM Product")
+    start_id = row["max_id"] + 1
+    sql = """
+        INSERT INTO Product
+        (product_id, category_id, product_name, description, price, stock_quantity, image, product_status)
+        VALUES (?, NULL, ?, ?, 99.00, 100, ?, 1)
+    """
+    started = time.perf_counter()
+    batch = []
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        try:
+            for product_id, name, description in make_products(count, start_id):
+                batch.append((product_id, name, description, MARKER))
+                if len(batch) == 10000:
+                    cursor.executemany(sql, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+        finally:
+            cursor.close()
+    print(f"插入 {count} 个模拟商品，用时 {time.perf_counter() - started:.1f}s")
+
+
+def run_live(repeat, args):
+    from database import db
+
+    if args.cleanup:
+        deleted = db.execute_update("DELETE FROM Product WHERE image = ?", (MARKER,))
+        print(f"已删除 {deleted} 个模拟商品")
+        return
+    if args.populate:
+        populate(db, args.populate)
+
+    total = db.fetch_one("SELECT COUNT(*) AS total FROM Product WHERE product_status = 1")["total"]
+    print(f"上架商品数: {total}")
+
+    memory = search.MemorySearchBackend()
+    start = time.perf_counter()
+    memory.rebuild()
+    print(f"内存索引构建用时 {time.perf_counter() - start:.1f}s")
+
+    fulltext = search.FullTextSearchBackend()
+    try:
+        db.fetch_one("SELECT TOP 1 [KEY] FROM FREETEXTTABLE(dbo.Product, (product_name, description), N'测试')")
+    except Exception as e:
+        print(f"全文索引不可用，跳过: {e}")
+        fulltext = None
+
+    like_sql = """
+        SELECT p.product_id, COUNT(*) OVER() AS total_count
+        FROM Product p
+        WHERE p.product_status = 1 AND (p.product_name LIKE ? OR p.description LIKE ?)
+        ORDER BY p.product_id DESC
+        OFFSET 0 ROWS FETCH NEXT 20 ROWS ONLY
+    """
+    print(f"{'查询':<12}{'LIKE(ms)':>10}{'全文检索(ms)':>14}{'内存索引(ms)':>14}")
+    for query in QUERIES:
+        like_ms, _ = timed(lambda: db.execute_query(like_sql, (f"%{query}%", f"%{query}%")), repeat)
+        if fulltext:
+            fulltext_ms, _ = timed(lambda: asyncio.run(fulltext.search(query)), repeat)
+            fulltext_col = f"{fulltext_ms:>14.1f}"
+        else:
+            fulltext_col = f"{'-':>14}"
+        memory_ms, _ = timed(lambda: memory.index.search(query, memory.max_results), repeat)
+        print(f"{query:<12}{like_ms:>10.1f}{fulltext_col}{memory_ms:>14.1f}")
+
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="商品搜索基准")
+    parser.add_argument("--count", type=int, default=1000000, help="离线模式的模拟商品数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--live", action="store_true", help="连接数据库测试")
+    parser.add_argument("--populate", type=int, default=0, help="在线模式下先插入的模拟商品数")
+    parser.add_argument("--cleanup", action="store_true", help="删除插入的模拟商品")
+    args = parser.parse_args()
+
+    if args.live:
+        run_live(args.repeat, args)
+    else:
+        run_offline(args.count, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
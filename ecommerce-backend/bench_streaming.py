@@ -0,0 +1,118 @@
+# bench_streaming.py
+# 流式导出测试：100 万行合成数据经 JSON 数组 / NDJSON 流式序列化，观察内存峰值是否与行数无关
+# 用法：
+#   python bench_streaming.py                     # 离线：进程内生成 100 万行
+#   python bench_streaming.py --rows 200000 --compare   # 同时对比一次性 fetchall + json.dumps 的内存
+#   python bench_streaming.py --live              # 在线：由 SQL Server 交叉连接生成 100 万行，经 stream_query 读取
+import argparse
+import asyncio
+import json
+import resource
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from responses import json_default
+from streaming import iter_json_array, iter_ndjson
+
+
+def current_rss_mb():
+    '''当前常驻内存（Linux 读 /proc，其它平台退回峰值）'''
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_row(i, start=datetime(2025, 1, 1)):
+    return {
+        "order_id": i,
+        "username": f"user{i % 5000}",
+        "total_amount": Decimal(i % 100000) / 100,
+        "create_time": start + timedelta(seconds=i),
+        "order_status_name": "已支付",
+        "detail_address": "北京市海淀区某某路 100 号",
+    }
+
+
+async def synthetic_rows(count):
+    for i in range(1, count + 1):
+        yield synthetic_row(i)
+        if i % 1000 == 0:
+            await asyncio.sleep(0)  # 模拟按批从数据库读取
+
+
+def live_rows(count, arraysize):
+    from database import async_db
+    sql = """
+        SELECT TOP (?)
+            ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS order_id,
+            CONCAT('user', a.object_id % 5000) AS username,
+            CAST(ABS(CHECKSUM(NEWID())) % 100000 AS DECIMAL(10, 2)) / 100 AS total_amount,
+            DATEADD(SECOND, a.object_id % 86400, '2025-01-01') AS create_time,
+            N'已支付' AS order_status_name,
+            N'北京市海淀区某某路 100 号' AS detail_address
+        FROM sys.all_objects a
+        CROSS JOIN sys.all_objects b
+        CROSS JOIN sys.all_objects c
+    """
+    return async_db.stream_query(sql, (count,), arraysize=arraysize)
+
+
+async def consume(body, report_every):
+    '''模拟客户端读取响应体，定期记录内存'''
+    total = 0
+    chunks = 0
+    samples = []
+    async for chunk in body:
+        total += len(chunk)
+        chunks += 1
+        if chunks % report_every == 0:
+            samples.append(current_rss_mb())
+    return total, samples
+
+
+async def run(args):
+    rows = live_rows(args.rows, args.arraysize) if args.live else synthetic_rows(args.rows)
+    body = iter_ndjson(rows) if args.format == "ndjson" else iter_json_array(rows)
+
+    baseline = current_rss_mb()
+    start = time.perf_counter()
+    total, samples = await consume(body, report_every=200)
+    elapsed = time.perf_counter() - start
+    print(f"流式 {args.format}: {args.rows} 行，{total / 1024 / 1024:.1f} MB，用时 {elapsed:.1f}s "
+          f"({args.rows / elapsed:.0f} 行/秒)")
+    if samples:
+        print(f"  RSS 起始 {baseline:.1f} MB，过程中 最小 {min(samples):.1f} / 最大 {max(samples):.1f} MB")
+    print(f"  峰值 RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+    if args.compare and not args.live:
+        # 改造前的方式：先取全部行（fetchall 列表），再整体序列化
+        start = time.perf_counter()
+        materialized = [synthetic_row(i) for i in range(1, args.rows + 1)]
+        payload = json.dumps({"code": 200, "message": "success", "data": materialized},
+                             ensure_ascii=False, default=json_default).encode("utf-8")
+        print(f"一次性序列化: {len(payload) / 1024 / 1024:.1f} MB，用时 {time.perf_counter() - start:.1f}s，"
+              f"当前 RSS {current_rss_mb():.1f} MB，峰值 RSS "
+              f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+    if args.live:
+        from database import async_db, db
+        async_db.shutdown()
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式导出内存测试")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--format", choices=["json", "ndjson"], default="json")
+    parser.add_argument("--arraysize", type=int, default=1000)
+    parser.add_argument("--live", action="store_true", help="从数据库读取合成数据")
+    parser.add_argument("--compare", action="store_true", help="对比一次性序列化（仅离线模式）")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """线程安全的 TTL + LRU 缓存
+
+    - maxsize: 最多缓存的条目数，超出时淘汰最久未使用的
+    - ttl: 条目存活秒数
+    命中/未命中次数通过 stats() 获取。
+
+    先查数据库再写缓存时，查询前用 generation() 取得失效计数，写入时传给 set(since=...)：
+    查询期间该键被 invalidate 过则放弃写入，避免把失效前读到的旧值重新缓存整个 ttl。
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, name="cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._generation = 0
+        self._invalidated = OrderedDict()  # key -> 最近一次失效时的计数，最多保留 maxsize 个
+        self._forgotten = 0  # 已丢弃的失效记录中最大的计数
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def generation(self):
+        return self._generation
+
+    def set(self, key, value, ttl=None, since=None):
+        """写入缓存；since 为读取数据前的 generation()，期间该键失效过时不写入并返回 False"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if since is not None and (since < self._forgotten or self._invalidated.get(key, 0) > since):
+                # 失效记录已被丢弃时无法确认，保守地不写入
+                return False
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._generation += 1
+            self._invalidated[key] = self._generation
+            self._invalidated.move_to_end(key)
+            while len(self._invalidated) > self.maxsize:
+                self._forgotten = self._invalidated.popitem(last=False)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+            self._invalidated.clear()
+            self._forgotten = self._generation
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
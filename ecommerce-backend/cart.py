@@ -1,61 +1,114 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
-from typing import List
+from typing import List, Literal
 from pydantic import BaseModel
-from database import db
-from auth import get_current_user
+import json
+import logging
+from database import async_db
+from responses import FastJSONRoute
+from auth import get_current_user, get_current_user_claims, require_admin
+from cart_cache import cart_cache
+from queries import CART_COLUMNS
+from id_allocator import cart_ids
 
-router = APIRouter(prefix="/cart")
+router = APIRouter(prefix="/cart", route_class=FastJSONRoute)
+
+logger = logging.getLogger(__name__)
 
 class CartItem(BaseModel):
     product_id: int
     quantity: int
 
+class CartItemOp(BaseModel):
+    """批量修改购物车的一项操作
+
+    - add: 在现有数量上增加 quantity（不在购物车中则新增）
+    - set: 把数量设为 quantity，0 表示移除
+    - remove: 移除该商品，忽略 quantity
+    """
+    product_id: int
+    quantity: int = 0
+    op: Literal["add", "set", "remove"] = "set"
+
+# 单次批量操作的最大条数
+MAX_BATCH_ITEMS = 200
+
+# 批量修改：参数为 (修改列表 JSON, user_id)
+# Cart 上有 INSTEAD OF INSERT 触发器（trg_CheckStockBeforeCartInsert），SQL Server 不允许 MERGE 到这样的表，
+# 因此在一个事务内分别执行 DELETE / UPDATE / INSERT…SELECT。
+# 购物车行加 UPDLOCK + HOLDLOCK、商品行加 HOLDLOCK 保持到事务结束，按写入时的购物车数量和库存计算目标数量并校验；
+# 应写入的行（目标数量 > 0）任意一行不满足库存、上下架或缺少 cart_id 时回滚整批并报错
+BATCH_UPDATE_SQL = """
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    DECLARE @changes NVARCHAR(MAX) = ?, @user_id INT = ?;
+    DECLARE @targets TABLE (
+        product_id INT PRIMARY KEY, target INT, cart_id INT, in_cart BIT,
+        stock_quantity INT, product_status SMALLINT
+    );
+    BEGIN TRANSACTION;
+    INSERT INTO @targets (product_id, target, cart_id, in_cart, stock_quantity, product_status)
+    SELECT j.product_id,
+        CASE WHEN j.mode = 'add' THEN ISNULL(c.cart_quantity, 0) + j.quantity ELSE j.quantity END,
+        j.cart_id,
+        CASE WHEN c.product_id IS NULL THEN 0 ELSE 1 END,
+        p.stock_quantity, p.product_status
+    FROM OPENJSON(@changes) WITH (
+        product_id INT, mode VARCHAR(10), quantity INT, cart_id INT
+    ) j
+    LEFT JOIN Cart c WITH (UPDLOCK, HOLDLOCK) ON c.user_id = @user_id AND c.product_id = j.product_id
+    LEFT JOIN Product p WITH (HOLDLOCK) ON p.product_id = j.product_id;
+
+    DECLARE @skipped NVARCHAR(2000) = (
+        SELECT STRING_AGG(CAST(s.product_id AS NVARCHAR(MAX)), N',')
+        FROM @targets s
+        WHERE s.target > 0
+        AND (ISNULL(s.product_status, 0) <> 1 OR s.stock_quantity IS NULL OR s.target > s.stock_quantity
+             OR (s.in_cart = 0 AND s.cart_id IS NULL))
+    );
+    IF @skipped IS NOT NULL
+    BEGIN
+        ROLLBACK TRANSACTION;
+        RAISERROR(N'商品库存不足或已下架：%s', 16, 1, @skipped);
+        RETURN;
+    END
+
+    DELETE c FROM Cart c
+    INNER JOIN @targets s ON s.product_id = c.product_id
+    WHERE c.user_id = @user_id AND s.target <= 0;
+
+    UPDATE c SET cart_quantity = s.target, add_time = GETDATE()
+    FROM Cart c
+    INNER JOIN @targets s ON s.product_id = c.product_id
+    WHERE c.user_id = @user_id AND s.in_cart = 1 AND s.target > 0;
+
+    INSERT INTO Cart (cart_id, user_id, product_id, cart_quantity, add_time)
+    SELECT s.cart_id, @user_id, s.product_id, s.target, GETDATE()
+    FROM @targets s
+    WHERE s.in_cart = 0 AND s.target > 0;
+
+    -- 版本号在读取明细之前读取（含本批次的写入）：之后若有其他写入，下次读取时版本号不一致，快照被丢弃
+    DECLARE @cart_version BIGINT = (SELECT ISNULL(MAX(version), 0) FROM CartVersion WHERE user_id = @user_id);
+    COMMIT TRANSACTION;
+
+    -- 最新购物车，每行带 cart_version；购物车为空时返回一行只有 cart_version 的记录
+    SELECT v.cart_version,""" + CART_COLUMNS + """
+    FROM (SELECT @cart_version AS cart_version) v
+    LEFT JOIN (Cart c INNER JOIN Product p ON c.product_id = p.product_id AND p.product_status = 1)
+        ON c.user_id = @user_id
+    ORDER BY c.add_time DESC;
+"""
+
 @router.get("/")
 @router.get("")
-async def get_cart(current_user: dict = Depends(get_current_user)):
-    """获取购物车列表"""
+async def get_cart(current_user: dict = Depends(get_current_user_claims)):
+    """获取购物车列表（读取缓存的购物车快照，商品或促销变化时自动重新计算）"""
     try:
-        sql = """
-            SELECT 
-                c.cart_id, 
-                c.user_id, 
-                c.product_id, 
-                c.cart_quantity, 
-                c.add_time,
-                p.product_name,
-                p.price,
-                p.image AS image_url,
-                p.stock_quantity,
-                p.product_status
-            FROM Cart c
-            INNER JOIN Product p ON c.product_id = p.product_id
-            WHERE c.user_id = ?
-            AND p.product_status = 1
-            ORDER BY c.add_time DESC
-        """
-        items = db.execute_query(sql, (current_user["user_id"],))
-        
-        # 计算统计信息
-        total_items = len(items)
-        cart_total = sum(item["price"] * item["cart_quantity"] for item in items) if items else 0
+        snapshot = await cart_cache.get(current_user["user_id"])
         
         return {
             "code": 200,
             "message": "success",
-            "data": {
-                "items": [
-                    {
-                        **item,
-                        "quantity": item["cart_quantity"],
-                        "selected": True  # 默认选中
-                    }
-                    for item in items
-                ],
-                "summary": {
-                    "total_items": total_items,
-                    "total_amount": cart_total
-                }
-            }
+            "data": snapshot.to_response()
         }
         
     except Exception as e:
@@ -69,17 +122,21 @@ async def add_to_cart(
     item: CartItem,
     current_user: dict = Depends(get_current_user)
 ):
-    # Add debug log to see what's being received
-    print(f"Debug: Received add_to_cart request with item: {item}")
     """添加商品到购物车"""
+    logger.debug("添加商品到购物车", extra={
+        "user_id": current_user["user_id"], "product_id": item.product_id, "quantity": item.quantity
+    })
     try:
         # 调用存储过程
-        result = db.execute_proc("sp_AddToCart", [
+        result = await async_db.execute_proc("sp_AddToCart", [
             current_user["user_id"],
             item.product_id,
             item.quantity
         ])
         
+        # 增量更新购物车快照：只重新读取这一件商品
+        await cart_cache.refresh_item(current_user["user_id"], item.product_id)
+        
         return {
             "code": 200,
             "message": "添加成功",
@@ -98,6 +155,105 @@ async def add_to_cart(
                 detail=f"添加到购物车失败: {error_msg}"
             )
 
+def fold_operations(operations):
+    """把同一商品的多次操作按顺序合并成一次：("add", 增量) 或 ("set", 数量)"""
+    folded = {}
+    for item in operations:
+        mode, value = folded.get(item.product_id, ("add", 0))
+        if item.op == "remove":
+            folded[item.product_id] = ("set", 0)
+        elif item.op == "set":
+            folded[item.product_id] = ("set", item.quantity)
+        else:
+            folded[item.product_id] = (mode, value + item.quantity)
+    return folded
+
+@router.patch("/items")
+async def batch_update_cart(
+    operations: List[CartItemOp] = Body(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """批量修改购物车（新增 / 改数量 / 移除），返回修改后的购物车
+
+    所有商品的库存先在一次查询中校验（给出逐项的错误信息），任意一项不通过则整批不生效；
+    校验通过后在一个事务内完成全部删除、更新和新增，写入前按加锁读取的数量和库存再次校验，
+    两次查询之间购物车或库存发生变化导致任意一行不满足时整批回滚，返回 400。
+    """
+    try:
+        if not operations:
+            raise HTTPException(status_code=400, detail="请提供要修改的商品")
+        if len(operations) > MAX_BATCH_ITEMS:
+            raise HTTPException(status_code=400, detail=f"单次最多修改 {MAX_BATCH_ITEMS} 个商品")
+        for item in operations:
+            if item.op != "remove" and item.quantity < 0:
+                raise HTTPException(status_code=400, detail=f"商品 {item.product_id} 的数量不能为负数")
+        
+        user_id = current_user["user_id"]
+        folded = fold_operations(operations)
+        
+        # 1. 一次查询取出所有商品的库存、状态和当前购物车数量
+        stock_rows = await async_db.execute_query("""
+            SELECT j.product_id, p.stock_quantity, p.product_status, c.cart_quantity
+            FROM OPENJSON(?) WITH (product_id INT '$') j
+            LEFT JOIN Product p ON p.product_id = j.product_id
+            LEFT JOIN Cart c ON c.user_id = ? AND c.product_id = j.product_id
+        """, (json.dumps(list(folded)), user_id))
+        stock_map = {row["product_id"]: row for row in stock_rows}
+        
+        # 2. 计算每个商品的目标数量并校验
+        errors = []
+        changes = []
+        for product_id, (mode, value) in folded.items():
+            row = stock_map.get(product_id, {})
+            in_cart = row.get("cart_quantity") is not None
+            target = value if mode == "set" else (row.get("cart_quantity") or 0) + value
+            if target <= 0:
+                if in_cart:
+                    changes.append({"product_id": product_id, "mode": "set", "quantity": 0})
+                continue
+            if row.get("stock_quantity") is None or row.get("product_status") != 1:
+                errors.append(f"商品 {product_id} 不存在或已下架")
+            elif row["stock_quantity"] < target:
+                errors.append(f"商品 {product_id} 库存不足，当前库存：{row['stock_quantity']}")
+            else:
+                change = {"product_id": product_id, "mode": mode, "quantity": value}
+                if not in_cart:
+                    change["cart_id"] = await cart_ids.next_id_async()
+                changes.append(change)
+        
+        if errors:
+            raise HTTPException(status_code=400, detail="；".join(errors))
+        
+        # 3. 一个事务内完成删除/更新/新增，同一批次返回最新购物车
+        rows = await async_db.retry(
+            lambda: async_db.execute_query(BATCH_UPDATE_SQL, (json.dumps(changes), user_id)),
+            name="cart_batch_update",
+        )
+        cart_version = rows[0]["cart_version"]
+        items = [
+            {key: value for key, value in row.items() if key != "cart_version"}
+            for row in rows if row["cart_id"] is not None
+        ]
+        
+        snapshot = await cart_cache.put(user_id, items, cart_version)
+        
+        return {
+            "code": 200,
+            "message": "更新成功",
+            "data": snapshot.to_response()
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_msg = str(e)
+        if "库存不足或已下架" in error_msg:
+            raise HTTPException(status_code=400, detail="购物车已变化或库存不足，请刷新后重试")
+        raise HTTPException(
+            status_code=500,
+            detail=f"批量修改购物车失败: {error_msg}"
+        )
+
 @router.delete("/{product_id}")
 async def remove_from_cart(
     product_id: int,
@@ -106,7 +262,7 @@ async def remove_from_cart(
     """从购物车移除商品"""
     try:
         # 先检查商品是否存在
-        cart_item = db.execute_query(
+        cart_item = await async_db.execute_query(
             "SELECT * FROM Cart WHERE user_id = ? AND product_id = ?",
             (current_user["user_id"], product_id)
         )
@@ -115,10 +271,11 @@ async def remove_from_cart(
             raise HTTPException(status_code=404, detail="商品不在购物车中")
         
         # 删除
-        db.execute_update(
+        deleted = await async_db.execute_update(
             "DELETE FROM Cart WHERE user_id = ? AND product_id = ?",
             (current_user["user_id"], product_id)
         )
+        await cart_cache.remove_items(current_user["user_id"], [product_id], changed=deleted > 0)
         
         return {
             "code": 200,
@@ -142,7 +299,7 @@ async def update_cart_item(
     """更新购物车商品数量"""
     try:
         # 先检查库存
-        stock_info = db.execute_query(
+        stock_info = await async_db.execute_query(
             "SELECT stock_quantity FROM Product WHERE product_id = ? AND product_status = 1",
             (product_id,)
         )
@@ -154,10 +311,11 @@ async def update_cart_item(
             raise HTTPException(status_code=400, detail="库存不足")
         
         # 更新数量
-        db.execute_update(
+        updated = await async_db.execute_update(
             "UPDATE Cart SET cart_quantity = ? WHERE user_id = ? AND product_id = ?",
             (item.quantity, current_user["user_id"], product_id)
         )
+        await cart_cache.set_quantity(current_user["user_id"], product_id, item.quantity, changed=updated > 0)
         
         return {
             "code": 200,
@@ -172,6 +330,15 @@ async def update_cart_item(
             detail=f"更新购物车失败: {str(e)}"
         )
 
+@router.get("/cache-stats")
+async def get_cart_cache_stats(admin: dict = Depends(require_admin)):
+    """购物车快照缓存的命中率和重新计算耗时（仅管理员）"""
+    return {
+        "code": 200,
+        "message": "success",
+        "data": cart_cache.stats()
+    }
+
 @router.delete("/batch")
 async def batch_remove_from_cart(
     product_ids: List[int] = Body(...),
@@ -187,7 +354,8 @@ async def batch_remove_from_cart(
         sql = f"DELETE FROM Cart WHERE user_id = ? AND product_id IN ({placeholders})"
         
         # 执行删除
-        db.execute_update(sql, (current_user["user_id"], *product_ids))
+        deleted = await async_db.execute_update(sql, (current_user["user_id"], *product_ids))
+        await cart_cache.remove_items(current_user["user_id"], product_ids, changed=deleted > 0)
         
         return {
             "code": 200,
@@ -206,7 +374,9 @@ async def batch_remove_from_cart(
 async def clear_cart(current_user: dict = Depends(get_current_user)):
     """清空购物车"""
     try:
-        db.execute_proc("sp_ClearCart", [current_user["user_id"]])
+        await async_db.execute_proc("sp_ClearCart", [current_user["user_id"]])
+        # 存储过程不返回影响的行数，无法确认版本号的增量，下次读取时重新加载（空购物车）
+        cart_cache.invalidate(current_user["user_id"])
         
         return {
             "code": 200,
@@ -0,0 +1,354 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from database import async_db
+from queries import CART_VIEW, CART_ITEM, CART_VERSION
+from cache import TTLCache
+from promotions import promotion_index
+import pricing
+
+
+class ProductVersionFeed:
+    """商品版本变更流
+
+    Product.row_version（见 database/cart_cache.sql）在商品任意字段变化时递增。
+    每 poll_interval 秒查询一次 row_version 大于上次水位的商品，记录每个商品最新的版本，
+    快照中某商品的版本低于这里记录的版本即说明价格/库存/状态已变化。
+    记录的商品过多时裁剪最旧的一半，并抬高 floor：构建时水位低于 floor 的快照一律视为过期。
+    """
+
+    def __init__(self, poll_interval=1.0, max_tracked=100000):
+        self.poll_interval = poll_interval
+        self.max_tracked = max_tracked
+        self.version = None  # 已读到的最大 row_version
+        self.floor = 0
+        self._changed = {}
+        self._checked_at = None
+        self._lock = asyncio.Lock()
+
+    def _is_due(self):
+        return self._checked_at is None or time.monotonic() - self._checked_at > self.poll_interval
+
+    async def ensure_fresh(self):
+        if not self._is_due():
+            return
+        async with self._lock:
+            if not self._is_due():
+                return
+            await self.poll()
+            self._checked_at = time.monotonic()
+
+    async def poll(self):
+        if self.version is None:
+            row = await async_db.fetch_one("SELECT CAST(@@DBTS AS BIGINT) AS version")
+            self.version = self.floor = row["version"]
+            return
+
+        rows = await async_db.execute_query("""
+            SELECT product_id, CAST(row_version AS BIGINT) AS version
+            FROM Product
+            WHERE row_version > CAST(CAST(? AS BIGINT) AS BINARY(8))
+        """, (self.version,), row_format="row")
+        for row in rows:
+            self._changed[row["product_id"]] = row["version"]
+            if row["version"] > self.version:
+                self.version = row["version"]
+
+        if len(self._changed) > self.max_tracked:
+            ordered = sorted(self._changed.items(), key=lambda item: item[1])
+            dropped = ordered[:len(ordered) // 2]
+            self.floor = dropped[-1][1]
+            self._changed = dict(ordered[len(ordered) // 2:])
+
+    def is_stale(self, snapshot):
+        if snapshot.feed_version is None or snapshot.feed_version < self.floor:
+            return True
+        changed = self._changed
+        for product_id, version in snapshot.versions.items():
+            if changed.get(product_id, 0) > version:
+                return True
+        return False
+
+
+class CartSnapshot:
+    """某个用户购物车的计算结果
+
+    保存原始明细行、定价后的明细行、每行单价（分）和合计（分）。
+    增删改只调整受影响的行和合计，不重新计算整个购物车。
+    cart_version 为读取明细前的购物车版本号（CartVersion），None 表示无法确认，下次读取时重新加载。
+    """
+
+    def __init__(self, rows, feed_version, cart_version=None):
+        self.feed_version = feed_version
+        self.cart_version = cart_version
+        self.versions = {}
+        self.rows = OrderedDict()  # product_id -> 原始行，按加入时间倒序
+        self.lines = {}  # product_id -> (响应行, 原价单价分, 成交单价分)
+        self.original_cents = 0
+        self.total_cents = 0
+        self.promotion_version = None
+        for row in rows:
+            self._store_row(row)
+        self.reprice()
+
+    def _store_row(self, row, to_front=False):
+        row = dict(row)
+        product_id = row["product_id"]
+        self.versions[product_id] = row.pop("product_version", 0)
+        self.rows[product_id] = row
+        if to_front:
+            self.rows.move_to_end(product_id, last=False)
+        return row
+
+    def _price_line(self, row, priced):
+        quantity = row["cart_quantity"]
+        original_unit = pricing.to_cents(priced.original_price)
+        unit = pricing.to_cents(priced.price)
+        line = {
+            **row,
+            "price": float(priced.price),
+            "original_price": float(priced.original_price) if priced.promotion else None,
+            "promotion": priced.tag,
+            "quantity": quantity,
+            "subtotal": float(pricing.from_cents(unit * quantity)),
+            "selected": True  # 默认选中
+        }
+        self.lines[row["product_id"]] = (line, original_unit, unit)
+        self.original_cents += original_unit * quantity
+        self.total_cents += unit * quantity
+
+    def _drop_line(self, product_id):
+        entry = self.lines.pop(product_id, None)
+        if entry is not None:
+            line, original_unit, unit = entry
+            self.original_cents -= original_unit * line["quantity"]
+            self.total_cents -= unit * line["quantity"]
+
+    def reprice(self):
+        """按当前促销重新计算所有行（不访问数据库）"""
+        self.lines = {}
+        self.original_cents = 0
+        self.total_cents = 0
+        rows = list(self.rows.values())
+        priced_items = promotion_index.price_batch(
+            (row["product_id"], row["price"]) for row in rows
+        )
+        for row, priced in zip(rows, priced_items):
+            self._price_line(row, priced)
+        self.promotion_version = promotion_index.version
+
+    def upsert_row(self, row):
+        """新增或替换一行（加购后 add_time 更新，移到最前）"""
+        self._drop_line(row["product_id"])
+        row = self._store_row(row, to_front=True)
+        priced = promotion_index.price_batch([(row["product_id"], row["price"])])[0]
+        self._price_line(row, priced)
+
+    def set_quantity(self, product_id, quantity):
+        entry = self.lines.get(product_id)
+        if entry is None:
+            return
+        line, original_unit, unit = entry
+        delta = quantity - line["quantity"]
+        self.original_cents += original_unit * delta
+        self.total_cents += unit * delta
+        line["quantity"] = line["cart_quantity"] = quantity
+        line["subtotal"] = float(pricing.from_cents(unit * quantity))
+        self.rows[product_id]["cart_quantity"] = quantity
+
+    def remove(self, product_ids):
+        for product_id in product_ids:
+            self._drop_line(product_id)
+            self.rows.pop(product_id, None)
+            self.versions.pop(product_id, None)
+
+    def to_response(self):
+        return {
+            "items": [dict(self.lines[product_id][0]) for product_id in self.rows],
+            "summary": {
+                "total_items": len(self.rows),
+                "original_amount": float(pricing.from_cents(self.original_cents)),
+                "discount_amount": float(pricing.from_cents(self.original_cents - self.total_cents)),
+                "total_amount": float(pricing.from_cents(self.total_cents))
+            }
+        }
+
+    def order_prices(self):
+        """下单用的成交单价（与购物车展示的价格相同），传给 sp_CreateOrder 的 @prices
+
+        list_price 为定价时的原价，存储过程据此确认商品价格在定价后没有变化。
+        """
+        return [
+            {
+                "product_id": product_id,
+                "list_price": str(pricing.from_cents(original_unit)),
+                "unit_price": str(pricing.from_cents(unit)),
+            }
+            for product_id, (_, original_unit, unit) in self.lines.items()
+        ]
+
+
+class CartCache:
+    """按用户缓存购物车快照
+
+    读取时依次检查：购物车版本号变化（任意进程的加购/改数量/删除/下单）或
+    商品版本变化（价格/库存/上下架）→ 丢弃快照重新查询；促销索引版本变化 → 只在内存中重新定价。
+    本进程写入购物车后，重新读取版本号：恰好比快照多出本次写入的次数（每条改动了行的语句加 1）
+    才增量更新快照并记录新版本，多出更多说明期间有其他写入，丢弃快照。
+    """
+
+    def __init__(self, maxsize=10000, ttl=60.0, feed=None):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, name="cart")
+        self.feed = feed or ProductVersionFeed()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.incremental_updates = 0
+        self._timings = {
+            "rebuild": [0, 0.0, 0.0],  # 次数, 总耗时(ms), 最大耗时(ms)
+            "reprice": [0, 0.0, 0.0],
+        }
+
+    def _record(self, kind, started):
+        elapsed = (time.perf_counter() - started) * 1000
+        timing = self._timings[kind]
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] = max(timing[2], elapsed)
+
+    async def get(self, user_id):
+        """返回有效的快照，没有缓存或已过期时从数据库重新加载"""
+        await self.feed.ensure_fresh()
+        await promotion_index.ensure_fresh()
+
+        cart_version = await self.read_version(user_id)
+        snapshot = self._cache.get(user_id)
+        if snapshot is not None and (snapshot.cart_version != cart_version or self.feed.is_stale(snapshot)):
+            self.stale += 1
+            snapshot = None
+        if snapshot is None:
+            self.misses += 1
+            return await self.load(user_id, cart_version)
+
+        self.hits += 1
+        if snapshot.promotion_version != promotion_index.version:
+            started = time.perf_counter()
+            snapshot.reprice()
+            self._record("reprice", started)
+        return snapshot
+
+    async def read_version(self, user_id):
+        row = await async_db.fetch_one(CART_VERSION, (user_id,))
+        return row["version"]
+
+    async def load(self, user_id, cart_version=None):
+        """从数据库重新加载；版本号在明细之前读取，期间的写入会在下次读取时被发现"""
+        started = time.perf_counter()
+        feed_version = self.feed.version
+        if cart_version is None:
+            cart_version = await self.read_version(user_id)
+        rows = await async_db.execute_query(CART_VIEW, (user_id,))
+        snapshot = CartSnapshot(rows, feed_version, cart_version)
+        self._cache.set(user_id, snapshot)
+        self._record("rebuild", started)
+        return snapshot
+
+    async def put(self, user_id, rows, cart_version):
+        """用刚查询到的完整明细替换快照（批量修改后使用）
+
+        cart_version 须在读取明细之前、与写入在同一事务中读取：之后若有其他写入，
+        下次读取时版本号不一致，快照被丢弃重新加载。
+        """
+        await promotion_index.ensure_fresh()
+        started = time.perf_counter()
+        snapshot = CartSnapshot(rows, self.feed.version, cart_version)
+        self._cache.set(user_id, snapshot)
+        self._record("rebuild", started)
+        return snapshot
+
+    async def _advance(self, snapshot, user_id, writes):
+        """本进程写入 writes 次后确认快照仍然有效：版本号恰好增加 writes 时记录新版本并返回 True，
+        否则（期间有其他写入、快照版本未知）丢弃快照"""
+        if snapshot.cart_version is None:
+            self._cache.invalidate(user_id)
+            return False
+        cart_version = await self.read_version(user_id)
+        if cart_version != snapshot.cart_version + writes:
+            self.stale += 1
+            self._cache.invalidate(user_id)
+            return False
+        snapshot.cart_version = cart_version
+        self.incremental_updates += 1
+        return True
+
+    async def refresh_item(self, user_id, product_id):
+        """加购（sp_AddToCart 成功，改动一行）后只重新读取这一件商品
+
+        快照只查一次缓存：期间若被失效或重建，更新的是已不再使用的旧对象，
+        新快照由 load 从数据库完整读取，本身已包含这件商品。
+        """
+        snapshot = self._cache.get(user_id)
+        if snapshot is None:
+            return
+        rows = await async_db.execute_query(CART_ITEM, (user_id, product_id))
+        if not await self._advance(snapshot, user_id, 1):
+            return
+        await promotion_index.ensure_fresh()
+        if rows:
+            snapshot.upsert_row(rows[0])
+        else:
+            snapshot.remove([product_id])
+
+    async def set_quantity(self, user_id, product_id, quantity, changed=True):
+        """changed：UPDATE 是否改动了行（rowcount > 0），下同"""
+        snapshot = self._cache.get(user_id)
+        if snapshot is not None and await self._advance(snapshot, user_id, 1 if changed else 0):
+            snapshot.set_quantity(product_id, quantity)
+
+    async def remove_items(self, user_id, product_ids, changed=True):
+        snapshot = self._cache.get(user_id)
+        if snapshot is not None and await self._advance(snapshot, user_id, 1 if changed else 0):
+            snapshot.remove(product_ids)
+
+    async def clear_items(self, user_id):
+        """下单后购物车已被 sp_CreateOrder 清空（一条 DELETE），缓存一个空快照"""
+        snapshot = self._cache.get(user_id)
+        if snapshot is not None and await self._advance(snapshot, user_id, 1):
+            self._cache.set(user_id, CartSnapshot([], self.feed.version, snapshot.cart_version))
+
+    def invalidate(self, user_id):
+        self._cache.invalidate(user_id)
+
+    def stats(self):
+        total = self.hits + self.misses
+        timings = {}
+        for kind, (count, total_ms, max_ms) in self._timings.items():
+            timings[kind] = {
+                "count": count,
+                "avg_ms": round(total_ms / count, 3) if count else 0.0,
+                "max_ms": round(max_ms, 3),
+            }
+        return {
+            "size": len(self._cache),
+            "maxsize": self._cache.maxsize,
+            "ttl": self._cache.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "incremental_updates": self.incremental_updates,
+            "evictions": self._cache.evictions,
+            "product_version": self.feed.version,
+            "promotion_version": promotion_index.version,
+            "timings": timings,
+        }
+
+
+# 全局购物车快照缓存
+cart_cache = CartCache(
+    maxsize=int(os.getenv("CART_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("CART_CACHE_TTL", "60")),
+    feed=ProductVersionFeed(poll_interval=float(os.getenv("CART_VERSION_POLL_INTERVAL", "1")))
+)
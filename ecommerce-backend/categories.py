@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+from database import async_db
+
+
+class CategoryTree:
+    """分类树缓存
+
+    分类几乎不变，这里把整棵树连同响应外壳预先序列化成 JSON 字节，并按内容计算 ETag，
+    客户端带 If-None-Match 时可直接返回 304。同时预计算每个分类的所有后代分类，
+    供商品列表按分类筛选时包含子分类使用。
+    缓存在 ttl 秒后过期；后台修改分类后调用 invalidate() 立即失效。
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.version = 0
+        self.body = None
+        self.etag = None
+        self._descendants = {}
+        self._loaded_at = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        """标记缓存失效，下一次请求时重新加载"""
+        self._loaded_at = None
+
+    def is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    async def ensure_fresh(self):
+        """缓存过期时重新加载（并发请求只触发一次加载）"""
+        if not self.is_stale():
+            return
+        async with self._lock:
+            if self.is_stale():
+                await self.reload()
+
+    async def reload(self):
+        sql = """
+            SELECT category_id, category_name, parent_id
+            FROM Category
+            WHERE status = 1
+            ORDER BY sort_order, category_id
+        """
+        self.load(await async_db.execute_query(sql))
+
+    def load(self, categories):
+        """用查询结果重建分类树、序列化结果和后代集合"""
+        # 构建树形结构
+        category_map = {}
+        root_categories = []
+
+        for cat in categories:
+            cat["children"] = []
+            category_map[cat["category_id"]] = cat
+
+        for cat in categories:
+            parent_id = cat["parent_id"]
+            if parent_id and parent_id in category_map:
+                category_map[parent_id]["children"].append(cat)
+            else:
+                root_categories.append(cat)
+
+        # 预计算后代集合（含自身）
+        descendants = {}
+
+        def collect(cat):
+            ids = {cat["category_id"]}
+            for child in cat["children"]:
+                if child["category_id"] not in descendants:
+                    ids |= collect(child)
+                else:
+                    ids |= descendants[child["category_id"]]
+            descendants[cat["category_id"]] = frozenset(ids)
+            return ids
+
+        for cat in root_categories:
+            collect(cat)
+
+        body = json.dumps(
+            {"code": 200, "message": "success", "data": root_categories},
+            ensure_ascii=False, separators=(",", ":"), default=str
+        ).encode("utf-8")
+
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self._descendants = descendants
+        self.version += 1
+        self._loaded_at = time.monotonic()
+
+    def descendants(self, category_id):
+        """分类及其所有后代分类的 ID；未知分类只返回自身"""
+        return self._descendants.get(category_id, frozenset((category_id,)))
+
+    def etag_matches(self, if_none_match):
+        """If-None-Match 是否与当前 ETag 匹配"""
+        if not if_none_match or self.etag is None:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return self.etag in tags or ("W/" + self.etag) in tags
+
+
+# 全局分类树缓存
+category_tree = CategoryTree(ttl=float(os.getenv("CATEGORY_CACHE_TTL", "300")))
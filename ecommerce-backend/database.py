@@ -1,122 +1,610 @@
 import pyodbc
 import os
+import asyncio
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
 
-class Database:
-    def __init__(self):
-        self.conn = None
-        
-    def get_connection(self):
-        '''获取数据库连接（Windows身份验证）'''
-        if self.conn is None:
+# metrics 在模块加载时读取慢查询阈值等配置，需在 load_dotenv 之后导入
+import metrics
+from queries import Statement
+from rows import convert_rows
+
+logger = logging.getLogger(__name__)
+
+# 可以原样重试的错误：死锁牺牲品（1205）、快照隔离更新冲突（3960）。
+# 发生时整个事务已被回滚；存储过程在 CATCH 中重新 RAISERROR 时错误号会变成 50000，因此同时按原始消息判断
+RETRYABLE_ERRORS = (1205, 3960)
+_RETRYABLE_MESSAGES = ("deadlock", "死锁", "update conflict", "更新冲突")
+
+
+def is_retryable(error):
+    '''是否为死锁 / 快照冲突这类可以整体重试的数据库错误'''
+    if not isinstance(error, pyodbc.Error):
+        return False
+    message = " ".join(str(arg) for arg in error.args)
+    if any(f"({code})" in message for code in RETRYABLE_ERRORS):
+        return True
+    message = message.lower()
+    return any(text in message for text in _RETRYABLE_MESSAGES)
+
+
+class PoolTimeoutError(Exception):
+    '''在超时时间内未能从连接池借到连接'''
+    pass
+
+
+class _PooledConnection:
+    '''连接池中的连接及其元数据'''
+    __slots__ = ("conn", "created_at", "last_used", "statements")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # 注册语句名 -> 专用游标（已在该连接上准备），按最近使用排序
+        self.statements = OrderedDict()
+
+
+def _close_quietly(cursor):
+    try:
+        cursor.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    '''线程安全的有界连接池
+
+    - min_size: 首次使用时预先建立的连接数
+    - max_size: 同时存在的连接上限（含已借出的）
+    - timeout: 借连接的最长等待秒数
+    - max_age: 连接存活超过该秒数后回收重建
+    - ping_interval: 空闲超过该秒数的连接在借出前做健康检查
+    - max_prepared: 每个连接最多保留的已准备语句（游标）数，超出时关闭最久未用的
+    '''
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=30.0,
+                 max_age=1800.0, ping_interval=5.0, max_prepared=128):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("连接池大小配置错误")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.ping_interval = ping_interval
+        self.max_prepared = max_prepared
+
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._closed = False
+        self._initialized = False
+        self._cond = threading.Condition(threading.Lock())
+
+    @property
+    def size(self):
+        '''当前连接总数（空闲 + 借出）'''
+        return self._size
+
+    @property
+    def idle_count(self):
+        return len(self._idle)
+
+    def _open(self):
+        return _PooledConnection(self._connect())
+
+    def _discard(self, pooled):
+        pooled.statements.clear()
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, pooled, now):
+        return self.max_age is not None and now - pooled.created_at > self.max_age
+
+    def _healthy(self, pooled):
+        '''借出前的健康检查'''
+        try:
+            cursor = pooled.conn.cursor()
             try:
-                # Windows身份验证的连接字符串
-                server = os.getenv("DB_SERVER", ".")
-                database = os.getenv("DB_NAME", "权限实验")
-                
-                # 使用Windows身份验证
-                connection_string = f"""
-                    DRIVER={{ODBC Driver 17 for SQL Server}};
-                    SERVER={server};
-                    DATABASE={database};
-                    Trusted_Connection=yes;
-                """
-                
-                self.conn = pyodbc.connect(connection_string, autocommit=True)
-                print(f"数据库连接成功: {server}/{database}")
-            except Exception as e:
-                print(f"数据库连接失败: {e}")
-                raise
-        return self.conn
-    
-    def close(self):
-        '''关闭数据库连接'''
-        if self.conn:
-            self.conn.close()
-            print("数据库连接已关闭")
-            self.conn = None
-    
-    def execute_proc(self, proc_name, params=None):
-        '''执行存储过程'''
-        conn = self.get_connection()
-        cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _fill_min(self):
+        '''预热 min_size 个连接（仅首次借出时）'''
+        created = []
+        with self._cond:
+            if self._initialized:
+                return
+            self._initialized = True
+            missing = max(0, self.min_size - self._size)
+            self._size += missing
         try:
-            # 构建参数占位符
-            if params:
-                placeholders = ",".join(["?"] * len(params))
-                sql = f"{{CALL {proc_name} ({placeholders})}}"
-                cursor.execute(sql, params)
-            else:
-                sql = f"{{CALL {proc_name}}}"
-                cursor.execute(sql)
-            
-            # 获取结果
-            if cursor.description:
-                columns = [column[0] for column in cursor.description]
-                results = []
-                for row in cursor.fetchall():
-                    results.append(dict(zip(columns, row)))
-                return results
-            return []
-        except Exception as e:
-            print(f"执行存储过程失败: {e}")
-            raise e
+            for _ in range(missing):
+                created.append(self._open())
         finally:
-            cursor.close()
-    
-    def execute_query(self, sql, params=None):
-        '''执行查询'''
-        conn = self.get_connection()
+            with self._cond:
+                self._size -= missing - len(created)
+                self._idle.extend(created)
+                self._cond.notify_all()
+
+    def acquire(self):
+        '''借出一个连接，超时抛出 PoolTimeoutError'''
+        if not self._initialized:
+            self._fill_min()
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            pooled = None
+            create = False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("连接池已关闭")
+                    if self._idle:
+                        pooled = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            f"等待数据库连接超时（{self.timeout}s，上限 {self.max_size}）"
+                        )
+                    self._cond.wait(remaining)
+
+            if create:
+                try:
+                    pooled = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            else:
+                now = time.monotonic()
+                stale = self._expired(pooled, now)
+                if not stale and now - pooled.last_used > self.ping_interval:
+                    stale = not self._healthy(pooled)
+                if stale:
+                    # 过期或失效的连接直接丢弃，重新借
+                    self._discard(pooled)
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    continue
+
+            with self._cond:
+                self._in_use[id(pooled.conn)] = pooled
+            return pooled.conn
+
+    def release(self, conn, discard=False):
+        '''归还连接；discard=True 表示连接已损坏，直接关闭'''
+        with self._cond:
+            pooled = self._in_use.pop(id(conn), None)
+            if pooled is None:
+                return
+            now = time.monotonic()
+            if discard or self._closed or self._expired(pooled, now):
+                self._size -= 1
+                self._cond.notify()
+            else:
+                pooled.last_used = now
+                self._idle.append(pooled)
+                self._cond.notify()
+                return
+        self._discard(pooled)
+
+    def statement_cursor(self, conn, statement):
+        '''返回借出的连接上专用于注册语句的游标，以及是否为新建（首次执行时需要准备）
+
+        只由借到该连接的线程调用，不需要加锁。
+        '''
+        statements = self._in_use[id(conn)].statements
+        cursor = statements.get(statement.name)
+        if cursor is not None:
+            statements.move_to_end(statement.name)
+            return cursor, False
         cursor = conn.cursor()
+        statements[statement.name] = cursor
+        if len(statements) > self.max_prepared:
+            _, evicted = statements.popitem(last=False)
+            _close_quietly(evicted)
+        return cursor, True
+
+    def forget_statement(self, conn, name):
+        '''执行出错后丢弃该语句的游标，下次重新准备'''
+        pooled = self._in_use.get(id(conn))
+        cursor = pooled.statements.pop(name, None) if pooled else None
+        if cursor is not None:
+            _close_quietly(cursor)
+
+    def close(self):
+        '''关闭所有空闲连接，借出的连接归还时关闭'''
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+
+class Database:
+    def __init__(self):
+        self.pool = None
+        self._pool_lock = threading.Lock()
+
+    def _connect(self):
+        '''建立一个新的数据库连接（Windows身份验证）'''
         try:
-            cursor.execute(sql, params or ())
-            
-            if cursor.description:
-                columns = [column[0] for column in cursor.description]
-                results = []
-                for row in cursor.fetchall():
-                    results.append(dict(zip(columns, row)))
-                return results
-            return []
+            # Windows身份验证的连接字符串
+            server = os.getenv("DB_SERVER", ".")
+            database = os.getenv("DB_NAME", "权限实验")
+
+            # 使用Windows身份验证
+            connection_string = f"""
+                DRIVER={{ODBC Driver 17 for SQL Server}};
+                SERVER={server};
+                DATABASE={database};
+                Trusted_Connection=yes;
+            """
+
+            conn = pyodbc.connect(connection_string, autocommit=True)
+            logger.info("数据库连接成功: %s/%s", server, database)
+            return conn
         except Exception as e:
-            print(f"查询失败: {e}")
-            raise e
+            logger.error("数据库连接失败: %s", e)
+            raise
+
+    def get_pool(self):
+        '''获取连接池（首次调用时按环境变量创建）'''
+        if self.pool is None:
+            with self._pool_lock:
+                if self.pool is None:
+                    self.pool = ConnectionPool(
+                        self._connect,
+                        min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+                        max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+                        timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+                        max_age=float(os.getenv("DB_POOL_MAX_AGE", "1800")),
+                        ping_interval=float(os.getenv("DB_POOL_PING_INTERVAL", "5")),
+                        max_prepared=int(os.getenv("DB_MAX_PREPARED_PER_CONNECTION", "128")),
+                    )
+        return self.pool
+
+    @contextmanager
+    def connection(self):
+        '''从连接池借出连接，用完自动归还'''
+        pool = self.get_pool()
+        started = time.perf_counter()
+        conn = pool.acquire()
+        metrics.observe_pool_wait(started)
+        broken = False
+        try:
+            yield conn
+        except (pyodbc.OperationalError, pyodbc.InterfaceError):
+            # 通信类错误说明连接已不可用，不再放回池中
+            broken = True
+            raise
         finally:
-            cursor.close()
-    
+            pool.release(conn, discard=broken)
+
+    def pool_stats(self):
+        '''连接池状态（/metrics 输出时调用）'''
+        pool = self.pool
+        if pool is None:
+            return {}
+        idle = pool.idle_count
+        return {("idle",): idle, ("in_use",): pool.size - idle, ("max",): pool.max_size}
+
+    def close(self):
+        '''关闭连接池'''
+        if self.pool:
+            self.pool.close()
+            logger.info("数据库连接池已关闭")
+            self.pool = None
+
+    def execute_proc(self, proc_name, params=None):
+        '''执行存储过程'''
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            started = time.perf_counter()
+            try:
+                # 构建参数占位符
+                if params:
+                    placeholders = ",".join(["?"] * len(params))
+                    sql = f"{{CALL {proc_name} ({placeholders})}}"
+                    cursor.execute(sql, params)
+                else:
+                    sql = f"{{CALL {proc_name}}}"
+                    cursor.execute(sql)
+
+                # 获取结果
+                if cursor.description:
+                    columns = [column[0] for column in cursor.description]
+                    results = []
+                    for row in cursor.fetchall():
+                        results.append(dict(zip(columns, row)))
+                    metrics.observe_query("proc", proc_name, started, len(results))
+                    return results
+                metrics.observe_query("proc", proc_name, started)
+                return []
+            except Exception as e:
+                metrics.observe_query("proc", proc_name, started, error=True)
+                logger.warning("执行存储过程失败: %s", e, extra={"statement": proc_name})
+                raise e
+            finally:
+                cursor.close()
+
+    def execute_query(self, sql, params=None, row_format="dict"):
+        '''执行查询
+
+        sql 可以是 SQL 文本，也可以是 queries.py 中注册的 Statement：
+        后者在每个池化连接上只准备一次，之后复用同一游标直接执行。
+        row_format：dict（默认，每行一个 dict）/ row（共享列信息的 Row）/ columns（{列名: [值]}），见 rows.py
+        '''
+        with self.connection() as conn:
+            prepared = isinstance(sql, Statement)
+            if prepared:
+                cursor, fresh = self.get_pool().statement_cursor(conn, sql)
+                name, sql = sql.name, sql.sql
+            else:
+                cursor, name = conn.cursor(), None
+            started = time.perf_counter()
+            try:
+                cursor.execute(sql, params or ())
+                if prepared:
+                    metrics.observe_prepared(name, fresh)
+
+                if cursor.description:
+                    columns = [column[0] for column in cursor.description]
+                    rows = cursor.fetchall()
+                    metrics.observe_query("query", sql, started, len(rows), name=name)
+                    return convert_rows(columns, rows, row_format)
+                metrics.observe_query("query", sql, started, name=name)
+                return convert_rows([], [], row_format)
+            except Exception as e:
+                metrics.observe_query("query", sql, started, error=True, name=name)
+                if prepared:
+                    self.get_pool().forget_statement(conn, name)
+                logger.warning("查询失败: %s", e, extra={"statement": name or metrics.statement_id("query", sql)})
+                raise e
+            finally:
+                if not prepared:
+                    cursor.close()
+
     def fetch_one(self, sql, params=None):
-        '''执行查询并返回第一条记录'''
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute(sql, params or ())
-            
-            if cursor.description:
+        '''执行查询并返回第一条记录
+
+        sql 可以是 SQL 文本，也可以是 queries.py 中注册的 Statement（同 execute_query）。
+        '''
+        with self.connection() as conn:
+            prepared = isinstance(sql, Statement)
+            if prepared:
+                cursor, fresh = self.get_pool().statement_cursor(conn, sql)
+                name, sql = sql.name, sql.sql
+            else:
+                cursor, name = conn.cursor(), None
+            started = time.perf_counter()
+            try:
+                cursor.execute(sql, params or ())
+                if prepared:
+                    metrics.observe_prepared(name, fresh)
+
+                if cursor.description:
+                    columns = [column[0] for column in cursor.description]
+                    row = cursor.fetchone()
+                    if prepared:
+                        # 专用游标不关闭，读完剩余结果，连接才能执行其他语句
+                        cursor.fetchall()
+                    if row:
+                        metrics.observe_query("fetch_one", sql, started, 1, name=name)
+                        return dict(zip(columns, row))
+                metrics.observe_query("fetch_one", sql, started, name=name)
+                return None
+            except Exception as e:
+                metrics.observe_query("fetch_one", sql, started, error=True, name=name)
+                if prepared:
+                    self.get_pool().forget_statement(conn, name)
+                logger.warning("查询失败: %s", e, extra={"statement": name or metrics.statement_id("fetch_one", sql)})
+                raise e
+            finally:
+                if not prepared:
+                    cursor.close()
+
+    def stream_batches(self, sql, params=None, arraysize=None, row_format="dict"):
+        '''流式查询：每次 fetchmany(arraysize) 取一批，按 row_format 转换后产出
+
+        生成器在耗尽或被关闭前一直占用一个连接，调用方需要把它读完或调用 close()。
+        arraysize 默认取 DB_STREAM_ARRAYSIZE。
+        '''
+        arraysize = arraysize or int(os.getenv("DB_STREAM_ARRAYSIZE", "1000"))
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = arraysize
+            # 流式查询按首批数据返回前的耗时记录（之后的耗时取决于消费速度）
+            started = time.perf_counter()
+            try:
+                cursor.execute(sql, params or ())
+                if not cursor.description:
+                    metrics.observe_query("stream", sql, started)
+                    return
                 columns = [column[0] for column in cursor.description]
-                row = cursor.fetchone()
-                if row:
-                    return dict(zip(columns, row))
-            return None
-        except Exception as e:
-            print(f"查询失败: {e}")
-            raise e
-        finally:
-            cursor.close()
-    
+                rows = cursor.fetchmany(arraysize)
+                metrics.observe_query("stream", sql, started, len(rows))
+                while rows:
+                    yield convert_rows(columns, rows, row_format)
+                    rows = cursor.fetchmany(arraysize)
+            except Exception as e:
+                metrics.observe_query("stream", sql, started, error=True)
+                logger.warning("流式查询失败: %s", e, extra={"statement": metrics.statement_id("stream", sql)})
+                raise e
+            finally:
+                cursor.close()
+
+    def stream_query(self, sql, params=None, arraysize=None, row_format="dict"):
+        '''流式查询：逐行产出 dict（row_format="row" 时为 Row），内存占用只与 arraysize 有关'''
+        if row_format == "columns":
+            raise ValueError("逐行流式查询不支持 columns 格式，请使用 stream_batches")
+        for batch in self.stream_batches(sql, params, arraysize, row_format):
+            yield from batch
+
     def execute_update(self, sql, params=None):
         '''执行更新'''
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            started = time.perf_counter()
+            try:
+                cursor.execute(sql, params or ())
+                metrics.observe_query("update", sql, started, max(cursor.rowcount, 0))
+                return cursor.rowcount
+            except Exception as e:
+                metrics.observe_query("update", sql, started, error=True)
+                logger.warning("更新失败: %s", e, extra={"statement": metrics.statement_id("update", sql)})
+                raise e
+            finally:
+                cursor.close()
+
+
+class AsyncDatabase:
+    '''Database 的异步外观
+
+    pyodbc 是阻塞驱动，直接在 async 路由里调用会卡住整个事件循环。
+    这里把每次调用放到专用的有界线程池中执行，接口与 Database 一致，只是需要 await。
+    线程数默认与连接池上限相同，避免线程空等连接。
+    '''
+
+    def __init__(self, database, max_workers=None):
+        self.database = database
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # 被取消的流式查询在后台关闭游标，保留引用直到完成
+        self._closing = set()
+
+    def get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    workers = self.max_workers or int(
+                        os.getenv("DB_EXECUTOR_WORKERS", os.getenv("DB_POOL_MAX_SIZE", "10"))
+                    )
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=workers, thread_name_prefix="db-worker"
+                    )
+        return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        '''在数据库线程池中执行任意阻塞函数
+
+        复制当前 contextvars 上下文到工作线程，请求级统计（metrics.current_request）在线程中仍然可见。
+        '''
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self.get_executor(), functools.partial(context.run, func, *args, **kwargs)
+        )
+
+    async def retry(self, call, name="", attempts=None):
+        '''执行 call()（返回协程的无参函数），遇到死锁 / 快照冲突时退避后重试
+
+        最多执行 attempts 次（默认 DB_RETRY_ATTEMPTS）；第 n 次重试前等待 [0, min(DB_RETRY_MAX_MS, DB_RETRY_BASE_MS × 2^(n-1))]
+        内的随机时长（full jitter），避免同时失败的请求再次同时撞上。其它错误和最后一次失败直接抛出。
+        '''
+        attempts = attempts or int(os.getenv("DB_RETRY_ATTEMPTS", "4"))
+        base = float(os.getenv("DB_RETRY_BASE_MS", "50")) / 1000
+        cap = float(os.getenv("DB_RETRY_MAX_MS", "1000")) / 1000
+        attempt = 1
+        while True:
+            try:
+                return await call()
+            except pyodbc.Error as e:
+                if attempt >= attempts or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+                metrics.db_retries.inc(name)
+                logger.warning("数据库死锁/冲突，%.0fms 后第 %d 次重试: %s", delay * 1000, attempt, e,
+                               extra={"statement": name, "attempt": attempt})
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def execute_proc(self, proc_name, params=None):
+        '''执行存储过程'''
+        return await self.run(self.database.execute_proc, proc_name, params)
+
+    async def execute_query(self, sql, params=None, row_format="dict"):
+        '''执行查询'''
+        return await self.run(self.database.execute_query, sql, params, row_format)
+
+    async def fetch_one(self, sql, params=None):
+        '''执行查询并返回第一条记录'''
+        return await self.run(self.database.fetch_one, sql, params)
+
+    async def execute_update(self, sql, params=None):
+        '''执行更新'''
+        return await self.run(self.database.execute_update, sql, params)
+
+    async def stream_query(self, sql, params=None, arraysize=None, row_format="dict"):
+        '''异步流式查询：每批 fetchmany 在线程池中执行，逐行产出 dict（row_format="row" 时为 Row）
+
+        提前结束迭代（如客户端断开）时会关闭游标并归还连接。
+        请求被取消时正在线程中读取的那一批不会中断，读完后立即关闭，关闭这一步不受取消影响。
+        '''
+        if row_format == "columns":
+            raise ValueError("逐行流式查询不支持 columns 格式")
+        batches = self.database.stream_batches(sql, params, arraysize, row_format)
+        pending = None
         try:
-            cursor.execute(sql, params or ())
-            return cursor.rowcount
-        except Exception as e:
-            print(f"更新失败: {e}")
-            raise e
+            while True:
+                pending = asyncio.ensure_future(self.run(next, batches, None))
+                batch = await asyncio.shield(pending)
+                if batch is None:
+                    break
+                for row in batch:
+                    yield row
         finally:
-            cursor.close()
+            closing = asyncio.ensure_future(self._close_batches(pending, batches))
+            self._closing.add(closing)
+            closing.add_done_callback(self._closing.discard)
+            await asyncio.shield(closing)
+
+    async def _close_batches(self, pending, batches):
+        '''等正在读取的一批结束（生成器不能在执行中关闭），再关闭游标、归还连接'''
+        if pending is not None:
+            try:
+                await pending
+            except BaseException:
+                pass
+        await self.run(batches.close)
+
+    def shutdown(self):
+        '''关闭线程池'''
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
 
 # 全局数据库实例
-db = Database()
\ No newline at end of file
+db = Database()
+async_db = AsyncDatabase(db)
+metrics.db_pool_connections.set_collector(db.pool_stats)
@@ -0,0 +1,75 @@
+import os
+import threading
+
+from database import db, async_db
+
+
+class IdAllocator:
+    """基于 SEQUENCE 的号段（hi/lo）ID 分配器
+
+    每次通过 sys.sp_sequence_get_range 向数据库预留 block_size 个连续 ID（一次往返），
+    之后在进程内依次发放，用完再预留下一段。多个进程/worker 各自持有不同号段，
+    不会产生主键冲突，也不再需要 MAX(id)+1 这种串行化的取号方式。
+    进程退出时未用完的号段会被跳过，ID 可能不连续。
+    """
+
+    RANGE_SQL = """
+        SET NOCOUNT ON;
+        DECLARE @first SQL_VARIANT;
+        EXEC sys.sp_sequence_get_range
+            @sequence_name = ?,
+            @range_size = ?,
+            @range_first_value = @first OUTPUT;
+        SELECT CAST(@first AS BIGINT) AS first_value;
+    """
+
+    def __init__(self, sequence_name, block_size=100, database=None):
+        self.sequence_name = sequence_name
+        self.block_size = block_size
+        self.database = database or db
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+        self.reservations = 0
+
+    def _reserve(self):
+        row = self.database.fetch_one(self.RANGE_SQL, (self.sequence_name, self.block_size))
+        if not row or row["first_value"] is None:
+            raise RuntimeError(f"预留ID失败: {self.sequence_name}")
+        first = int(row["first_value"])
+        self._next = first
+        self._end = first + self.block_size
+        self.reservations += 1
+
+    def take(self):
+        """从当前号段取一个 ID，号段用完返回 None（不访问数据库）"""
+        with self._lock:
+            if self._next < self._end:
+                value = self._next
+                self._next += 1
+                return value
+        return None
+
+    def next_id(self):
+        """取下一个 ID，号段用完时同步预留新号段"""
+        with self._lock:
+            if self._next >= self._end:
+                self._reserve()
+            value = self._next
+            self._next += 1
+            return value
+
+    async def next_id_async(self):
+        """异步取号：号段内直接返回，需要预留时放到数据库线程池执行"""
+        value = self.take()
+        if value is not None:
+            return value
+        return await async_db.run(self.next_id)
+
+
+_block_size = int(os.getenv("ID_BLOCK_SIZE", "100"))
+
+# 各表的 ID 分配器（序列见 database/id_allocator.sql）
+address_ids = IdAllocator("dbo.seq_Address", block_size=_block_size)
+# 购物车批量修改的新记录（由应用端按号段分配，随修改列表一起传入批量 SQL）
+cart_ids = IdAllocator("dbo.seq_Cart", block_size=_block_size)
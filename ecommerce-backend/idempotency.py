@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+
+from fastapi import HTTPException
+from starlette.responses import Response
+
+from database import async_db
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# 1~64 个可见 ASCII 字符（UUID、ULID 等都满足）
+_KEY_PATTERN = re.compile(r"^[\x21-\x7e]{1,64}$")
+
+# 占用幂等键：不存在时插入一条“处理中”记录；已过期（结果过期或处理中超时）时重新占用
+CLAIM_SQL = """
+    MERGE dbo.IdempotencyKey WITH (HOLDLOCK) AS t
+    USING (SELECT ? AS user_id, ? AS idempotency_key) AS s
+    ON t.user_id = s.user_id AND t.idempotency_key = s.idempotency_key
+    WHEN MATCHED AND t.expire_time < SYSUTCDATETIME() THEN
+        UPDATE SET request_hash = ?, status_code = NULL, response = NULL,
+                   expire_time = DATEADD(SECOND, ?, SYSUTCDATETIME())
+    WHEN NOT MATCHED THEN
+        INSERT (user_id, idempotency_key, request_hash, expire_time)
+        VALUES (s.user_id, s.idempotency_key, ?, DATEADD(SECOND, ?, SYSUTCDATETIME()));
+"""
+
+LOOKUP_SQL = """
+    SELECT request_hash, status_code, response
+    FROM dbo.IdempotencyKey
+    WHERE user_id = ? AND idempotency_key = ?
+"""
+
+COMPLETE_SQL = """
+    UPDATE dbo.IdempotencyKey
+    SET status_code = ?, response = ?, expire_time = DATEADD(SECOND, ?, SYSUTCDATETIME())
+    WHERE user_id = ? AND idempotency_key = ?
+"""
+
+RELEASE_SQL = """
+    DELETE FROM dbo.IdempotencyKey
+    WHERE user_id = ? AND idempotency_key = ? AND status_code IS NULL
+"""
+
+PURGE_SQL = "DELETE TOP (?) FROM dbo.IdempotencyKey WHERE expire_time < SYSUTCDATETIME()"
+
+
+class IdempotencyStore:
+    """Idempotency-Key 请求头的结果存储（表结构见 database/idempotency.sql）
+
+    - 同一用户的同一个键第一次到达时占用该键并执行，结果（状态码 + 响应体）写回表中保留 ttl 秒；
+    - 之后带同一个键的请求直接返回保存的响应（响应头 Idempotent-Replayed: true），不再执行下单/支付；
+    - 第一次请求仍在处理中时返回 409，客户端稍后重试即可；同一个键换了请求内容返回 422；
+    - 执行结果为 4xx 时同样保存（重试也会得到同样的结果），5xx 或异常时释放该键，允许客户端重试。
+    处理中的记录最多占用 lease 秒，进程在处理中退出时，超时后同一个键可以重新占用。
+    cleanup_interval 秒删除一次过期记录，<= 0 时不启动后台任务。
+    """
+
+    def __init__(self, ttl=86400, lease=60, cleanup_interval=600, purge_batch=1000):
+        self.ttl = ttl
+        self.lease = lease
+        self.cleanup_interval = cleanup_interval
+        self.purge_batch = purge_batch
+        self.replays = 0
+        self.conflicts = 0
+        self.purged = 0
+        self._task = None
+
+    @staticmethod
+    def fingerprint(request):
+        """请求内容的 SHA-256（接口名 + 参数），用来发现同一个键被用于不同的请求"""
+        body = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(body.encode("utf-8")).digest()
+
+    async def run(self, user_id, key, request, operation):
+        """带幂等键执行 operation()（返回协程的无参函数）；key 为 None 时直接执行"""
+        if key is None:
+            return await operation()
+        if not _KEY_PATTERN.match(key):
+            raise HTTPException(status_code=400, detail="Idempotency-Key 格式不正确（1~64 个可见字符）")
+
+        request_hash = self.fingerprint(request)
+        # 占用失败且记录恰好被清理/释放时再试一次
+        for _ in range(3):
+            if await self._claim(user_id, key, request_hash):
+                break
+            stored = await async_db.fetch_one(LOOKUP_SQL, (user_id, key))
+            if stored is not None:
+                return self._replay(stored, request_hash)
+        else:
+            raise HTTPException(status_code=409, detail="相同幂等键的请求正在处理中", headers={"Retry-After": "1"})
+
+        try:
+            result = await operation()
+        except HTTPException as e:
+            if e.status_code < 500:
+                await self._complete(user_id, key, e.status_code, {"detail": e.detail})
+            else:
+                await self._release(user_id, key)
+            raise
+        except BaseException:
+            await self._release(user_id, key)
+            raise
+        await self._complete(user_id, key, 200, result)
+        return result
+
+    async def _claim(self, user_id, key, request_hash):
+        rowcount = await async_db.retry(
+            lambda: async_db.execute_update(
+                CLAIM_SQL, (user_id, key, request_hash, self.lease, request_hash, self.lease)
+            ),
+            name="idempotency_claim",
+        )
+        return rowcount > 0
+
+    def _replay(self, stored, request_hash):
+        if bytes(stored["request_hash"]) != request_hash:
+            self.conflicts += 1
+            raise HTTPException(status_code=422, detail="该 Idempotency-Key 已用于不同的请求")
+        if stored["status_code"] is None:
+            raise HTTPException(status_code=409, detail="相同幂等键的请求正在处理中", headers={"Retry-After": "1"})
+        self.replays += 1
+        return Response(
+            content=bytes(stored["response"]),
+            status_code=stored["status_code"],
+            media_type="application/json",
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    async def _complete(self, user_id, key, status_code, content):
+        # 下单/支付已经完成，结果写不回去时只记录日志：键在 lease 到期后可以重新占用，
+        # 重新执行时存储过程会因购物车已空 / 订单已支付而返回 4xx，不会重复下单或扣款
+        try:
+            await async_db.execute_update(COMPLETE_SQL, (status_code, dumps(content), self.ttl, user_id, key))
+        except Exception:
+            logger.exception("保存幂等结果失败", extra={"user_id": user_id, "idempotency_key": key})
+
+    async def _release(self, user_id, key):
+        try:
+            await async_db.execute_update(RELEASE_SQL, (user_id, key))
+        except Exception:
+            logger.exception("释放幂等键失败", extra={"user_id": user_id, "idempotency_key": key})
+
+    async def purge(self):
+        """分批删除过期记录，返回删除的行数"""
+        total = 0
+        while True:
+            deleted = await async_db.execute_update(PURGE_SQL, (self.purge_batch,))
+            total += max(deleted, 0)
+            if deleted < self.purge_batch:
+                break
+        self.purged += total
+        return total
+
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                deleted = await self.purge()
+                if deleted:
+                    logger.info("已清理 %d 条过期幂等记录", deleted)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("清理过期幂等记录失败")
+
+    def start(self):
+        if self.cleanup_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 全局幂等键存储
+idempotency_store = IdempotencyStore(
+    ttl=int(os.getenv("IDEMPOTENCY_TTL", "86400")),
+    lease=int(os.getenv("IDEMPOTENCY_LEASE", "60")),
+    cleanup_interval=float(os.getenv("IDEMPOTENCY_CLEANUP_INTERVAL", "600")),
+)
@@ -0,0 +1,105 @@
+# load_test.py
+# 事件循环阻塞压测：对比 /api/products/ 在“空闲”与“订单接口请求进行中”两种情况下的延迟
+# 用法（先启动 main.py）：
+#   python load_test.py --username alice --password passw0rd
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def http_get(url, token=None, timeout=60):
+    req = urllib.request.Request(url)
+    if token:
+        req.add_header("Authorization", f"Bearer {token}")
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return resp.read()
+
+
+def login(base_url, username, password):
+    data = json.dumps({"username": username, "password": password}).encode()
+    req = urllib.request.Request(
+        f"{base_url}/api/auth/login", data=data,
+        headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        return json.loads(resp.read())["access_token"]
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def measure_products(base_url, requests, concurrency):
+    '''并发请求商品列表，返回每次请求的耗时（毫秒）'''
+    def one(_):
+        start = time.perf_counter()
+        http_get(f"{base_url}/api/products/?page=1&page_size=20")
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(requests)))
+
+
+def report(title, latencies):
+    print(f"{title}: n={len(latencies)} "
+          f"p50={percentile(latencies, 50):.1f}ms "
+          f"p99={percentile(latencies, 99):.1f}ms "
+          f"max={max(latencies):.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="事件循环阻塞压测")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--slow-clients", type=int, default=4,
+                        help="同时循环请求 /api/orders/ 的客户端数")
+    args = parser.parse_args()
+
+    token = login(args.base_url, args.username, args.password)
+
+    # 预热
+    measure_products(args.base_url, 20, 4)
+
+    baseline = measure_products(args.base_url, args.requests, args.concurrency)
+    report("空闲时 /api/products/", baseline)
+
+    stop = threading.Event()
+    slow_latencies = []
+
+    def slow_client():
+        while not stop.is_set():
+            start = time.perf_counter()
+            http_get(f"{args.base_url}/api/orders/?page=1&page_size=100", token)
+            slow_latencies.append((time.perf_counter() - start) * 1000)
+
+    slow_threads = [threading.Thread(target=slow_client, daemon=True)
+                    for _ in range(args.slow_clients)]
+    for t in slow_threads:
+        t.start()
+    try:
+        loaded = measure_products(args.base_url, args.requests, args.concurrency)
+    finally:
+        stop.set()
+        for t in slow_threads:
+            t.join()
+
+    report("订单请求进行中 /api/products/", loaded)
+    if slow_latencies:
+        report("/api/orders/", slow_latencies)
+
+    ratio = percentile(loaded, 99) / max(percentile(baseline, 99), 0.001)
+    print(f"p99 比值（进行中/空闲）: {ratio:.2f}")
+
+
+if __name__ == "__main__":
+    main()
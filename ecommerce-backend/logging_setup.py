@@ -0,0 +1,184 @@
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+import metrics
+
+# 日志配置
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# 按模块覆盖级别，如 "orders=DEBUG,database=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# json（默认，一行一个 JSON）/ text（开发时阅读方便）
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# 队列满时直接丢弃新日志（计入 log_records_dropped_total），不阻塞请求
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# DEBUG 日志的采样率（0~1），可按模块覆盖，如 "orders=0.01,cart=0.1"
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+LOG_DEBUG_SAMPLE_RATES = os.getenv("LOG_DEBUG_SAMPLE_RATES", "")
+
+# LogRecord 自带的属性，其余属性（extra=...）作为结构化字段输出
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "request_id", "route"}
+
+log_records = metrics.Counter(
+    "log_records_total", "写入日志队列的日志数", ("level",))
+log_dropped = metrics.Counter(
+    "log_records_dropped_total", "日志队列已满被丢弃的日志数")
+log_sampled_out = metrics.Counter(
+    "log_records_sampled_out_total", "DEBUG 日志被采样丢弃的条数")
+log_queue_depth = metrics.Gauge(
+    "log_queue_depth", "日志队列中等待写出的条数")
+
+
+def _parse_mapping(value):
+    """解析 "a=1,b.c=2" 形式的按模块配置"""
+    mapping = {}
+    for item in value.split(","):
+        name, sep, setting = item.partition("=")
+        if sep and name.strip():
+            mapping[name.strip()] = setting.strip()
+    return mapping
+
+
+class RequestContextFilter(logging.Filter):
+    """在调用线程中给日志补上请求 ID 和路由（入队前执行，经 contextvars 取当前请求）"""
+
+    def filter(self, record):
+        stats = metrics.current_request.get()
+        record.request_id = stats.request_id if stats is not None else None
+        record.route = stats.route if stats is not None else None
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """按模块对 DEBUG 日志采样，高频调试路径只保留一部分，INFO 及以上不受影响"""
+
+    def __init__(self, default_rate=1.0, rates=None):
+        super().__init__()
+        self.default_rate = default_rate
+        self.rates = {name: float(rate) for name, rate in (rates or {}).items()}
+        self._cache = {}
+
+    def _rate(self, name):
+        rate = self._cache.get(name)
+        if rate is None:
+            # 取最长匹配的模块前缀（orders.create 匹配 orders）
+            rate = self.default_rate
+            best = -1
+            for prefix, value in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+                    rate, best = value, len(prefix)
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        log_sampled_out.inc()
+        return False
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """调用线程只做格式化参数和入队，写出由后台线程完成；队列满时丢弃"""
+
+    def prepare(self, record):
+        # 与父类相同：在调用线程里把消息和异常转成字符串，但保留 extra 字段，异常单独放在 exc_text
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.message = message
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_dropped.inc()
+            return
+        log_records.inc(record.levelname)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+            entry["route"] = record.route
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record):
+        if not hasattr(record, "request_id") or record.request_id is None:
+            record.request_id = "-"
+        return super().format(record)
+
+
+_listener = None
+
+
+def setup_logging():
+    """配置根日志：QueueHandler 入队 + QueueListener 后台线程写 stdout
+
+    重复调用只生效一次。uvicorn 自己的日志（uvicorn.*）保持原有配置。
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    log_queue_depth.set_collector(lambda: {(): log_queue.qsize()})
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+
+    handler = BoundedQueueHandler(log_queue)
+    # 先采样，被丢弃的 DEBUG 日志不再做后续处理
+    handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_RATE, _parse_mapping(LOG_DEBUG_SAMPLE_RATES)))
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_mapping(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """停止后台写出线程（会先写完队列中剩余的日志）"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
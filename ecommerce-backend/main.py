@@ -1,36 +1,52 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.security import OAuth2PasswordBearer
 from contextlib import asynccontextmanager
+import logging
 import uvicorn
 from dotenv import load_dotenv
 
-from database import db
+from database import db, async_db
 from auth import router as auth_router, global_exception_handler
 from products import router as products_router
 from cart import router as cart_router
 from orders import router as orders_router
 from user import router as user_router  # 🔧 新增：导入 user 路由
+from admin import router as admin_router
+from reports import router as reports_router
+from search import search_backend
+from sales_rollup import sales_rollup
+from product_sales import product_sales_reconciler
+from idempotency import idempotency_store
+from metrics import MetricsMiddleware, render as render_metrics
+from logging_setup import setup_logging, shutdown_logging
+from passwords import password_hasher
+from responses import FastJSONResponse, FastJSONRoute
 
 # 加载环境变量
 load_dotenv()
 
+logger = logging.getLogger("main")
+
 # 应用生命周期
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # 启动时
-    print("🚀 启动电商系统API...")
-    print("📊 数据库连接测试...")
+    # 启动时：先创建密码哈希进程池（bcrypt 不在事件循环中执行），此时进程内还没有其他线程
+    await password_hasher.start()
+    # 日志经队列由后台线程写出
+    setup_logging()
+    logger.info("启动电商系统API，测试数据库连接")
     
     try:
         # 测试数据库连接
-        result = db.execute_query("SELECT @@VERSION as version")
-        print(f"✅ 数据库连接成功: {result[0]['version'][:50]}...")
+        result = await async_db.execute_query("SELECT @@VERSION as version")
+        logger.info("数据库连接成功: %s", result[0]["version"][:50])
         
         # 测试表是否存在
         import os
         db_name = os.getenv("DB_NAME", "权限实验")
-        tables = db.execute_query("""
+        tables = await async_db.execute_query("""
 
             SELECT TABLE_NAME 
             FROM INFORMATION_SCHEMA.TABLES 
@@ -38,17 +54,38 @@ async def lifespan(app: FastAPI):
             AND TABLE_CATALOG = ?
             ORDER BY TABLE_NAME
         """, (db_name,))
-        print(f"📁 数据库中有 {len(tables)} 张表")
+        logger.info("数据库中有 %d 张表", len(tables))
         
     except Exception as e:
-        print(f"❌ 数据库连接失败: {e}")
+        logger.critical("数据库连接失败: %s", e)
+        shutdown_logging()
         raise
     
+    # 预热搜索索引（memory 后端启动时全量加载，失败不影响启动，首次搜索时重试）
+    try:
+        await search_backend.ensure_fresh()
+        logger.info("商品搜索后端: %s", search_backend.name)
+    except Exception as e:
+        logger.exception("商品搜索索引加载失败")
+    
+    # 销售汇总后台任务（按水位增量刷新 SalesDailyRollup 等汇总表）
+    sales_rollup.start()
+    # 商品销量计数定期与 vw_TopSellingProducts 对账
+    product_sales_reconciler.start()
+    # 过期幂等记录定期清理
+    idempotency_store.start()
+    
     yield
     
     # 关闭时
+    await sales_rollup.stop()
+    await product_sales_reconciler.stop()
+    await idempotency_store.stop()
+    password_hasher.shutdown()
+    async_db.shutdown()
     db.close()
-    print("👋 关闭数据库连接")
+    logger.info("服务已停止")
+    shutdown_logging()
 
 app = FastAPI(
     title="电商系统API",
@@ -57,6 +94,8 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     lifespan=lifespan,
+    # 所有接口默认用 orjson 序列化（见 responses.py）
+    default_response_class=FastJSONResponse,
     # 改为离线模式
     swagger_js_url=None,    # 不加载外部JS
     swagger_css_url=None,   # 不加载外部CSS
@@ -64,6 +103,9 @@ app = FastAPI(
     # swagger_favicon_url="https://fastapi.tiangolo.com/img/favicon.png"
 )
 
+# 根应用上的接口（/、/health 等）同样跳过 jsonable_encoder
+app.router.route_class = FastJSONRoute
+
 # 注册全局异常处理器
 app.exception_handler(Exception)(global_exception_handler)
 
@@ -79,14 +121,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # 允许所有方法
     allow_headers=["*"],  # 允许所有头
+    expose_headers=["X-Request-ID", "X-DB-Queries", "X-DB-Time-Ms", "Idempotent-Replayed"],
 )
 
+# 请求指标（最外层，耗时包含 CORS 等中间件）
+app.add_middleware(MetricsMiddleware, router=app.router)
+
 # 注册路由
 app.include_router(auth_router, prefix="/api")
 app.include_router(products_router, prefix="/api")
 app.include_router(cart_router, prefix="/api")
 app.include_router(orders_router, prefix="/api")
 app.include_router(user_router, prefix="/api")  # 🔧 新增：注册 user 路由
+app.include_router(admin_router, prefix="/api")
+app.include_router(reports_router, prefix="/api")
 
 # 根路由
 @app.get("/")
@@ -101,16 +149,23 @@ async def root():
             "/api/products/* - 商品管理",
             "/api/cart/* - 购物车",
             "/api/orders/* - 订单管理",
-            "/api/user/* - 用户管理"  # 🔧 新增：用户管理端点
+            "/api/user/* - 用户管理",  # 🔧 新增：用户管理端点
+            "/api/admin/* - 管理报表",
+            "/api/admin/reports/* - 销售统计"
         ]
     }
 
+# Prometheus 指标
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # 健康检查
 @app.get("/health")
 async def health_check():
     try:
         # 测试数据库
-        db.execute_query("SELECT 1")
+        await async_db.execute_query("SELECT 1")
         return {
             "status": "healthy",
             "database": "connected",
@@ -139,7 +194,9 @@ async def api_info():
             "user - 用户管理模块",
             "products - 商品管理模块",
             "cart - 购物车模块",
-            "orders - 订单管理模块"
+            "orders - 订单管理模块",
+            "admin - 管理报表模块",
+            "reports - 销售统计模块"
         ]
     }
 
@@ -149,17 +206,17 @@ async def test_database():
     """测试数据库连接和基本查询"""
     try:
         # 测试用户表
-        users = db.execute_query("SELECT TOP 3 user_id, username, email FROM [User]")
+        users = await async_db.execute_query("SELECT TOP 3 user_id, username, email FROM [User]")
         
         # 测试商品表
-        products = db.execute_query("SELECT TOP 3 product_id, product_name, price FROM Product WHERE product_status = 1")
+        products = await async_db.execute_query("SELECT TOP 3 product_id, product_name, price FROM Product WHERE product_status = 1")
         
         # 测试地址表
-        addresses = db.execute_query("SELECT TOP 3 address_id, receiver_name, receiver_phone FROM Address")
+        addresses = await async_db.execute_query("SELECT TOP 3 address_id, receiver_name, receiver_phone FROM Address")
         
         # 测试存储过程（如果存在）
         try:
-            proc_test = db.execute_query("EXEC sp_help 'User'")
+            proc_test = await async_db.execute_query("EXEC sp_help 'User'")
             proc_status = "可用"
         except:
             proc_status = "不可用或出错"
@@ -0,0 +1,336 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+
+from starlette.routing import Match
+
+# 延迟直方图的桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 每个请求的查询次数直方图的桶
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+SLOW_QUERY_SECONDS = float(os.getenv("DB_SLOW_QUERY_MS", "500")) / 1000
+MAX_QUERIES_PER_REQUEST = int(os.getenv("METRICS_MAX_QUERIES_PER_REQUEST", "20"))
+# 不同 SQL 语句的最大跟踪数，超出后归入 other，避免标签无限增长
+MAX_STATEMENTS = 2000
+
+logger = logging.getLogger("metrics")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """按标签值分组的指标，线程安全"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, labels)} {value}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), collect=None):
+        super().__init__(name, documentation, labels)
+        self._collect = collect  # 输出时再取值的回调，返回 {标签元组: 值}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    def set_collector(self, collect):
+        self._collect = collect
+
+    def _samples(self):
+        values = self._values
+        if self._collect is not None:
+            values = {**values, **self._collect()}
+        for labels, value in values.items():
+            yield f"{self.name}{_format_labels(self.labels, labels)} {value}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * len(self.buckets), 0, 0.0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            entry[1] += 1
+            entry[2] += value
+
+    def _samples(self):
+        for labels, (counts, count, total) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {count}"
+            yield f"{self.name}_count{_format_labels(self.labels, labels)} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labels, labels)} {total}"
+
+
+REGISTRY = []
+
+http_requests = Counter(
+    "http_requests_total", "HTTP 请求数", ("method", "route", "status"))
+http_latency = Histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时（到响应体发送完毕）", ("method", "route"))
+http_in_flight = Gauge(
+    "http_requests_in_flight", "正在处理的 HTTP 请求数", ("method", "route"))
+http_queries = Histogram(
+    "http_request_db_queries", "每个请求的数据库往返次数", ("route",), QUERY_COUNT_BUCKETS)
+http_query_heavy = Counter(
+    "http_requests_query_heavy_total", "数据库往返次数超过阈值的请求数", ("route",))
+
+db_latency = Histogram(
+    "db_statement_duration_seconds", "SQL 语句执行耗时（不含等待连接）", ("operation", "statement"))
+db_rows = Counter(
+    "db_statement_rows_total", "SQL 语句返回或影响的行数", ("operation", "statement"))
+db_errors = Counter(
+    "db_statement_errors_total", "SQL 语句执行失败次数", ("operation", "statement"))
+db_slow = Counter(
+    "db_slow_statements_total", "超过慢查询阈值的语句数", ("operation", "statement"))
+db_pool_wait = Histogram(
+    "db_pool_wait_seconds", "从连接池借连接的等待时间")
+db_pool_connections = Gauge(
+    "db_pool_connections", "连接池连接数", ("state",))
+db_retries = Counter(
+    "db_retries_total", "死锁 / 快照冲突后的自动重试次数", ("statement",))
+db_prepared = Counter(
+    "db_prepared_statements_total", "注册语句在池化连接上的准备（编译）与执行次数", ("statement", "event"))
+db_statement_info = Gauge(
+    "db_statement_info", "语句标识对应的 SQL 片段", ("statement", "sql"))
+
+
+class RequestStats:
+    """单个请求内的数据库统计和请求 ID，经 contextvars 传到数据库线程池中"""
+
+    __slots__ = ("route", "request_id", "queries", "rows", "db_seconds", "pool_wait_seconds", "_lock")
+
+    def __init__(self, route="", request_id=None):
+        self.route = route
+        self.request_id = request_id
+        self.queries = 0
+        self.rows = 0
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds, rows):
+        with self._lock:
+            self.queries += 1
+            self.rows += rows
+            self.db_seconds += seconds
+
+    def add_pool_wait(self, seconds):
+        with self._lock:
+            self.pool_wait_seconds += seconds
+
+
+current_request = ContextVar("current_request", default=None)
+
+_statements = {}
+_statements_lock = threading.Lock()
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+def statement_id(operation, sql):
+    """把 SQL 归一成稳定的短标识：存储过程用过程名，其余用归一化后 SQL 的哈希
+
+    IN (?, ?, ?) 这类长度可变的占位符列表视为同一条语句。
+    """
+    key = (operation, sql)
+    statement = _statements.get(key)
+    if statement is not None:
+        return statement
+    if operation == "proc":
+        statement = sql
+    else:
+        normalized = _PLACEHOLDER_LIST.sub("?+", _WHITESPACE.sub(" ", sql).strip())
+        statement = "sql_" + hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:10]
+        with _statements_lock:
+            if len(_statements) >= MAX_STATEMENTS:
+                return "other"
+            db_statement_info.set(statement, normalized[:160], value=1)
+    _statements[key] = statement
+    return statement
+
+
+def observe_query(operation, sql, started, rows=0, error=False, name=None):
+    """记录一次数据库往返（Database 的各个执行方法调用），注册语句（queries.py）以 name 作为标识"""
+    elapsed = time.perf_counter() - started
+    statement = name or statement_id(operation, sql)
+    db_latency.observe(operation, statement, value=elapsed)
+    if error:
+        db_errors.inc(operation, statement)
+    elif rows:
+        db_rows.inc(operation, statement, amount=rows)
+
+    stats = current_request.get()
+    if stats is not None:
+        stats.add_query(elapsed, rows)
+
+    if elapsed >= SLOW_QUERY_SECONDS:
+        db_slow.inc(operation, statement)
+        logger.warning(
+            "慢查询 %.0fms [%s]: %s", elapsed * 1000, statement, _WHITESPACE.sub(" ", sql).strip()[:200],
+            extra={"statement": statement, "elapsed_ms": round(elapsed * 1000, 1), "rows": rows},
+        )
+
+
+def observe_prepared(name, fresh):
+    """注册语句执行一次；fresh 表示这是该语句在这个连接上的首次执行（需要准备）"""
+    if fresh:
+        db_prepared.inc(name, "prepare")
+    db_prepared.inc(name, "execute")
+
+
+def observe_pool_wait(started):
+    elapsed = time.perf_counter() - started
+    db_pool_wait.observe(value=elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.add_pool_wait(elapsed)
+
+
+def match_route(router, scope):
+    """按路由表匹配出路由模板（与 Starlette 路由的匹配顺序一致）"""
+    partial = None
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+        if match == Match.PARTIAL and partial is None:
+            partial = getattr(route, "path", None)
+    return partial or "unmatched"
+
+
+def _request_id(scope):
+    """沿用上游传入的 X-Request-ID（截断到 64 字符），没有则生成"""
+    for name, value in scope.get("headers", ()):
+        if name == b"x-request-id":
+            value = value.decode("latin-1").strip()[:64]
+            if value and value.isprintable():
+                return value
+            break
+    return uuid.uuid4().hex[:16]
+
+
+class MetricsMiddleware:
+    """记录每个路由的请求数、耗时和并发数，并统计请求内的数据库往返
+
+    路由标签使用路由模板（如 /api/orders/{order_id}），不会因路径参数产生大量标签。
+    响应头 X-DB-Queries / X-DB-Time-Ms 给出本请求到开始响应为止的查询次数和数据库耗时，
+    X-Request-ID 与本请求日志中的 request_id 一致。
+    """
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = match_route(self.router, scope)
+        stats = RequestStats(route, _request_id(scope))
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", stats.request_id.encode("latin-1")))
+                headers.append((b"x-db-queries", str(stats.queries).encode()))
+                headers.append((b"x-db-time-ms", f"{stats.db_seconds * 1000:.1f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        http_in_flight.inc(method, route)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec(method, route)
+            elapsed = time.perf_counter() - started
+            http_requests.inc(method, route, str(status_code))
+            http_latency.observe(method, route, value=elapsed)
+            http_queries.observe(route, value=stats.queries)
+            if stats.queries > MAX_QUERIES_PER_REQUEST:
+                http_query_heavy.inc(route)
+                logger.warning(
+                    "请求 %s %s 访问数据库 %d 次（阈值 %d）", method, route, stats.queries, MAX_QUERIES_PER_REQUEST,
+                    extra={"queries": stats.queries, "db_ms": round(stats.db_seconds * 1000, 1)},
+                )
+            current_request.reset(token)
+
+
+def render():
+    """Prometheus 文本格式"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
@@ -25,7 +25,7 @@ class UserRegister(BaseModel):
     password: str
     phone: str
     email: str
-    user_type: int = 0
+    user_type: int = 0  # 已忽略，注册接口总是创建普通用户（见 auth.register）
 
 class ProductSearch(BaseModel):
     keyword: Optional[str] = None
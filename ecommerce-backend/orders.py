@@ -1,55 +1,120 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
 from typing import Optional, List
+import logging
+import json
 
-from database import db
+from database import async_db, is_retryable
+import queries
+from responses import FastJSONRoute
 from models import OrderCreate
-from auth import get_current_user
+from auth import get_current_user, get_current_user_claims
+from pagination import encode_cursor, decode_cursor, InvalidCursor
+from cart_cache import cart_cache
+from idempotency import idempotency_store
 
-router = APIRouter(prefix="/orders", tags=["订单"])
+router = APIRouter(prefix="/orders", tags=["订单"], route_class=FastJSONRoute)
+
+logger = logging.getLogger(__name__)
+
+def busy_error():
+    """死锁 / 快照冲突重试用尽时返回 503，客户端可带同一个 Idempotency-Key 重试"""
+    return HTTPException(status_code=503, detail="系统繁忙，请稍后重试", headers={"Retry-After": "1"})
 
 @router.get("/")
 async def get_orders(
     status: Optional[int] = None,
     page: int = 1,
     page_size: int = 10,
-    current_user: dict = Depends(get_current_user)
+    use_cursor: bool = False,
+    cursor: Optional[str] = None,
+    include_items: bool = True,
+    current_user: dict = Depends(get_current_user_claims)
 ):
-    """获取用户订单列表"""
+    """获取用户订单列表
+
+    传 use_cursor=true 或 cursor 时使用游标分页，按 (create_time, order_id) 倒序 seek。
+    include_items=false 时不返回商品明细，只返回 SQL 统计的 item_count。
+    """
     try:
-        print(f"=== 调试订单列表 ===")
+        # 不需要明细时由 SQL 直接统计商品数（counted 变体）
+        items_variant = "items" if include_items else "counted"
         
-        # 使用直接SQL查询，避免存储过程格式问题
-        offset = (page - 1) * page_size
+        cursor_mode = use_cursor or cursor is not None
+        next_cursor = None
+        total_count = None
         
-        # 查询订单列表
-        orders = db.execute_query('SELECT o.order_id, o.user_id, o.address_id, o.total_amount, o.order_status, o.create_time, o.pay_time, o.ship_time, a.receiver_name, a.receiver_phone, a.detail_address FROM [Order] o LEFT JOIN Address a ON o.address_id = a.address_id WHERE o.user_id = ? ORDER BY o.create_time DESC OFFSET ? ROWS FETCH NEXT ? ROWS ONLY', (current_user["user_id"], offset, page_size))
-        
-        # 查询总数
-        count_result = db.execute_query('SELECT COUNT(*) AS total_count FROM [Order] o WHERE o.user_id = ?', (current_user["user_id"],))
+        if cursor_mode:
+            # 游标分页：从上一页最后一条 (create_time, order_id) 之后继续取
+            page_variant = "first"
+            params = [page_size + 1, current_user["user_id"]]
+            if cursor:
+                try:
+                    last_time, last_id = decode_cursor(cursor, "orders", 2)
+                except InvalidCursor as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                page_variant = "next"
+                params.extend([last_time, last_time, last_id])
+            
+            orders = await async_db.execute_query(queries.order_list(items_variant, page_variant), params)
+            
+            if len(orders) > page_size:
+                orders = orders[:page_size]
+                last = orders[-1]
+                next_cursor = encode_cursor("orders", [last["create_time"], last["order_id"]])
+        else:
+            # 使用直接SQL查询，避免存储过程格式问题
+            offset = (page - 1) * page_size
+            
+            # 查询订单列表，总数由窗口函数一并返回
+            orders = await async_db.execute_query(queries.order_list(items_variant, "offset"), (current_user["user_id"], offset, page_size))
+            
+            if orders:
+                total_count = orders[0]["total_count"]
+                for order in orders:
+                    del order["total_count"]
+            else:
+                # 页码越界时单独查询总数
+                count_result = await async_db.execute_query(queries.ORDER_COUNT, (current_user["user_id"],))
+                total_count = count_result[0]["total_count"] if count_result else 0
         
-        total_count = count_result[0]["total_count"] if count_result else 0
+        # 一次查询整页订单的商品，按 order_id 分组
+        items_by_order = {}
+        if include_items and orders:
+            order_ids = json.dumps([order["order_id"] for order in orders])
+            for item in await async_db.execute_query(queries.ORDER_ITEMS, (order_ids,)):
+                items_by_order.setdefault(item["order_id"], []).append(item)
         
         # 处理每个订单，添加必要的字段
         processed_orders = []
         for order in orders:
-            # 获取订单商品
-            items_sql = 'SELECT oi.item_id, oi.order_id, oi.product_id, oi.order_quantity AS quantity, oi.unit_price, oi.subtotal, p.image AS product_image, p.product_name FROM OrderItem oi LEFT JOIN Product p ON oi.product_id = p.product_id WHERE oi.order_id = ?'
-            items = db.execute_query(items_sql, (order["order_id"],))
-            
             # 构建完整的订单数据
             processed_order = {
                 **order,
                 "order_no": f"ORD{order['order_id']:08d}",  # 添加订单号
                 "shipping_fee": 0.0,  # 默认值
                 "final_amount": order["total_amount"],  # 默认值
-                "items": items,  # 添加商品列表
-                "item_count": len(items)  # 添加商品数量
             }
+            if include_items:
+                items = items_by_order.get(order["order_id"], [])
+                processed_order["items"] = items  # 添加商品列表
+                processed_order["item_count"] = len(items)  # 添加商品数量
             
             processed_orders.append(processed_order)
         
-        print(f"查询到的订单数量: {len(processed_orders)}")
-        print(f"总订单数: {total_count}")
+        logger.debug("查询订单列表", extra={
+            "user_id": current_user["user_id"], "count": len(processed_orders), "total": total_count
+        })
+        
+        if cursor_mode:
+            return {
+                "code": 200,
+                "message": "success",
+                "data": {
+                    "items": processed_orders,
+                    "page_size": page_size,
+                    "next_cursor": next_cursor
+                }
+            }
         
         return {
             "code": 200,
@@ -62,52 +127,81 @@ async def get_orders(
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"获取订单列表异常: {str(e)}")
+        logger.exception("获取订单列表异常")
         raise HTTPException(
             status_code=500,
             detail=f"获取订单列表失败: {str(e)}"
         )
+
 @router.post("/")
 async def create_order(
     order_data: OrderCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: dict = Depends(get_current_user)
 ):
-    """创建订单"""
+    """创建订单
+
+    带 Idempotency-Key 请求头时，同一个键只下单一次，重复提交返回第一次的结果（见 idempotency.py），
+    不会再次清空购物车或触发库存扣减。
+    """
+    return await idempotency_store.run(
+        current_user["user_id"], idempotency_key,
+        ["create_order", order_data.model_dump() if hasattr(order_data, "model_dump") else order_data.dict()],
+        lambda: _create_order(order_data, current_user)
+    )
+
+async def _create_order(order_data: OrderCreate, current_user: dict):
     try:
-        print("=== 创建订单调试信息 ===")
-        print(f"用户ID: {current_user['user_id']}")
-        print(f"地址ID: {order_data.address_id}")
-        print(f"购物车ID列表: {order_data.cart_ids}")
-        print(f"配送费: {order_data.shipping_fee}")
-        print(f"备注: {order_data.remark}")
+        logger.debug("创建订单", extra={
+            "user_id": current_user["user_id"],
+            "address_id": order_data.address_id,
+            "cart_ids": order_data.cart_ids,
+        })
 
-        # 调用存储过程 sp_CreateOrder，当前存储过程只接受user_id、address_id和order_id输出参数
-        result = db.execute_proc("sp_CreateOrder", [
+        # 按购物车展示的同一套促销定价下单：成交单价由快照算出，随 @prices 传入存储过程
+        snapshot = await cart_cache.get(current_user["user_id"])
+        prices = json.dumps(snapshot.order_prices())
+        
+        # 调用存储过程 sp_CreateOrder：user_id、address_id、order_id 输出参数和成交单价
+        # 死锁 / 快照冲突时事务已整体回滚，退避后自动重试
+        result = await async_db.retry(lambda: async_db.execute_proc("sp_CreateOrder", [
             current_user["user_id"],
             order_data.address_id,
-            0  # 输出参数占位
-        ])
+            0,  # 输出参数占位
+            prices
+        ]), name="sp_CreateOrder")
         
-        print(f"存储过程返回: {result}")
+        # 下单后购物车已被存储过程清空
+        await cart_cache.clear_items(current_user["user_id"])
         
         if result and len(result) > 0:
             order_info = result[0]
-            print(f"订单创建成功: {order_info}")
+            logger.info("订单创建成功", extra={"user_id": current_user["user_id"], "order": order_info})
             return {
                 "code": 200,
                 "message": "订单创建成功",
                 "data": order_info
             }
         else:
-            print("存储过程返回空结果")
+            logger.error("创建订单：存储过程返回空结果", extra={"user_id": current_user["user_id"]})
             raise HTTPException(status_code=400, detail="订单创建失败")
         
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = str(e)
-        print(f"创建订单异常: {error_msg}")
-        if "购物车为空" in error_msg:
+        logger.warning("创建订单异常: %s", error_msg, extra={"user_id": current_user["user_id"]})
+        if is_retryable(e):
+            raise busy_error()
+        elif "购物车为空" in error_msg:
             raise HTTPException(status_code=400, detail="购物车为空")
+        elif "购物车价格已变化" in error_msg:
+            # 定价后商品改价或购物车被修改：丢弃快照，客户端刷新购物车后重新下单
+            cart_cache.invalidate(current_user["user_id"])
+            raise HTTPException(status_code=400, detail="购物车价格已变化，请刷新后重试")
         elif "地址不存在" in error_msg:
             raise HTTPException(status_code=400, detail="地址不存在")
         else:
@@ -121,10 +215,15 @@ async def pay_order(
     order_id: int,
     payment_method: str = "Online",  # 默认在线支付
     transaction_id: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: dict = Depends(get_current_user)
 ):
+    """支付订单
+
+    带 Idempotency-Key 请求头时，同一个键只支付一次，重复提交返回第一次的结果。
+    """
     # 验证订单属于当前用户
-    order_check = db.execute_query(
+    order_check = await async_db.execute_query(
         "SELECT order_id, user_id FROM [Order] WHERE order_id = ?",
         (order_id,)
     )
@@ -134,14 +233,21 @@ async def pay_order(
     
     if order_check[0]["user_id"] != current_user["user_id"]:
         raise HTTPException(status_code=403, detail="无权支付此订单")
-    """支付订单"""
+    
+    return await idempotency_store.run(
+        current_user["user_id"], idempotency_key,
+        ["pay_order", order_id, payment_method, transaction_id],
+        lambda: _pay_order(order_id, payment_method, transaction_id)
+    )
+
+async def _pay_order(order_id: int, payment_method: str, transaction_id: Optional[str]):
     try:
-        # 调用存储过程 sp_PayOrder(order_id, payment_method, transaction_id)
-        result = db.execute_proc("sp_PayOrder", [
+        # 调用存储过程 sp_PayOrder(order_id, payment_method, transaction_id)，死锁 / 快照冲突时自动重试
+        result = await async_db.retry(lambda: async_db.execute_proc("sp_PayOrder", [
             order_id,
             payment_method,
             transaction_id or ""
-        ])
+        ]), name="sp_PayOrder")
         
         if result and len(result) > 0:
             return {
@@ -152,9 +258,13 @@ async def pay_order(
         else:
             raise HTTPException(status_code=400, detail="支付失败")
         
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = str(e)
-        if "订单状态不正确" in error_msg:
+        if is_retryable(e):
+            raise busy_error()
+        elif "订单状态不正确" in error_msg:
             raise HTTPException(status_code=400, detail="订单状态不正确，无法支付")
         elif "订单不存在" in error_msg:
             raise HTTPException(status_code=404, detail="订单不存在")
@@ -167,12 +277,12 @@ async def pay_order(
 @router.get("/{order_id}")
 async def get_order_detail(
     order_id: int,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user_claims)
 ):
     """获取订单详情"""
     try:
         # 验证订单属于当前用户
-        order_check = db.execute_query(
+        order_check = await async_db.execute_query(
             "SELECT order_id, user_id FROM [Order] WHERE order_id = ?",
             (order_id,)
         )
@@ -192,7 +302,7 @@ async def get_order_detail(
             LEFT JOIN Address a ON o.address_id = a.address_id
             WHERE o.order_id = ?
         """
-        order_info = db.execute_query(order_sql, (order_id,))
+        order_info = await async_db.execute_query(order_sql, (order_id,))
         
         if not order_info:
             raise HTTPException(status_code=404, detail="订单不存在")
@@ -205,14 +315,14 @@ async def get_order_detail(
             LEFT JOIN Product p ON oi.product_id = p.product_id
             WHERE oi.order_id = ?
         """
-        items = db.execute_query(items_sql, (order_id,))
+        items = await async_db.execute_query(items_sql, (order_id,))
         
         # 获取支付信息
         payment_sql = """
             SELECT payment_id, order_id, payment_method, payment_amount, payment_status, payment_time, transaction_id
             FROM Payment WHERE order_id = ? ORDER BY payment_time DESC
         """
-        payments = db.execute_query(payment_sql, (order_id,))
+        payments = await async_db.execute_query(payment_sql, (order_id,))
         
         result = order_info[0]
         # 为缺失字段添加默认值
@@ -0,0 +1,49 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+
+
+class InvalidCursor(ValueError):
+    """游标格式错误或与当前列表不匹配"""
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+        raise InvalidCursor("无效的游标")
+    return value
+
+
+def encode_cursor(kind, values):
+    """把最后一行的 (排序键..., id) 编码成不透明游标"""
+    payload = {"k": kind, "v": [_encode_value(v) for v in values]}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, kind, size):
+    """解码游标，校验列表类型和键数量"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        values = [_decode_value(v) for v in payload["v"]]
+    except InvalidCursor:
+        raise
+    except Exception:
+        raise InvalidCursor("无效的游标")
+    if payload.get("k") != kind or len(values) != size:
+        raise InvalidCursor("游标与当前列表不匹配")
+    return values
@@ -0,0 +1,124 @@
+import asyncio
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+import metrics
+
+# bcrypt 计算轮数（每 +1 耗时翻倍，12 约 100~250ms/次）
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# 旧数据中的明文密码不以这些前缀开头
+_HASH_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+password_seconds = metrics.Histogram(
+    "password_hash_seconds", "密码哈希/校验耗时（含排队）", ("operation",))
+password_rejected = metrics.Counter(
+    "password_hash_rejected_total", "排队已满被拒绝的密码哈希/校验请求数", ("operation",))
+password_pending = metrics.Gauge(
+    "password_hash_pending", "进程池中排队和执行中的密码哈希/校验数")
+
+
+def is_hashed(stored_password):
+    return stored_password.startswith(_HASH_PREFIXES)
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password, hashed):
+    # 轮数调整后旧哈希校验通过时返回新哈希
+    return pwd_context.verify_and_update(password, hashed)
+
+
+class PasswordHasherBusy(Exception):
+    """排队的密码哈希/校验请求已达上限"""
+    pass
+
+
+class PasswordHasher:
+    """在独立进程池中执行 bcrypt，避免阻塞事件循环
+
+    进程数默认等于 CPU 核数；排队和执行中的任务超过 max_pending 时直接抛出 PasswordHasherBusy，
+    由接口返回 503，登录高峰时不会无限堆积。
+    """
+
+    def __init__(self, max_workers=None, max_pending=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 16
+        self.pending = 0
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        password_pending.set_collector(lambda: {(): self.pending})
+
+    def get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    # 支持 fork 的平台用 fork（不重新导入主模块）；须在启动数据库线程池、日志线程之前
+                    # 调用 start()，工作进程一次全部创建。Windows 只能 spawn。
+                    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context(method),
+                    )
+        return self._executor
+
+    async def _run(self, operation, func, *args):
+        if self.pending >= self.max_pending:
+            password_rejected.inc(operation)
+            raise PasswordHasherBusy(operation)
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+            password_seconds.observe(operation, value=time.perf_counter() - started)
+
+    async def hash(self, password):
+        return await self._run("hash", _hash, password)
+
+    async def check(self, password, stored_password, upgrade=True):
+        """校验密码，返回 (是否正确, 需要写回的新哈希或 None)
+
+        明文旧数据直接比较（不占用进程池），校验通过且 upgrade 时生成哈希供调用方写回；
+        此时进程池繁忙则本次不升级，下次登录再处理。
+        """
+        if is_hashed(stored_password):
+            return await self._run("verify", _verify_and_update, password, stored_password)
+        if not hmac.compare_digest(password.encode("utf-8"), stored_password.encode("utf-8")):
+            return False, None
+        if not upgrade:
+            return True, None
+        try:
+            return True, await self.hash(password)
+        except PasswordHasherBusy:
+            return True, None
+
+    async def start(self):
+        """预先启动全部工作进程，避免第一批登录承担进程启动耗时（应用启动时最先调用）"""
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        await asyncio.gather(*(loop.run_in_executor(executor, os.getpid) for _ in range(self.max_workers)))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# 全局密码哈希器
+password_hasher = PasswordHasher(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or None,
+    max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", "0")) or None,
+)
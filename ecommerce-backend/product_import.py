@@ -0,0 +1,501 @@
+# product_import.py
+# 商品批量导入：CSV / JSONL 流式读取 → 分批校验 → fast_executemany 写入临时表 → MERGE 到 Product
+# 用法：
+#   python product_import.py catalog.csv
+#   python product_import.py catalog.jsonl --format jsonl --chunk-size 5000 --errors errors.ndjson
+#
+# 列：product_id（可选，有则按 ID 更新，无则新增）、category_id、product_name、price（必填）、
+#     description、stock_quantity、image、product_status（可选，更新时留空保留原值）
+# 需先执行 database/product_import.sql（商品 ID 序列）
+import codecs
+import csv
+import json
+import logging
+import os
+import time
+from decimal import Decimal, InvalidOperation
+
+import pyodbc
+
+from database import db, async_db
+from id_allocator import IdAllocator
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ("category_id", "product_name", "price")
+
+# varchar 按字节计长（中文排序规则下每个汉字占 2 字节）
+VARCHAR_LIMITS = {"product_name": 100, "description": 100, "image": 225}
+MAX_PRICE = Decimal("99999999.99")
+
+# 临时表中被剔除的行的原因
+STAGING_ERRORS = {
+    1: "商品不存在",
+    2: "价格变动超过50%，需要管理员审核",
+}
+
+STAGING_SQL = """
+    IF OBJECT_ID('tempdb..#ProductImport') IS NOT NULL DROP TABLE #ProductImport;
+    CREATE TABLE #ProductImport (
+        line_no INT NOT NULL PRIMARY KEY,
+        product_id INT NOT NULL,
+        is_new BIT NOT NULL,
+        category_id INT NOT NULL,
+        product_name NVARCHAR(100) NOT NULL,
+        description NVARCHAR(100) NULL,
+        price DECIMAL(10, 2) NOT NULL,
+        stock_quantity INT NULL,
+        image NVARCHAR(225) NULL,
+        product_status SMALLINT NULL
+    );
+"""
+
+STAGING_INSERT_SQL = """
+    INSERT INTO #ProductImport
+    (line_no, product_id, is_new, category_id, product_name, description, price, stock_quantity, image, product_status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# 显式声明参数类型，fast_executemany 不再向服务端探测临时表的参数类型
+STAGING_INPUT_SIZES = [
+    (pyodbc.SQL_INTEGER, 0, 0),
+    (pyodbc.SQL_INTEGER, 0, 0),
+    (pyodbc.SQL_BIT, 0, 0),
+    (pyodbc.SQL_INTEGER, 0, 0),
+    (pyodbc.SQL_WVARCHAR, 100, 0),
+    (pyodbc.SQL_WVARCHAR, 100, 0),
+    (pyodbc.SQL_DECIMAL, 10, 2),
+    (pyodbc.SQL_INTEGER, 0, 0),
+    (pyodbc.SQL_WVARCHAR, 225, 0),
+    (pyodbc.SQL_SMALLINT, 0, 0),
+]
+
+# 与 trg_PreventLargePriceChange 相同的价格校验提前在临时表上做，
+# 违规行单独报错，不会让触发器回滚整批 MERGE
+MERGE_SQL = """
+    SET NOCOUNT ON;
+
+    DECLARE @errors TABLE (line_no INT PRIMARY KEY, error_code TINYINT NOT NULL);
+    INSERT INTO @errors (line_no, error_code)
+    SELECT s.line_no, CASE WHEN p.product_id IS NULL THEN 1 ELSE 2 END
+    FROM #ProductImport s
+    LEFT JOIN dbo.Product p ON p.product_id = s.product_id
+    WHERE s.is_new = 0
+    AND (p.product_id IS NULL OR ABS(s.price - p.price) / NULLIF(p.price, 0) > 0.5);
+
+    DELETE s FROM #ProductImport s INNER JOIN @errors e ON e.line_no = s.line_no;
+
+    DECLARE @actions TABLE (merge_action NVARCHAR(10));
+    MERGE dbo.Product WITH (HOLDLOCK) AS t
+    USING #ProductImport AS s
+    ON t.product_id = s.product_id
+    WHEN MATCHED THEN UPDATE SET
+        category_id = s.category_id,
+        product_name = s.product_name,
+        description = ISNULL(s.description, t.description),
+        price = s.price,
+        stock_quantity = ISNULL(s.stock_quantity, t.stock_quantity),
+        image = ISNULL(s.image, t.image),
+        product_status = ISNULL(s.product_status, t.product_status)
+    WHEN NOT MATCHED BY TARGET THEN
+        INSERT (product_id, category_id, product_name, description, price, stock_quantity, image, product_status)
+        VALUES (s.product_id, s.category_id, s.product_name, s.description, s.price,
+                ISNULL(s.stock_quantity, 0), s.image, ISNULL(s.product_status, 1))
+    OUTPUT $action INTO @actions;
+
+    SELECT line_no, error_code FROM @errors ORDER BY line_no;
+    SELECT
+        ISNULL(SUM(CASE WHEN merge_action = 'INSERT' THEN 1 ELSE 0 END), 0) AS inserted,
+        ISNULL(SUM(CASE WHEN merge_action = 'UPDATE' THEN 1 ELSE 0 END), 0) AS updated
+    FROM @actions;
+"""
+
+
+class RecordParser:
+    """把文本行组装成记录，产出 (行号, dict) 或 (行号, ValueError)
+
+    CSV 字段内可以有换行：双引号个数为偶数时一条记录才算完整。首条记录为表头。
+    """
+
+    def __init__(self, format="csv"):
+        if format not in ("csv", "jsonl"):
+            raise ValueError(f"不支持的格式: {format}")
+        self.format = format
+        self.header = None
+        self._line_no = 0
+        self._pending = []
+        self._pending_start = 0
+
+    def feed(self, line):
+        self._line_no += 1
+        if self.format == "jsonl":
+            return self._parse_json(line)
+
+        if not self._pending:
+            self._pending_start = self._line_no
+        self._pending.append(line)
+        text = "".join(self._pending)
+        if text.count('"') % 2:
+            return []
+        self._pending = []
+        return self._parse_csv(text, self._pending_start)
+
+    def close(self):
+        if self._pending:
+            start, self._pending = self._pending_start, []
+            return [(start, ValueError("CSV 引号未闭合"))]
+        return []
+
+    def _parse_json(self, line):
+        if not line.strip():
+            return []
+        try:
+            value = json.loads(line)
+        except ValueError:
+            return [(self._line_no, ValueError("JSON 格式错误"))]
+        if not isinstance(value, dict):
+            return [(self._line_no, ValueError("每行必须是 JSON 对象"))]
+        return [(self._line_no, value)]
+
+    def _parse_csv(self, text, line_no):
+        if not text.strip():
+            return []
+        values = next(csv.reader([text]))
+        if self.header is None:
+            self.header = [name.strip().lower() for name in values]
+            missing = [name for name in REQUIRED_COLUMNS if name not in self.header]
+            if missing:
+                raise ValueError(f"CSV 缺少列: {', '.join(missing)}")
+            return []
+        if len(values) != len(self.header):
+            return [(line_no, ValueError(f"列数应为 {len(self.header)}，实际 {len(values)}"))]
+        return [(line_no, dict(zip(self.header, values)))]
+
+
+def iter_records(lines, format="csv"):
+    parser = RecordParser(format)
+    for line in lines:
+        yield from parser.feed(line)
+    yield from parser.close()
+
+
+async def aiter_lines(chunks):
+    """把字节流（如 request.stream()）切分成文本行，去掉 UTF-8 BOM"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    async for chunk in chunks:
+        text = tail + decoder.decode(chunk)
+        start = 0
+        end = text.find("\n")
+        while end != -1:
+            yield text[start:end + 1]
+            start = end + 1
+            end = text.find("\n", start)
+        tail = text[start:]
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def aiter_records(lines, format="csv"):
+    parser = RecordParser(format)
+    async for line in lines:
+        for record in parser.feed(line):
+            yield record
+    for record in parser.close():
+        yield record
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _int(raw, name, minimum=None):
+    value = raw.get(name)
+    if _blank(value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{name} 必须是整数")
+    if minimum is not None and number < minimum:
+        raise ValueError(f"{name} 不能小于 {minimum}")
+    return number
+
+
+def _text(raw, name):
+    value = raw.get(name)
+    if _blank(value):
+        return None
+    value = str(value).strip()
+    if len(value.encode("gbk", errors="replace")) > VARCHAR_LIMITS[name]:
+        raise ValueError(f"{name} 超过 {VARCHAR_LIMITS[name]} 字节")
+    return value
+
+
+def clean_record(raw):
+    """校验并转换一条记录，返回写入临时表所需的字段；不合法时抛出 ValueError"""
+    row = {
+        "product_id": _int(raw, "product_id", 1),
+        "category_id": _int(raw, "category_id", 1),
+        "product_name": _text(raw, "product_name"),
+        "description": _text(raw, "description"),
+        "stock_quantity": _int(raw, "stock_quantity", 0),
+        "image": _text(raw, "image"),
+        "product_status": _int(raw, "product_status"),
+    }
+    if row["category_id"] is None:
+        raise ValueError("category_id 不能为空")
+    if row["product_name"] is None:
+        raise ValueError("product_name 不能为空")
+    if row["product_status"] not in (None, 0, 1):
+        raise ValueError("product_status 只能是 0 或 1")
+
+    price = raw.get("price")
+    if _blank(price):
+        raise ValueError("price 不能为空")
+    try:
+        price = Decimal(str(price).strip())
+    except InvalidOperation:
+        raise ValueError("price 必须是数字")
+    if not price.is_finite() or price < 0 or price > MAX_PRICE:
+        raise ValueError("price 超出范围")
+    row["price"] = price.quantize(Decimal("0.01"))
+    return row
+
+
+class ImportProgress:
+    """导入进度与吞吐量"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.rows_read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.chunks = 0
+        self.db_seconds = 0.0
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def to_dict(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return {
+            "finished": self.finished is not None,
+            "rows_read": self.rows_read,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "chunks": self.chunks,
+            "elapsed_seconds": round(elapsed, 3),
+            "db_seconds": round(self.db_seconds, 3),
+            "rows_per_second": round(self.rows_read / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+class ProductImporter:
+    """按批导入商品
+
+    每批：字段校验 → 分类校验（只查询本次导入中还没见过的分类 ID）→ 为新商品预留 ID →
+    fast_executemany 写入连接级临时表 #ProductImport → 一条 MERGE 完成新增/更新。
+    import_chunk 是阻塞调用，异步场景放到 async_db.run 中执行。
+    """
+
+    def __init__(self, database=None, chunk_size=None, allocator=None):
+        self.database = database or db
+        self.chunk_size = chunk_size or int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+        self.ids = allocator or IdAllocator(
+            "dbo.seq_Product", block_size=self.chunk_size, database=self.database
+        )
+        self.progress = ImportProgress()
+        self._categories = set()
+        self._missing_categories = set()
+        self._seen_ids = set()
+
+    def _check_categories(self, category_ids):
+        unknown = category_ids - self._categories - self._missing_categories
+        if not unknown:
+            return
+        rows = self.database.execute_query(
+            "SELECT category_id FROM Category WHERE category_id IN (SELECT value FROM OPENJSON(?))",
+            (json.dumps(sorted(unknown)),)
+        )
+        found = {row["category_id"] for row in rows}
+        self._categories |= found
+        self._missing_categories |= unknown - found
+
+    def prepare(self, records):
+        """字段、重复 ID、分类校验，返回 (临时表行, 错误列表)"""
+        errors = []
+        cleaned = []
+        for line_no, raw in records:
+            if isinstance(raw, Exception):
+                errors.append({"line": line_no, "error": str(raw)})
+                continue
+            try:
+                row = clean_record(raw)
+            except ValueError as e:
+                errors.append({"line": line_no, "error": str(e)})
+                continue
+            product_id = row["product_id"]
+            if product_id is not None:
+                if product_id in self._seen_ids:
+                    errors.append({"line": line_no, "error": f"商品ID {product_id} 在文件中重复"})
+                    continue
+                self._seen_ids.add(product_id)
+            cleaned.append((line_no, row))
+
+        self._check_categories({row["category_id"] for _, row in cleaned})
+
+        staged = []
+        for line_no, row in cleaned:
+            if row["category_id"] not in self._categories:
+                errors.append({"line": line_no, "error": "商品分类不存在"})
+                continue
+            is_new = row["product_id"] is None
+            product_id = self.ids.next_id() if is_new else row["product_id"]
+            staged.append((
+                line_no, product_id, is_new, row["category_id"], row["product_name"],
+                row["description"], row["price"], row["stock_quantity"], row["image"],
+                row["product_status"],
+            ))
+        return staged, errors
+
+    def merge(self, staged):
+        """写入临时表并 MERGE，返回 (错误列表, 新增数, 更新数)"""
+        with self.database.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(STAGING_SQL)
+                cursor.fast_executemany = True
+                cursor.setinputsizes(STAGING_INPUT_SIZES)
+                cursor.executemany(STAGING_INSERT_SQL, staged)
+                cursor.execute(MERGE_SQL)
+                errors = [
+                    {"line": line_no, "error": STAGING_ERRORS[code]}
+                    for line_no, code in cursor.fetchall()
+                ]
+                cursor.nextset()
+                inserted, updated = cursor.fetchone()
+                return errors, inserted, updated
+            finally:
+                try:
+                    cursor.execute("DROP TABLE IF EXISTS #ProductImport")
+                except Exception:
+                    pass
+                cursor.close()
+
+    def import_chunk(self, records):
+        """导入一批记录，返回该批的错误列表（行号升序）"""
+        records = list(records)
+        progress = self.progress
+        progress.rows_read += len(records)
+        progress.chunks += 1
+
+        staged, errors = self.prepare(records)
+        if staged:
+            started = time.perf_counter()
+            try:
+                merge_errors, inserted, updated = self.merge(staged)
+            except Exception as e:
+                # 整批失败（如违反约束），记录每一行，继续处理后续批次
+                logger.warning("商品导入批次失败: %s", e, extra={"rows": len(staged)})
+                merge_errors = [{"line": row[0], "error": f"写入失败: {e}"} for row in staged]
+                inserted = updated = 0
+            progress.db_seconds += time.perf_counter() - started
+            progress.inserted += inserted
+            progress.updated += updated
+            errors.extend(merge_errors)
+
+        progress.failed += len(errors)
+        errors.sort(key=lambda error: error["line"])
+        return errors
+
+    def run(self, records, on_progress=None, on_error=None):
+        """同步导入全部记录（命令行使用）"""
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                self._finish_chunk(chunk, on_progress, on_error)
+                chunk = []
+        if chunk:
+            self._finish_chunk(chunk, on_progress, on_error)
+        self.progress.finish()
+        return self.progress.to_dict()
+
+    def _finish_chunk(self, chunk, on_progress, on_error):
+        errors = self.import_chunk(chunk)
+        if on_error:
+            for error in errors:
+                on_error(error)
+        if on_progress:
+            on_progress(self.progress.to_dict())
+
+
+async def import_stream(importer, records, max_errors=1000):
+    """异步导入（接口使用）：边读请求体边按批导入，返回汇总和前 max_errors 条错误"""
+    errors = []
+
+    async def finish(chunk):
+        chunk_errors = await async_db.run(importer.import_chunk, chunk)
+        errors.extend(chunk_errors[:max_errors - len(errors)])
+
+    chunk = []
+    try:
+        async for record in records:
+            chunk.append(record)
+            if len(chunk) >= importer.chunk_size:
+                await finish(chunk)
+                chunk = []
+        if chunk:
+            await finish(chunk)
+    finally:
+        importer.progress.finish()
+    return {**importer.progress.to_dict(), "errors": errors}
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="商品批量导入")
+    parser.add_argument("path", help="CSV 或 JSONL 文件")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="默认按扩展名判断")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--errors", help="把每行错误写入该文件（NDJSON）")
+    args = parser.parse_args()
+
+    format = args.format or ("jsonl" if args.path.lower().endswith((".jsonl", ".ndjson")) else "csv")
+    importer = ProductImporter(chunk_size=args.chunk_size)
+    error_file = open(args.errors, "w", encoding="utf-8") if args.errors else None
+    shown = 0
+
+    def on_error(error):
+        nonlocal shown
+        if error_file:
+            error_file.write(json.dumps(error, ensure_ascii=False) + "\n")
+        elif shown < 20:
+            print(f"  第 {error['line']} 行: {error['error']}")
+            shown += 1
+
+    def on_progress(progress):
+        print(f"📦 已读取 {progress['rows_read']} 行，新增 {progress['inserted']}，"
+              f"更新 {progress['updated']}，失败 {progress['failed']}，"
+              f"{progress['rows_per_second']:.0f} 行/秒")
+
+    try:
+        with open(args.path, encoding="utf-8-sig", newline="") as f:
+            summary = importer.run(iter_records(f, format), on_progress, on_error)
+    finally:
+        if error_file:
+            error_file.close()
+        db.close()
+    print(f"✅ 导入完成: {json.dumps(summary, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
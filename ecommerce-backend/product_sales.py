@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import os
+
+from database import async_db
+
+logger = logging.getLogger(__name__)
+
+
+class ProductSalesReconciler:
+    """商品销量计数对账任务
+
+    定期执行 sp_ReconcileProductSales（见 database/product_sales.sql），
+    把 ProductSales 与 vw_TopSellingProducts 的差异记录下来；fix=True 时按视图结果修正。
+    后台任务只对账不修正：对账期间若有订单支付，差异可能是暂时的，修正交给管理员确认后手动触发。
+    interval <= 0 时不启动后台任务。
+    """
+
+    def __init__(self, interval=3600.0):
+        self.interval = interval
+        self.runs = 0
+        self.last_mismatches = None
+        self.last_error = None
+        self._task = None
+
+    async def reconcile(self, fix=False):
+        rows = await async_db.execute_query(
+            "EXEC dbo.sp_ReconcileProductSales @fix = ?", (1 if fix else 0,)
+        )
+        self.runs += 1
+        self.last_mismatches = len(rows)
+        self.last_error = None
+        return rows
+
+    async def run_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                rows = await self.reconcile()
+                if rows:
+                    logger.warning("商品销量计数与 vw_TopSellingProducts 不一致: %d 个商品", len(rows),
+                                   extra={"sample": rows[:5]})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("商品销量对账失败")
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# 全局销量对账任务
+product_sales_reconciler = ProductSalesReconciler(
+    interval=float(os.getenv("PRODUCT_SALES_RECONCILE_INTERVAL", "3600"))
+)
@@ -1,136 +1,139 @@
-from fastapi import APIRouter, Query, HTTPException
-from typing import Optional
+from fastapi import APIRouter, Query, HTTPException, Request, Response
+from typing import Literal, Optional
+import json
 import math
 
-from database import db
+from database import async_db
+import queries
+from responses import FastJSONRoute
 from models import ProductSearch, APIResponse
+from promotions import promotion_index
+from categories import category_tree
+from pagination import encode_cursor, decode_cursor, InvalidCursor
+from search import search_backend
 
-router = APIRouter(prefix="/products", tags=["商品"])
+router = APIRouter(prefix="/products", tags=["商品"], route_class=FastJSONRoute)
 
 @router.get("/")
 async def get_products(
     keyword: Optional[str] = None,
     category_id: Optional[int] = None,
+    include_subcategories: bool = False,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
     page: int = Query(1, ge=1),
-    page_size: int = Query(20, ge=1, le=100)
+    page_size: int = Query(20, ge=1, le=100),
+    use_cursor: bool = False,
+    cursor: Optional[str] = None,
+    sort_by: Literal["default", "newest", "sales_desc"] = "default"
 ):
-    """获取商品列表"""
+    """获取商品列表
+
+    include_subcategories=true 时按分类筛选包含所有子分类。
+    sort_by=sales_desc 按销量倒序（ProductSales 计数表上的索引，见 database/product_sales.sql）。
+    默认按 page/page_size 分页；传 use_cursor=true 或 cursor 时改用游标（seek）分页，
+    响应中的 next_cursor 用于取下一页，深翻页不再扫描被跳过的行。
+    keyword 搜索由 SEARCH_BACKEND 指定的搜索后端完成：全文检索/倒排索引返回按相关度
+    排序的商品ID（最多 SEARCH_MAX_RESULTS 个），列表按相关度排序；默认 like 后端仍用 LIKE 模糊匹配。
+    命中数达到 SEARCH_MAX_RESULTS 时响应中 total_capped=true，total / total_pages 只统计前这么多个结果。
+    """
     try:
-        # 构建查询条件
-        conditions = ["p.product_status = 1"]  # 只查询上架商品
-        params = []
-        
+        # 语句从 queries.py 的固定变体中选取，参数按其约定的顺序拼装
+        search = "none"
+        sort = "sales" if sort_by == "sales_desc" else "id"
+        category = "none"
+        cursor_kind = "products_sales" if sort == "sales" else "products"
+        search_params = []
+        total_capped = False
         if keyword:
-            conditions.append("(p.product_name LIKE ? OR p.description LIKE ?)")
-            params.extend([f"%{keyword}%", f"%{keyword}%"])
-        
-        if category_id:
-            conditions.append("p.category_id = ?")
-            params.append(category_id)
-        
-        if min_price is not None:
-            conditions.append("p.price >= ?")
-            params.append(min_price)
+            ranked_ids = await search_backend.search(keyword)
+            if ranked_ids is None:
+                search = "like"
+                search_params = [f"%{keyword}%", f"%{keyword}%"]
+            else:
+                # 搜索后端返回排好序的商品ID，用 OPENJSON 展开成 (排名, ID) 与商品表关联
+                search = "ranked"
+                search_params = [json.dumps(ranked_ids)]
+                # 搜索后端最多返回 SEARCH_MAX_RESULTS 个ID，达到上限时 total 只统计了这些ID
+                total_capped = len(ranked_ids) >= search_backend.max_results
+                if sort != "sales":
+                    cursor_kind = "products_search"
         
-        if max_price is not None:
-            conditions.append("p.price <= ?")
-            params.append(max_price)
+        filter_params = []
+        if category_id and include_subcategories:
+            # 使用预计算的后代分类集合，不需要递归 SQL；ID 列表以 JSON 传入，语句文本与个数无关
+            await category_tree.ensure_fresh()
+            category = "tree"
+            filter_params.append(json.dumps(sorted(category_tree.descendants(category_id))))
+        elif category_id:
+            category = "one"
+            filter_params.append(category_id)
         
-        where_clause = " AND ".join(conditions)
+        # 价格区间用开关参数，未指定时开关为 0（参数始终为 int + float，类型不随条件变化）
+        for bound in (min_price, max_price):
+            filter_params.extend([0, 0.0] if bound is None else [1, float(bound)])
         
-        # 计算总数
-        count_sql = f"""
-            SELECT COUNT(*) as total 
-            FROM Product p
-            LEFT JOIN Category c ON p.category_id = c.category_id
-            WHERE {where_clause}
-        """
-        total_result = db.execute_query(count_sql, params)
-        total = total_result[0]["total"] if total_result else 0
+        where_params = search_params + filter_params
+        cursor_mode = use_cursor or cursor is not None
+        next_cursor = None
         
-        # 分页查询 - 添加了促销信息的连接查询
-        offset = (page - 1) * page_size
-        query_sql = f"""
-            SELECT 
-                p.product_id AS id, p.product_name AS name, p.description, p.price,
-                p.stock_quantity AS stock, p.image,
-                c.category_name, c.category_id, 0 AS sold_quantity
-            FROM Product p
-            LEFT JOIN Category c ON p.category_id = c.category_id
-            WHERE {where_clause}
-            ORDER BY p.product_id DESC
-            OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
-        """
+        if cursor_mode:
+            # 游标分页：按 product_id 倒序（搜索时按相关度排名，按销量时按 (销量, ID)）从上一页最后一条之后开始取，
+            # 多取一条判断是否还有下一页
+            seek_params = []
+            if cursor:
+                try:
+                    last_keys = decode_cursor(cursor, cursor_kind, 2 if sort == "sales" else 1)
+                except InvalidCursor as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                if sort == "sales":
+                    seek_params = [last_keys[0], last_keys[0], last_keys[1]]
+                else:
+                    seek_params = [last_keys[0]]
+            
+            statement = queries.product_list(search, sort, category, "next" if cursor else "first")
+            products = await async_db.execute_query(statement, [page_size + 1] + where_params + seek_params)
+            if len(products) > page_size:
+                products = products[:page_size]
+                last = products[-1]
+                if sort == "sales":
+                    last_keys = [last["sold_quantity"], last["id"]]
+                else:
+                    last_keys = [last["search_rank"] if search == "ranked" else last["id"]]
+                next_cursor = encode_cursor(cursor_kind, last_keys)
+            total = None
+        else:
+            # 分页查询 - 用窗口函数一次拿到总数，省掉单独的 COUNT 查询
+            offset = (page - 1) * page_size
+            statement = queries.product_list(search, sort, category, "offset")
+            products = await async_db.execute_query(statement, where_params + [offset, page_size])
+            
+            if products:
+                total = products[0]["total_count"]
+            elif page > 1:
+                # 页码越界时窗口函数拿不到总数，补一次 COUNT
+                statement = queries.product_list(search, sort, category, "count")
+                total_result = await async_db.execute_query(statement, where_params)
+                total = total_result[0]["total"] if total_result else 0
+            else:
+                total = 0
         
-        params_with_paging = params + [offset, page_size]
-        products = db.execute_query(query_sql, params_with_paging)
+        # 促销从进程内索引读取，整页一次定价
+        await promotion_index.ensure_fresh()
+        priced_items = promotion_index.price_batch(
+            (product["id"], product["price"]) for product in products
+        )
         
         # 转换商品数据格式，确保与前端期望一致
         formatted_products = []
-        for product in products:
-            original_price = float(product["price"])
-            discounted_price = original_price
-            has_discount = False
-            promotion = None
-            
-            # 获取该商品的促销信息
-            promotion_query = """
-                SELECT 
-                    pr.promotion_id, pr.discount_tyoe AS discount_type,
-                    pr.discount_value, pr.start_time, pr.end_time, pr.promotion_status
-                FROM Promotion pr
-                JOIN Product_Promotion pp ON pr.promotion_id = pp.promotion_id
-                WHERE pp.product_id = ? AND pr.promotion_status = 1 AND GETDATE() BETWEEN pr.start_time AND pr.end_time
-            """
-            promotion_result = db.execute_query(promotion_query, (product["id"],))
-            
-            if promotion_result:
-                # 计算最优促销
-                best_promotion = None
-                best_discounted_price = original_price
-                
-                for promo in promotion_result:
-                    if promo["discount_type"] == 1:  # 百分比折扣
-                        discount_percentage = float(promo["discount_value"])
-                        current_discounted = max(0.01, round(original_price * (discount_percentage / 100), 2))
-                    elif promo["discount_type"] == 2:  # 固定金额折扣
-                        discount_amount = float(promo["discount_value"])
-                        current_discounted = max(0.01, round(original_price - discount_amount, 2))
-                    else:
-                        current_discounted = original_price
-                    
-                    if current_discounted < best_discounted_price:
-                        best_discounted_price = current_discounted
-                        best_promotion = promo
-                
-                if best_promotion:
-                    has_discount = True
-                    discounted_price = best_discounted_price
-                    
-                    # 格式化促销信息
-                    if best_promotion["discount_type"] == 1:
-                        promotion_tag = f"{int(best_promotion['discount_value'])}折"
-                    else:
-                        promotion_tag = f"立减¥{best_promotion['discount_value']}"
-                    
-                    promotion = {
-                        "id": best_promotion["promotion_id"],
-                        "type": best_promotion["discount_type"],
-                        "value": best_promotion["discount_value"],
-                        "tag": promotion_tag,
-                        "start_time": best_promotion["start_time"],
-                        "end_time": best_promotion["end_time"]
-                    }
-            
+        for product, priced in zip(products, priced_items):
             formatted_product = {
                 "id": product["id"],
                 "name": product["name"],
                 "description": product["description"],
-                "price": discounted_price,  # 返回折后价
-                "original_price": original_price,  # 返回原价
-                "has_discount": has_discount,
+                "price": float(priced.price),  # 返回折后价
+                "original_price": float(priced.original_price),  # 返回原价
+                "has_discount": priced.promotion is not None,
                 "stock": product["stock"],
                 "sold_quantity": product["sold_quantity"],
                 "image": product["image"],
@@ -138,22 +141,37 @@ async def get_products(
                     "id": product["category_id"],
                     "name": product["category_name"]
                 },
-                "promotion": promotion_tag if promotion else None
+                "promotion": priced.tag
             }
             formatted_products.append(formatted_product)
         
+        if cursor_mode:
+            # 游标模式不统计总数，避免每页都扫描全部匹配行
+            return {
+                "code": 200,
+                "message": "success",
+                "data": {
+                    "items": formatted_products,
+                    "page_size": page_size,
+                    "next_cursor": next_cursor
+                }
+            }
+        
         return {
             "code": 200,
             "message": "success",
             "data": {
                 "items": formatted_products,
                 "total": total,
+                "total_capped": total_capped,
                 "page": page,
                 "page_size": page_size,
                 "total_pages": math.ceil(total / page_size) if page_size > 0 else 0
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -161,37 +179,20 @@ async def get_products(
         )
 
 @router.get("/categories")
-async def get_categories():
-    """获取商品分类"""
+async def get_categories(request: Request):
+    """获取商品分类（缓存的预序列化分类树，支持 ETag / If-None-Match）"""
     try:
-        sql = """
-            SELECT category_id, category_name, parent_id
-            FROM Category
-            WHERE status = 1
-            ORDER BY sort_order, category_id
-        """
-        categories = db.execute_query(sql)
+        await category_tree.ensure_fresh()
         
-        # 构建树形结构
-        category_map = {}
-        root_categories = []
+        headers = {"ETag": category_tree.etag, "Cache-Control": "no-cache"}
+        if category_tree.etag_matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
         
-        for cat in categories:
-            cat["children"] = []
-            category_map[cat["category_id"]] = cat
-        
-        for cat in categories:
-            parent_id = cat["parent_id"]
-            if parent_id and parent_id in category_map:
-                category_map[parent_id]["children"].append(cat)
-            else:
-                root_categories.append(cat)
-        
-        return {
-            "code": 200,
-            "message": "success",
-            "data": root_categories
-        }
+        return Response(
+            content=category_tree.body,
+            media_type="application/json",
+            headers=headers
+        )
         
     except Exception as e:
         raise HTTPException(
@@ -203,72 +204,30 @@ async def get_categories():
 async def get_product_detail(product_id: int):
     """获取商品详情"""
     try:
-        sql = """
-            SELECT 
-                p.product_id AS id, p.category_id, p.product_name AS name, p.description, p.price,
-                p.stock_quantity AS stock, p.image AS image, p.product_status,
-                c.category_name, c.category_id, 0 AS sold_quantity
-            FROM Product p
-            LEFT JOIN Category c ON p.category_id = c.category_id
-            WHERE p.product_id = ? AND p.product_status = 1
-        """
-        product = db.execute_query(sql, (product_id,))
+        product = await async_db.execute_query(queries.PRODUCT_DETAIL, (product_id,))
         
         if not product:
             raise HTTPException(status_code=404, detail="商品不存在或已下架")
         
-        # 获取该商品的促销信息
-        promotion_query = """
-            SELECT 
-                pr.promotion_id, pr.discount_tyoe AS discount_type,
-                pr.discount_value, pr.start_time, pr.end_time, pr.promotion_status
-            FROM Promotion pr
-            JOIN Product_Promotion pp ON pr.promotion_id = pp.promotion_id
-            WHERE pp.product_id = ? AND pr.promotion_status = 1 AND GETDATE() BETWEEN pr.start_time AND pr.end_time
-        """
-        promotion_result = db.execute_query(promotion_query, (product_id,))
-        
-        # 处理促销价格逻辑
-        original_price = float(product[0]["price"])
-        discounted_price = original_price
-        has_discount = False
+        # 促销价格从进程内索引计算，与商品列表共用同一定价逻辑
+        await promotion_index.ensure_fresh()
+        priced = promotion_index.price_batch([(product_id, product[0]["price"])])[0]
+        original_price = float(priced.original_price)
+        discounted_price = float(priced.price)
+        has_discount = priced.promotion is not None
         promotion_info = None
         
-        if promotion_result:
-            # 计算最优促销
-            best_promotion = None
-            best_discounted_price = original_price
-            
-            for promotion in promotion_result:
-                # 计算这个促销的折后价
-                # 注意：discount_type在数据库中是smallint类型
-                # 假设1=percentage（百分比折扣），2=fixed（固定金额折扣）
-                if promotion["discount_type"] == 1:  # 百分比折扣
-                    discount_percentage = float(promotion["discount_value"]) / 100
-                    current_discounted = max(0.01, round(original_price * (1 - discount_percentage), 2))
-                elif promotion["discount_type"] == 2:  # 固定金额折扣
-                    discount_amount = float(promotion["discount_value"])
-                    current_discounted = max(0.01, round(original_price - discount_amount, 2))
-                else:
-                    current_discounted = original_price
-                
-                # 取最优（最低价）
-                if current_discounted < best_discounted_price:
-                    best_discounted_price = current_discounted
-                    best_promotion = promotion
-            
-            if best_promotion:
-                has_discount = True
-                discounted_price = best_discounted_price
-                
-                # 格式化促销信息
-                promotion_info = {
-                    "id": best_promotion["promotion_id"],
-                    "type": best_promotion["discount_type"],
-                    "value": best_promotion["discount_value"],
-                    "start_time": best_promotion["start_time"],
-                    "end_time": best_promotion["end_time"]
-                }
+        if priced.promotion:
+            # 格式化促销信息
+            best_promotion = priced.promotion
+            promotion_info = {
+                "id": best_promotion["promotion_id"],
+                "type": best_promotion["discount_type"],
+                "value": best_promotion["discount_value"],
+                "tag": priced.tag,
+                "start_time": best_promotion["start_time"],
+                "end_time": best_promotion["end_time"]
+            }
         
         return {
             "code": 200,
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import time
+from bisect import insort
+from datetime import datetime, timedelta
+
+from database import async_db
+import pricing
+
+logger = logging.getLogger(__name__)
+
+
+class PromotionIndex:
+    """进程内的促销索引
+
+    启动后一次性加载所有生效中和即将生效的促销，按 product_id 建立按开始时间排序的列表。
+    同时记录下一个 start_time / end_time 边界，到点自动重新加载。
+    本服务没有修改促销的接口，促销都是直接改库维护的：新增、修改或停用促销后，
+    最迟 ttl 秒（PROMOTION_INDEX_TTL）或到达下一个起止边界时才会生效，需要更快生效时调小 ttl。
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.version = 0
+        self._by_product = {}
+        self._next_boundary = None
+        self._loaded_at = None
+        self._clock_offset = timedelta(0)
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        """标记索引失效，下一次请求时重新加载（供以后新增的促销修改接口调用，目前没有调用方）"""
+        self._stale = True
+
+    def now(self):
+        """按数据库时钟换算的当前时间（与 GETDATE() 对齐）"""
+        return datetime.now() + self._clock_offset
+
+    def is_stale(self, now=None):
+        if self._stale or self._loaded_at is None:
+            return True
+        if time.monotonic() - self._loaded_at > self.ttl:
+            return True
+        now = now or self.now()
+        return self._next_boundary is not None and now >= self._next_boundary
+
+    async def ensure_fresh(self):
+        """索引过期时重新加载（并发请求只触发一次加载）"""
+        if not self.is_stale():
+            return
+        async with self._lock:
+            if self.is_stale():
+                await self.reload()
+
+    async def reload(self):
+        """从数据库加载生效中和未来的促销"""
+        rows = await async_db.execute_query("""
+            SELECT
+                pp.product_id,
+                pr.promotion_id, pr.discount_tyoe AS discount_type,
+                pr.discount_value, pr.start_time, pr.end_time,
+                GETDATE() AS db_now
+            FROM Promotion pr
+            JOIN Product_Promotion pp ON pr.promotion_id = pp.promotion_id
+            WHERE pr.promotion_status = 1 AND pr.end_time >= GETDATE()
+        """)
+        self.load(rows)
+
+    def load(self, rows, db_now=None):
+        """用查询结果重建索引"""
+        if rows and db_now is None:
+            db_now = rows[0].get("db_now")
+        if db_now is not None:
+            self._clock_offset = db_now - datetime.now()
+        now = self.now()
+
+        promotions = {}
+        rejected = set()
+        by_product = {}
+        next_boundary = None
+        for row in rows:
+            if row["promotion_id"] in rejected:
+                continue
+            promotion = promotions.get(row["promotion_id"])
+            if promotion is None:
+                # 折扣率不在 (0, 1] 或立减金额为负的促销视为录入错误，不参与定价
+                if not pricing.valid_promotion(row["discount_type"], row["discount_value"]):
+                    rejected.add(row["promotion_id"])
+                    logger.warning("促销参数越界，已忽略", extra={
+                        "promotion_id": row["promotion_id"],
+                        "discount_type": row["discount_type"],
+                        "discount_value": str(row["discount_value"]),
+                    })
+                    continue
+                promotion = {
+                    "promotion_id": row["promotion_id"],
+                    "discount_type": row["discount_type"],
+                    "discount_value": row["discount_value"],
+                    "start_time": row["start_time"],
+                    "end_time": row["end_time"],
+                }
+                promotions[row["promotion_id"]] = promotion
+
+                # BETWEEN 两端都包含，结束边界是 end_time 之后
+                for boundary in (promotion["start_time"], promotion["end_time"] + timedelta(milliseconds=3)):
+                    if boundary > now and (next_boundary is None or boundary < next_boundary):
+                        next_boundary = boundary
+
+            insort(
+                by_product.setdefault(row["product_id"], []),
+                (promotion["start_time"], promotion["promotion_id"], promotion)
+            )
+
+        self._by_product = by_product
+        self._next_boundary = next_boundary
+        self._loaded_at = time.monotonic()
+        self._stale = False
+        self.version += 1  # 每次重新加载（包括跨过促销起止边界）递增，供缓存判断价格是否过期
+
+    def active_promotions(self, product_id, now=None):
+        """商品在指定时刻生效的促销"""
+        now = now or self.now()
+        active = []
+        for start_time, _, promotion in self._by_product.get(product_id, ()):
+            if start_time > now:
+                break
+            if now <= promotion["end_time"]:
+                active.append(promotion)
+        return active
+
+    def best_price(self, product_id, base_price, now=None):
+        """返回 (最优价格, 最优促销)，无可用促销时促销为 None"""
+        return pricing.best_price(base_price, self.active_promotions(product_id, now))
+
+    def price_batch(self, items, now=None):
+        """批量定价，items 为 (product_id, base_price)"""
+        now = now or self.now()
+        return pricing.price_batch(items, lambda product_id: self.active_promotions(product_id, now))
+
+
+# 全局促销索引
+promotion_index = PromotionIndex(ttl=float(os.getenv("PROMOTION_INDEX_TTL", "300")))
+
+
+def best_price(product_id, base_price, now=None):
+    """商品列表和详情共用的最优价计算"""
+    return promotion_index.best_price(product_id, base_price, now)
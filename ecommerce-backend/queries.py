@@ -0,0 +1,241 @@
+import itertools
+
+
+class Statement:
+    """注册的热点语句：固定名称 + 固定的参数化 SQL 文本
+
+    传给 Database.execute_query / fetch_one 时，每个池化连接为它保留一个专用游标。
+    pyodbc 在同一游标上再次执行同一个 SQL 文本对象时跳过 SQLPrepare，直接用已准备的句柄执行，
+    服务端也只为这一个文本缓存一份执行计划。
+    """
+
+    __slots__ = ("name", "sql")
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+
+    def __repr__(self):
+        return f"Statement({self.name!r})"
+
+
+class QueryRegistry:
+    """热点语句注册表，名称与 SQL 文本一一对应，进程启动时一次性声明"""
+
+    def __init__(self):
+        self._statements = {}
+
+    def register(self, name, sql):
+        if name in self._statements:
+            raise ValueError(f"语句重复注册: {name}")
+        statement = Statement(name, sql)
+        self._statements[name] = statement
+        return statement
+
+    def get(self, name):
+        return self._statements[name]
+
+    def __contains__(self, name):
+        return name in self._statements
+
+    def __iter__(self):
+        return iter(self._statements.values())
+
+    def __len__(self):
+        return len(self._statements)
+
+
+registry = QueryRegistry()
+
+
+# ---- 商品列表 ----
+# 可选条件不再按有无拼接不同的 WHERE，而是固定为有限个变体：
+#   search:   none（无关键字）/ like（LIKE 模糊匹配）/ ranked（搜索后端返回的排名，OPENJSON 展开）
+#   sort:     id（默认、newest，按 product_id 倒序）/ sales（按销量倒序，以 ProductSales 为驱动表）
+#   category: none / one（p.category_id = ?）/ tree（含子分类，OPENJSON 传入分类ID列表，文本与个数无关）
+#   page:     offset（OFFSET/FETCH + 窗口总数）/ count（页码越界时补的 COUNT）/ first（游标首页）/ next（游标 seek）
+# 价格区间对索引选择没有影响，用 (? = 0 OR ...) 形式的开关参数代替拼接，参数类型也保持不变（不传 NULL）。
+#
+# 参数顺序：
+#   [first/next: TOP 行数] [ranked: 排名 JSON] [like: 关键字 × 2] [one/tree: 分类]
+#   最低价开关, 最低价, 最高价开关, 最高价
+#   [next: seek 键（sales 为 销量, 销量, ID；ranked 为 排名；否则为 ID）] [offset: offset, page_size]
+PRODUCT_LIST_SEARCH = ("none", "like", "ranked")
+PRODUCT_LIST_SORT = ("id", "sales")
+PRODUCT_LIST_CATEGORY = ("none", "one", "tree")
+PRODUCT_LIST_PAGE = ("offset", "count", "first", "next")
+
+_PRODUCT_COLUMNS = """
+        p.product_id AS id, p.product_name AS name, p.description, p.price,
+        p.stock_quantity AS stock, p.image,
+        c.category_name, c.category_id,
+        ISNULL(s.sold_quantity, 0) AS sold_quantity"""
+
+
+def _product_list_sql(search, sort, category, page):
+    if page == "count":
+        select = "SELECT COUNT(*) AS total"
+    else:
+        columns = _PRODUCT_COLUMNS
+        if page == "offset":
+            columns += ",\n        COUNT(*) OVER() AS total_count"
+        elif search == "ranked":
+            columns += ",\n        CAST(r.[key] AS INT) AS search_rank"
+        select = ("SELECT TOP (?)" if page in ("first", "next") else "SELECT") + columns
+
+    joins = []
+    if search == "ranked":
+        joins.append("INNER JOIN OPENJSON(?) r ON p.product_id = CAST(r.[value] AS INT)")
+    # 销量来自 ProductSales 计数表；按销量排序时以计数表为驱动表，走 IX_ProductSales_Sold。
+    # 回填和 trg_Product_ProductSales（见 database/product_sales.sql）保证每个商品都有一行，INNER JOIN 不会漏掉商品
+    joins.append(("INNER" if sort == "sales" else "LEFT") + " JOIN ProductSales s ON s.product_id = p.product_id")
+    joins.append("LEFT JOIN Category c ON p.category_id = c.category_id")
+
+    conditions = ["p.product_status = 1"]
+    if search == "like":
+        conditions.append("(p.product_name LIKE ? OR p.description LIKE ?)")
+    if category == "one":
+        conditions.append("p.category_id = ?")
+    elif category == "tree":
+        conditions.append("p.category_id IN (SELECT CAST(t.[value] AS INT) FROM OPENJSON(?) t)")
+    conditions.append("(? = 0 OR p.price >= ?)")
+    conditions.append("(? = 0 OR p.price <= ?)")
+
+    if sort == "sales":
+        order_by = "s.sold_quantity DESC, s.product_id DESC"
+        seek = "(s.sold_quantity < ? OR (s.sold_quantity = ? AND s.product_id < ?))"
+    elif search == "ranked":
+        order_by = "CAST(r.[key] AS INT)"
+        seek = "CAST(r.[key] AS INT) > ?"
+    else:
+        order_by = "p.product_id DESC"
+        seek = "p.product_id < ?"
+    if page == "next":
+        conditions.append(seek)
+
+    sql = select + "\n    FROM Product p\n    " + "\n    ".join(joins)
+    sql += "\n    WHERE " + "\n    AND ".join(conditions)
+    if page != "count":
+        sql += f"\n    ORDER BY {order_by}"
+    if page == "offset":
+        sql += "\n    OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
+    return sql
+
+
+for _variant in itertools.product(PRODUCT_LIST_SEARCH, PRODUCT_LIST_SORT, PRODUCT_LIST_CATEGORY, PRODUCT_LIST_PAGE):
+    registry.register("product_list." + ".".join(_variant), _product_list_sql(*_variant))
+
+
+def product_list(search="none", sort="id", category="none", page="offset"):
+    """按变体取商品列表语句，参数顺序见上方说明"""
+    return registry.get(f"product_list.{search}.{sort}.{category}.{page}")
+
+
+# ---- 商品详情 ----
+PRODUCT_DETAIL = registry.register("product_detail", """
+    SELECT
+        p.product_id AS id, p.category_id, p.product_name AS name, p.description, p.price,
+        p.stock_quantity AS stock, p.image AS image, p.product_status,
+        c.category_name, c.category_id, ISNULL(s.sold_quantity, 0) AS sold_quantity
+    FROM Product p
+    LEFT JOIN ProductSales s ON s.product_id = p.product_id
+    LEFT JOIN Category c ON p.category_id = c.category_id
+    WHERE p.product_id = ? AND p.product_status = 1
+""")
+
+
+# ---- 购物车 ----
+# 购物车明细的列（含商品 row_version，用于判断快照是否过期）；cart.py 的批量修改语句也使用
+CART_COLUMNS = """
+        c.cart_id,
+        c.user_id,
+        c.product_id,
+        c.cart_quantity,
+        c.add_time,
+        p.product_name,
+        p.price,
+        p.image AS image_url,
+        p.stock_quantity,
+        p.product_status,
+        CAST(p.row_version AS BIGINT) AS product_version"""
+
+# 购物车明细
+CART_VIEW = registry.register("cart_view", """
+    SELECT""" + CART_COLUMNS + """
+    FROM Cart c
+    INNER JOIN Product p ON c.product_id = p.product_id
+    WHERE c.user_id = ?
+    AND p.product_status = 1
+    ORDER BY c.add_time DESC
+""")
+
+# 购物车中的单个商品，用于增量更新快照
+CART_ITEM = registry.register("cart_item", CART_VIEW.sql.replace(
+    "WHERE c.user_id = ?", "WHERE c.user_id = ? AND c.product_id = ?"
+))
+
+# 购物车版本号（database/cart_cache.sql 中由触发器维护），用户没有记录时为 0
+CART_VERSION = registry.register(
+    "cart_version", "SELECT ISNULL(MAX(version), 0) AS version FROM CartVersion WHERE user_id = ?"
+)
+
+
+# ---- 订单列表 ----
+# 变体：items（返回明细，另查 ORDER_ITEMS）/ counted（只由 SQL 统计 item_count）× first / next / offset
+ORDER_LIST_ITEMS = ("items", "counted")
+ORDER_LIST_PAGE = ("first", "next", "offset")
+
+_ORDER_COLUMNS = (
+    "o.order_id, o.user_id, o.address_id, o.total_amount, o.order_status, o.create_time, o.pay_time, o.ship_time, "
+    "a.receiver_name, a.receiver_phone, a.detail_address"
+)
+_ORDER_ITEM_COUNT = ", (SELECT COUNT(*) FROM OrderItem oi WHERE oi.order_id = o.order_id) AS item_count"
+
+
+def _order_list_sql(items, page):
+    columns = _ORDER_COLUMNS + (_ORDER_ITEM_COUNT if items == "counted" else "")
+    source = "FROM [Order] o LEFT JOIN Address a ON o.address_id = a.address_id WHERE o.user_id = ?"
+    if page == "offset":
+        return (f"SELECT {columns}, COUNT(*) OVER() AS total_count {source} "
+                "ORDER BY o.create_time DESC OFFSET ? ROWS FETCH NEXT ? ROWS ONLY")
+    if page == "next":
+        # datetime 列与 datetime2 参数比较会有精度换算问题，显式转换
+        source += " AND (o.create_time < CAST(? AS DATETIME) OR (o.create_time = CAST(? AS DATETIME) AND o.order_id < ?))"
+    return f"SELECT TOP (?) {columns} {source} ORDER BY o.create_time DESC, o.order_id DESC"
+
+
+for _variant in itertools.product(ORDER_LIST_ITEMS, ORDER_LIST_PAGE):
+    registry.register("order_list." + ".".join(_variant), _order_list_sql(*_variant))
+
+
+def order_list(items="items", page="offset"):
+    """按变体取订单列表语句；offset 参数为 (user_id, offset, page_size)，游标为 (TOP 行数, user_id[, seek 键])"""
+    return registry.get(f"order_list.{items}.{page}")
+
+
+ORDER_COUNT = registry.register(
+    "order_count", "SELECT COUNT(*) AS total_count FROM [Order] o WHERE o.user_id = ?"
+)
+
+# 整页订单的明细，订单ID列表以 JSON 传入，文本与订单数无关
+ORDER_ITEMS = registry.register(
+    "order_items",
+    "SELECT oi.item_id, oi.order_id, oi.product_id, oi.order_quantity AS quantity, oi.unit_price, oi.subtotal, "
+    "p.image AS product_image, p.product_name FROM OrderItem oi LEFT JOIN Product p ON oi.product_id = p.product_id "
+    "WHERE oi.order_id IN (SELECT CAST(j.[value] AS INT) FROM OPENJSON(?) j) ORDER BY oi.order_id, oi.item_id"
+)
+
+
+# ---- 认证 ----
+# 登录：用户名或邮箱
+AUTH_LOGIN = registry.register(
+    "auth_login", "SELECT user_id, username, password, user_type FROM [User] WHERE username = ? OR email = ?"
+)
+# 当前用户（token 中的 user_id）
+AUTH_USER = registry.register(
+    "auth_user", "SELECT user_id, username, email, phone, user_type FROM [User] WHERE user_id = ?"
+)
+# 管理员名单（database/admin.sql），不缓存，撤销立即生效
+AUTH_ADMIN = registry.register(
+    "auth_admin", "SELECT user_id FROM dbo.AdminUser WHERE user_id = ?"
+)
@@ -0,0 +1,238 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from datetime import date, timedelta
+
+from database import async_db
+from responses import FastJSONRoute
+from auth import require_admin
+from sales_rollup import sales_rollup
+from product_sales import product_sales_reconciler
+
+router = APIRouter(prefix="/admin/reports", tags=["报表"], route_class=FastJSONRoute)
+
+# 未指定日期范围时默认最近 30 天
+DEFAULT_REPORT_DAYS = 30
+
+def get_date_range(start_date: Optional[date], end_date: Optional[date]):
+    end_date = end_date or date.today()
+    start_date = start_date or end_date - timedelta(days=DEFAULT_REPORT_DAYS - 1)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
+    return start_date, end_date
+
+async def get_as_of():
+    """汇总数据的截止时间（上次刷新时间）"""
+    state = await async_db.fetch_one(
+        "SELECT last_run FROM dbo.SalesRollupState WHERE rollup_name = 'sales'"
+    )
+    return state["last_run"] if state else None
+
+@router.get("/summary")
+async def get_sales_summary(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    admin: dict = Depends(require_admin)
+):
+    """销售总览：总销售额、订单数、平均订单金额"""
+    start_date, end_date = get_date_range(start_date, end_date)
+    try:
+        summary = await async_db.fetch_one("""
+            SELECT
+                ISNULL(SUM(total_sales), 0) AS total_sales,
+                ISNULL(SUM(order_count), 0) AS order_count,
+                ISNULL(SUM(item_count), 0) AS item_count,
+                ISNULL(SUM(total_quantity), 0) AS total_quantity,
+                CAST(SUM(total_sales) / NULLIF(SUM(order_count), 0) AS DECIMAL(18, 2)) AS avg_order_value
+            FROM dbo.SalesDailyRollup
+            WHERE sale_date BETWEEN ? AND ?
+        """, (start_date, end_date))
+
+        return {
+            "code": 200,
+            "message": "success",
+            "data": {
+                "start_date": start_date,
+                "end_date": end_date,
+                "as_of": await get_as_of(),
+                **summary
+            }
+        }
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取销售总览失败: {str(e)}"
+        )
+
+@router.get("/daily-sales")
+async def get_daily_sales(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    admin: dict = Depends(require_admin)
+):
+    """每日销售趋势"""
+    start_date, end_date = get_date_range(start_date, end_date)
+    try:
+        days = await async_db.execute_query("""
+            SELECT
+                sale_date, order_count, item_count, total_sales, total_quantity,
+                CAST(total_sales / NULLIF(order_count, 0) AS DECIMAL(18, 2)) AS avg_order_value
+            FROM dbo.SalesDailyRollup
+            WHERE sale_date BETWEEN ? AND ?
+            ORDER BY sale_date
+        """, (start_date, end_date))
+
+        return {
+            "code": 200,
+            "message": "success",
+            "data": {
+                "start_date": start_date,
+                "end_date": end_date,
+                "as_of": await get_as_of(),
+                "days": days
+            }
+        }
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取每日销售失败: {str(e)}"
+        )
+
+@router.get("/top-products")
+async def get_top_products(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    category_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=500),
+    admin: dict = Depends(require_admin)
+):
+    """商品销量排行（可按分类过滤）"""
+    start_date, end_date = get_date_range(start_date, end_date)
+    try:
+        products = await async_db.execute_query("""
+            SELECT TOP (?)
+                r.product_id,
+                p.product_name,
+                RTRIM(c.category_name) AS category_name,
+                SUM(r.total_quantity) AS total_sold_quantity,
+                SUM(r.total_sales) AS total_sales_amount,
+                SUM(r.order_count) AS order_count,
+                RANK() OVER (ORDER BY SUM(r.total_quantity) DESC) AS sales_rank
+            FROM dbo.SalesProductDailyRollup r
+            LEFT JOIN dbo.Product p ON p.product_id = r.product_id
+            LEFT JOIN dbo.Category c ON c.category_id = p.category_id
+            WHERE r.sale_date BETWEEN ? AND ?
+            AND (? IS NULL OR p.category_id = ?)
+            GROUP BY r.product_id, p.product_name, c.category_name
+            ORDER BY total_sold_quantity DESC, r.product_id
+        """, (limit, start_date, end_date, category_id, category_id))
+
+        return {
+            "code": 200,
+            "message": "success",
+            "data": {
+                "start_date": start_date,
+                "end_date": end_date,
+                "as_of": await get_as_of(),
+                "products": products
+            }
+        }
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取商品排行失败: {str(e)}"
+        )
+
+@router.get("/categories")
+async def get_category_sales(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    admin: dict = Depends(require_admin)
+):
+    """按分类统计销量和销售额（分类取商品当前所属分类）"""
+    start_date, end_date = get_date_range(start_date, end_date)
+    try:
+        categories = await async_db.execute_query("""
+            SELECT
+                p.category_id,
+                RTRIM(c.category_name) AS category_name,
+                COUNT(DISTINCT r.product_id) AS product_count,
+                SUM(r.total_quantity) AS total_quantity,
+                SUM(r.total_sales) AS total_sales
+            FROM dbo.SalesProductDailyRollup r
+            INNER JOIN dbo.Product p ON p.product_id = r.product_id
+            LEFT JOIN dbo.Category c ON c.category_id = p.category_id
+            WHERE r.sale_date BETWEEN ? AND ?
+            GROUP BY p.category_id, c.category_name
+            ORDER BY total_sales DESC
+        """, (start_date, end_date))
+
+        return {
+            "code": 200,
+            "message": "success",
+            "data": {
+                "start_date": start_date,
+                "end_date": end_date,
+                "as_of": await get_as_of(),
+                "categories": categories
+            }
+        }
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取分类销售失败: {str(e)}"
+        )
+
+@router.get("/rollup-status")
+async def get_rollup_status(admin: dict = Depends(require_admin)):
+    """汇总任务状态：水位、上次刷新时间、落后的版本数"""
+    try:
+        return {
+            "code": 200,
+            "message": "success",
+            "data": await sales_rollup.status()
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取汇总状态失败: {str(e)}"
+        )
+
+@router.post("/refresh")
+async def refresh_rollup(admin: dict = Depends(require_admin)):
+    """立即刷新销售汇总"""
+    try:
+        result = await sales_rollup.refresh()
+        return {
+            "code": 200,
+            "message": "刷新完成" if result and result["refreshed"] else "其他进程正在刷新",
+            "data": result
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"刷新销售汇总失败: {str(e)}"
+        )
+
+@router.post("/sold-count/reconcile")
+async def reconcile_sold_count(fix: bool = False, admin: dict = Depends(require_admin)):
+    """商品销量计数对账（与 vw_TopSellingProducts 比较），fix=true 时修正差异"""
+    try:
+        mismatches = await product_sales_reconciler.reconcile(fix=fix)
+        return {
+            "code": 200,
+            "message": "已修正" if fix and mismatches else "success",
+            "data": {
+                "mismatch_count": len(mismatches),
+                "fixed": fix,
+                "mismatches": mismatches[:1000]
+            }
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"销量对账失败: {str(e)}"
+        )
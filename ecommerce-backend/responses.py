@@ -0,0 +1,99 @@
+import asyncio
+import functools
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, request_response
+from starlette.responses import Response
+
+from rows import Row
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时退回标准库 json
+    orjson = None
+
+
+def json_default(value):
+    """序列化器不能直接处理的类型，结果与 FastAPI 的 jsonable_encoder 保持一致"""
+    if isinstance(value, Row):
+        return value._asdict()
+    if isinstance(value, Decimal):
+        # pyodbc 的 DECIMAL 列：无小数位输出整数，否则输出浮点数
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(content):
+        return orjson.dumps(content, default=json_default, option=_ORJSON_OPTIONS)
+else:
+    def _plain(value):
+        # json 会把 tuple 子类（Row）当作数组输出，不经过 default，需先转换
+        if isinstance(value, Row):
+            return {key: _plain(item) for key, item in value.items()}
+        if isinstance(value, dict):
+            return {key: _plain(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [_plain(item) for item in value]
+        return value
+
+    def dumps(content):
+        return json.dumps(_plain(content), ensure_ascii=False, separators=(",", ":"),
+                          default=json_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """orjson 序列化的 JSON 响应，直接处理 Decimal / datetime 等 pyodbc 返回的类型"""
+
+    def render(self, content):
+        return dumps(content)
+
+
+class FastJSONRoute(APIRoute):
+    """返回值直接交给 FastJSONResponse 序列化，不再经过 jsonable_encoder 逐层转换
+
+    只作用于未声明 response_model、响应类为 FastJSONResponse 的路由；
+    声明了 response_model 的路由仍按 FastAPI 原有流程校验和转换。
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        response_class = self.response_class
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = response_class.value
+        if self.response_model is None and issubclass(response_class, FastJSONResponse):
+            self.dependant.call = self._wrap(self.dependant.call, response_class)
+            # 处理函数按替换后的 call 重新生成
+            self.app = request_response(self.get_route_handler())
+
+    def _wrap(self, call, response_class):
+        status_code = self.status_code or 200
+
+        def to_response(result):
+            if isinstance(result, Response):
+                return result
+            return response_class(result, status_code=status_code)
+
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def endpoint(*args, **kwargs):
+                return to_response(await call(*args, **kwargs))
+        else:
+            @functools.wraps(call)
+            def endpoint(*args, **kwargs):
+                return to_response(call(*args, **kwargs))
+        return endpoint
@@ -0,0 +1,88 @@
+from functools import lru_cache
+from operator import itemgetter
+
+# execute_query / stream_query 的 row_format 取值
+ROW_FORMATS = ("dict", "row", "columns")
+
+
+class Row(tuple):
+    """基于元组的查询结果行，列名等元数据由同一结果集的所有行共享
+
+    支持 row["列名"]、row.列名、row[下标]、row.get()、keys()/items()，
+    dict(row)、{**row} 与 dict 行一致；迭代与 tuple 相同，得到的是值而不是列名。
+    每行只占一个元组，不像 dict 那样每行保存一份键的哈希表。
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+    def __repr__(self):
+        return "Row(" + ", ".join(f"{name}={value!r}" for name, value in zip(self._fields, self)) + ")"
+
+    def __reduce__(self):
+        return make_row, (self._fields, tuple(self))
+
+
+@lru_cache(maxsize=512)
+def row_class(columns):
+    """按列名元组生成（并缓存）Row 子类，列名是合法标识符时可以按属性访问"""
+    namespace = {
+        "__slots__": (),
+        "_fields": columns,
+        "_index": {name: i for i, name in enumerate(columns)},
+    }
+    for i, name in enumerate(columns):
+        if name.isidentifier() and not hasattr(Row, name):
+            namespace[name] = property(itemgetter(i))
+    return type("Row", (Row,), namespace)
+
+
+def make_row(columns, values):
+    return row_class(tuple(columns))(values)
+
+
+def convert_rows(columns, rows, row_format="dict"):
+    """把 fetchall / fetchmany 的结果转换为指定格式
+
+    dict：每行一个 dict（默认，兼容原有调用方）
+    row：每行一个 Row（共享列信息）
+    columns：按列存放 {列名: [值, ...]}，适合只做聚合计算的分析查询
+    """
+    if row_format == "dict":
+        return [dict(zip(columns, row)) for row in rows]
+    if row_format == "row":
+        cls = row_class(tuple(columns))
+        return [cls(row) for row in rows]
+    if row_format == "columns":
+        if not rows:
+            return {column: [] for column in columns}
+        return {column: list(values) for column, values in zip(columns, zip(*rows))}
+    raise ValueError(f"未知的 row_format: {row_format}")
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import os
+import time
+
+from database import async_db
+
+logger = logging.getLogger(__name__)
+
+
+class SalesRollupJob:
+    """销售汇总后台任务
+
+    每 interval 秒执行一次 sp_RefreshSalesRollup（见 database/sales_rollup.sql），
+    只重算水位之后有订单变化的日期。存储过程内用应用锁互斥，多进程部署时同一时刻只有一个在跑。
+    interval <= 0 时不启动后台任务，只能通过接口手动刷新。
+    """
+
+    def __init__(self, interval=60.0):
+        self.interval = interval
+        self.runs = 0
+        self.failures = 0
+        self.last_result = None
+        self.last_error = None
+        self.last_duration_ms = None
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        async with self._lock:
+            started = time.perf_counter()
+            try:
+                result = await async_db.fetch_one("EXEC dbo.sp_RefreshSalesRollup")
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                raise
+            self.runs += 1
+            self.last_result = result
+            self.last_error = None
+            self.last_duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            return result
+
+    async def run_forever(self):
+        while True:
+            try:
+                result = await self.refresh()
+                if result and result["dirty_days"]:
+                    logger.info("销售汇总已更新: %d 个订单变化，重算 %d 天",
+                                result["changed_orders"], result["dirty_days"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("销售汇总刷新失败")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def status(self):
+        state = await async_db.fetch_one("""
+            SELECT watermark, last_run, last_orders, last_days, last_duration_ms,
+                   CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1 - watermark AS version_lag
+            FROM dbo.SalesRollupState
+            WHERE rollup_name = 'sales'
+        """)
+        return {
+            "running": self._task is not None,
+            "interval": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_duration_ms": self.last_duration_ms,
+            "state": state,
+        }
+
+
+# 全局销售汇总任务
+sales_rollup = SalesRollupJob(interval=float(os.getenv("SALES_ROLLUP_INTERVAL", "60")))
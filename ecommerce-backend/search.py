@@ -0,0 +1,419 @@
+import asyncio
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from database import db, async_db
+
+logger = logging.getLogger(__name__)
+
+# 英文/数字按单词切分；中文（CJK 统一表意文字）连续片段单独处理
+_TOKEN_RE = re.compile(r"[0-9a-z]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+
+def _is_cjk(run):
+    return run[0] >= "\u3400"
+
+
+def tokenize(text, query=False):
+    """分词
+
+    英文/数字按单词切分并转小写；中文连续片段切成相邻二元组（bigram）。
+    建索引时中文同时保留单字，方便单字查询；查询时多字片段只用二元组，
+    单字片段用单字。
+    """
+    if not text:
+        return []
+    tokens = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if not _is_cjk(run):
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            if not query:
+                tokens.extend(run)
+    return tokens
+
+
+class InvertedIndex:
+    """进程内倒排索引
+
+    由两部分组成：
+    - 基础段：全量构建时生成，term -> (升序 product_id 数组, 权重数组)，内存紧凑；
+    - 增量段：之后新增/修改的商品，term -> {product_id: 权重}。
+    修改或删除基础段中的商品时只把它加入屏蔽集合，查询时跳过。
+    增量过多（delta_size）时由调用方全量重建。
+
+    商品名中的词权重高于描述。查询时各词之间取交集（AND），从最短的倒排表开始，
+    其余词用二分查找判断是否命中，按 idf 加权求和排序；英文词支持前缀匹配，
+    中间子串（如 "phone" 匹配 "iphone"）不支持。
+    """
+
+    NAME_WEIGHT = 3
+    DESCRIPTION_WEIGHT = 1
+    MAX_PREFIX_EXPANSIONS = 50
+
+    def __init__(self):
+        self._base = {}
+        self._base_ids = array("i")
+        self._delta = defaultdict(dict)
+        self._delta_terms = {}
+        self._masked = set()
+        self._vocab = None  # 排好序的英文词表，用于前缀匹配，修改后懒重建
+        self._lock = threading.RLock()
+
+    @classmethod
+    def build(cls, products):
+        """从 (product_id, name, description) 全量构建基础段，product_id 需升序"""
+        index = cls()
+        base = {}
+        base_ids = index._base_ids
+        for product_id, name, description in products:
+            base_ids.append(product_id)
+            for token, weight in cls._weights(name, description).items():
+                posting = base.get(token)
+                if posting is None:
+                    posting = base[token] = (array("i"), array("B"))
+                posting[0].append(product_id)
+                posting[1].append(min(weight, 255))
+        index._base = base
+        return index
+
+    @classmethod
+    def _weights(cls, name, description):
+        weights = defaultdict(int)
+        for token in tokenize(name):
+            weights[token] += cls.NAME_WEIGHT
+        for token in tokenize(description):
+            weights[token] += cls.DESCRIPTION_WEIGHT
+        return weights
+
+    def __len__(self):
+        return len(self._base_ids) - len(self._masked) + len(self._delta_terms)
+
+    @property
+    def delta_size(self):
+        """增量段商品数 + 被屏蔽的基础段商品数"""
+        return len(self._delta_terms) + len(self._masked)
+
+    def _in_base(self, product_id):
+        ids = self._base_ids
+        i = bisect_left(ids, product_id)
+        return i < len(ids) and ids[i] == product_id
+
+    def upsert(self, product_id, name, description=None):
+        weights = self._weights(name, description)
+        with self._lock:
+            self._remove(product_id)
+            for token, weight in weights.items():
+                if token not in self._delta and token not in self._base:
+                    self._vocab = None
+                self._delta[token][product_id] = weight
+            self._delta_terms[product_id] = tuple(weights)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id):
+        if self._in_base(product_id):
+            self._masked.add(product_id)
+        terms = self._delta_terms.pop(product_id, None)
+        for token in terms or ():
+            posting = self._delta.get(token)
+            if posting is not None:
+                posting.pop(product_id, None)
+                if not posting:
+                    del self._delta[token]
+
+    def _expand(self, token):
+        """查询词对应的索引词：中文原样，英文按前缀展开"""
+        if _is_cjk(token):
+            return [token]
+        if self._vocab is None:
+            self._vocab = sorted(
+                t for t in set(self._base).union(self._delta) if not _is_cjk(t)
+            )
+        vocab = self._vocab
+        start = bisect_left(vocab, token)
+        terms = []
+        for term in vocab[start:start + self.MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(token):
+                break
+            terms.append(term)
+        return terms
+
+    def _postings(self, term, total_docs):
+        """(基础段倒排, 增量段倒排, idf)"""
+        base = self._base.get(term)
+        delta = self._delta.get(term)
+        df = (len(base[0]) if base else 0) + (len(delta) if delta else 0)
+        if not df:
+            return None
+        return base, delta, math.log(1 + total_docs / df)
+
+    def _score(self, product_id, postings):
+        """某个查询词（含前缀展开）对某商品的得分，未命中为 0"""
+        best = 0.0
+        masked = product_id in self._masked
+        for base, delta, idf in postings:
+            weight = 0
+            if delta and product_id in delta:
+                weight = delta[product_id]
+            elif base and not masked:
+                ids = base[0]
+                i = bisect_left(ids, product_id)
+                if i < len(ids) and ids[i] == product_id:
+                    weight = base[1][i]
+            if weight and weight * idf > best:
+                best = weight * idf
+        return best
+
+    def _collect(self, postings):
+        """某个查询词（含前缀展开）命中的全部商品及得分"""
+        masked = self._masked
+        if len(postings) == 1:
+            # 单个索引词：基础段整表直接转成 dict（C 层循环），再处理屏蔽和增量
+            base, delta, idf = postings[0]
+            scores = dict(zip(base[0], map(idf.__mul__, base[1]))) if base else {}
+            for product_id in masked:
+                scores.pop(product_id, None)
+            if delta:
+                scores.update((product_id, weight * idf) for product_id, weight in delta.items())
+            return scores
+
+        scores = {}
+        for base, delta, idf in postings:
+            if base:
+                for product_id, weight in zip(base[0], base[1]):
+                    if weight * idf > scores.get(product_id, 0.0) and product_id not in masked:
+                        scores[product_id] = weight * idf
+            if delta:
+                for product_id, weight in delta.items():
+                    if weight * idf > scores.get(product_id, 0.0):
+                        scores[product_id] = weight * idf
+        return scores
+
+    def search(self, keyword, limit=1000):
+        """返回按相关度排序的 product_id 列表（同分按 product_id 倒序）"""
+        tokens = list(dict.fromkeys(tokenize(keyword, query=True)))
+        if not tokens:
+            return []
+
+        with self._lock:
+            total_docs = len(self) or 1
+            groups = []
+            for token in tokens:
+                postings = [p for p in (self._postings(term, total_docs) for term in self._expand(token)) if p]
+                if not postings:
+                    return []
+                size = sum((len(base[0]) if base else 0) + (len(delta) if delta else 0)
+                           for base, delta, _ in postings)
+                groups.append((size, postings))
+            groups.sort(key=lambda group: group[0])
+
+            # 最短的倒排表生成候选集合
+            scores = self._collect(groups[0][1])
+
+            # 其余查询词逐个过滤候选：候选少时逐个二分查找，候选多时整表扫描更快
+            for size, postings in groups[1:]:
+                if len(scores) * 16 > size:
+                    token_scores = self._collect(postings)
+                    scores = {
+                        product_id: score + token_scores[product_id]
+                        for product_id, score in scores.items()
+                        if product_id in token_scores
+                    }
+                else:
+                    next_scores = {}
+                    for product_id, score in scores.items():
+                        token_score = self._score(product_id, postings)
+                        if token_score:
+                            next_scores[product_id] = score + token_score
+                    scores = next_scores
+                if not scores:
+                    return []
+
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [product_id for product_id, _ in best]
+
+
+class LikeSearchBackend:
+    """原有的 LIKE '%kw%' 模糊匹配（默认，不需要额外建库）
+
+    search() 返回 None，由商品列表自行拼接 LIKE 条件。
+    """
+
+    name = "like"
+
+    async def ensure_fresh(self):
+        pass
+
+    async def search(self, keyword):
+        return None
+
+
+class FullTextSearchBackend:
+    """SQL Server 全文检索（需先执行 database/search.sql 建立全文索引）
+
+    mode=freetext 使用 FREETEXTTABLE（按语义匹配词形），
+    mode=contains 使用 CONTAINSTABLE，每个词做前缀匹配并取交集。
+    """
+
+    name = "fulltext"
+
+    def __init__(self, mode="freetext", max_results=1000):
+        self.mode = mode
+        self.max_results = max_results
+
+    async def ensure_fresh(self):
+        pass
+
+    @staticmethod
+    def contains_condition(keyword):
+        '''把用户输入转换为 CONTAINS 搜索条件：'"词1*" AND "词2*"'''
+        words = [word.replace('"', "") for word in keyword.split()]
+        return " AND ".join(f'"{word}*"' for word in words if word)
+
+    async def search(self, keyword):
+        if self.mode == "contains":
+            function = "CONTAINSTABLE"
+            condition = self.contains_condition(keyword)
+            if not condition:
+                return []
+        else:
+            function = "FREETEXTTABLE"
+            condition = keyword
+
+        sql = f"""
+            SELECT TOP (?) ft.[KEY] AS product_id
+            FROM {function}(dbo.Product, (product_name, description), ?) ft
+            ORDER BY ft.RANK DESC, ft.[KEY] DESC
+        """
+        rows = await async_db.execute_query(sql, (self.max_results, condition))
+        return [row["product_id"] for row in rows]
+
+
+class MemorySearchBackend:
+    """进程内倒排索引
+
+    启动时全量加载上架商品，之后通过 SQL Server 变更跟踪（CHANGETABLE）
+    每 refresh_interval 秒增量同步新增、修改、下架和删除的商品。
+    增量超过 max_delta 个商品时全量重建以压缩索引；
+    数据库未开启变更跟踪时，每 rebuild_interval 秒全量重建一次。
+    """
+
+    name = "memory"
+
+    def __init__(self, refresh_interval=5.0, rebuild_interval=300.0, max_delta=50000, max_results=1000):
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.max_delta = max_delta
+        self.max_results = max_results
+        self.index = InvertedIndex()
+        self.version = None  # 已同步到的变更跟踪版本
+        self._built_at = None
+        self._checked_at = None
+        self._lock = asyncio.Lock()
+
+    def _is_due(self):
+        return self._checked_at is None or time.monotonic() - self._checked_at > self.refresh_interval
+
+    async def ensure_fresh(self):
+        """到期时同步索引（并发请求只触发一次）；重建和同步都在数据库线程池中执行"""
+        if not self._is_due():
+            return
+        async with self._lock:
+            if not self._is_due():
+                return
+            await async_db.run(self.refresh)
+            self._checked_at = time.monotonic()
+
+    def refresh(self):
+        if self.version is not None and self.sync():
+            if self.index.delta_size <= self.max_delta:
+                return
+        if (self.version is not None or self._built_at is None
+                or time.monotonic() - self._built_at > self.rebuild_interval):
+            self.rebuild()
+
+    def rebuild(self):
+        """全量重建：先记下变更版本再读数据，期间的修改会在下一次同步时补上"""
+        row = db.fetch_one("SELECT CHANGE_TRACKING_CURRENT_VERSION() AS version")
+        version = row["version"] if row else None
+
+        products = db.stream_query("""
+            SELECT product_id, product_name, description
+            FROM Product
+            WHERE product_status = 1
+            ORDER BY product_id
+        """, arraysize=10000, row_format="row")
+        index = InvertedIndex.build(
+            (row.product_id, row.product_name, row.description) for row in products
+        )
+
+        self.index = index
+        self.version = version
+        self._built_at = time.monotonic()
+        logger.info("商品搜索索引重建完成: %d 个商品", len(index))
+
+    def sync(self):
+        """增量同步；变更记录已被清理（版本过旧）时返回 False，需要全量重建"""
+        row = db.fetch_one("""
+            SELECT CHANGE_TRACKING_CURRENT_VERSION() AS version,
+                   CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID('dbo.Product')) AS min_version
+        """)
+        if not row or row["min_version"] is None or row["min_version"] > self.version:
+            return False
+        if row["version"] == self.version:
+            return True
+
+        changes = db.execute_query("""
+            SELECT ct.product_id, p.product_name, p.description, p.product_status
+            FROM CHANGETABLE(CHANGES dbo.Product, ?) ct
+            LEFT JOIN Product p ON p.product_id = ct.product_id
+        """, (self.version,), row_format="row")
+        for change in changes:
+            if change["product_name"] is None or change["product_status"] != 1:
+                self.index.remove(change["product_id"])
+            else:
+                self.index.upsert(change["product_id"], change["product_name"], change["description"])
+        self.version = row["version"]
+        return True
+
+    async def search(self, keyword):
+        await self.ensure_fresh()
+        # 分词、求交和打分是纯 CPU 计算，放到线程池中执行，不阻塞事件循环
+        return await async_db.run(self.index.search, keyword, self.max_results)
+
+
+def create_search_backend(name=None):
+    """按 SEARCH_BACKEND 环境变量创建搜索后端：like（默认）/ fulltext / memory"""
+    name = (name or os.getenv("SEARCH_BACKEND", "like")).lower()
+    max_results = int(os.getenv("SEARCH_MAX_RESULTS", "1000"))
+    if name == "fulltext":
+        return FullTextSearchBackend(
+            mode=os.getenv("SEARCH_FULLTEXT_MODE", "freetext").lower(),
+            max_results=max_results
+        )
+    if name == "memory":
+        return MemorySearchBackend(
+            refresh_interval=float(os.getenv("SEARCH_INDEX_REFRESH", "5")),
+            rebuild_interval=float(os.getenv("SEARCH_INDEX_REBUILD", "300")),
+            max_delta=int(os.getenv("SEARCH_INDEX_MAX_DELTA", "50000")),
+            max_results=max_results
+        )
+    return LikeSearchBackend()
+
+
+# 全局搜索后端
+search_backend = create_search_backend()
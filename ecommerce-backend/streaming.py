@@ -0,0 +1,154 @@
+import csv
+import io
+import zlib
+
+import anyio
+from fastapi.responses import StreamingResponse
+
+# 与普通接口共用同一个序列化器（Decimal、日期等的输出格式一致）
+from responses import dumps
+
+# 每攒够这么多字节向客户端写一次
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+async def iter_json_array(rows, envelope=True, chunk_size=STREAM_CHUNK_SIZE):
+    """把行逐条序列化为 JSON 数组
+
+    envelope=True 时外层保持接口统一格式 {"code":200,"message":"success","data":[...]}。
+    中途出错时直接中断连接，客户端会收到不完整的 JSON。
+    """
+    buffer = [b'{"code":200,"message":"success","data":[' if envelope else b"["]
+    size = 0
+    first = True
+    async for row in rows:
+        piece = dumps(row) if first else b"," + dumps(row)
+        first = False
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(b"]}" if envelope else b"]")
+    yield b"".join(buffer)
+
+
+async def iter_ndjson(rows, chunk_size=STREAM_CHUNK_SIZE):
+    """每行一个 JSON 对象（NDJSON）"""
+    buffer = []
+    size = 0
+    async for row in rows:
+        piece = dumps(row) + b"\n"
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+async def iter_csv(rows, columns, chunk_size=STREAM_CHUNK_SIZE):
+    """按 columns 顺序输出 CSV（首行为表头，None 输出为空串）
+
+    带 UTF-8 BOM，Excel 打开中文不乱码。
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    buffer.write("\ufeff")
+    writer.writerow(columns)
+    async for row in rows:
+        writer.writerow([row.get(column) for column in columns])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def iter_gzip(chunks, level=6):
+    """边读边压缩为 gzip 流"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(request):
+    return "gzip" in request.headers.get("accept-encoding", "").lower()
+
+
+async def _prefetched(first, rows):
+    try:
+        yield first
+        async for row in rows:
+            yield row
+    finally:
+        await rows.aclose()
+
+
+async def _empty():
+    return
+    yield
+
+
+async def prefetch(rows):
+    """先取出第一行再开始响应：查询本身出错时还能返回正常的错误状态码"""
+    try:
+        first = await rows.__anext__()
+    except StopAsyncIteration:
+        return _empty()
+    return _prefetched(first, rows)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """发送结束、出错或客户端中途断开时立即关闭行迭代器
+
+    StreamingResponse 在客户端断开时只取消发送任务，不会关闭响应体的异步生成器，
+    底层 stream_query 占用的连接和游标要等垃圾回收才归还连接池。这里在响应结束时显式 aclose，
+    并屏蔽取消，保证关闭游标、归还连接的这一步能执行完。
+    """
+
+    def __init__(self, content, rows, **kwargs):
+        super().__init__(content, **kwargs)
+        self.rows = rows
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+                await self.rows.aclose()
+
+
+async def stream_rows(rows, format="json", filename=None, columns=None, gzip=False, headers=None):
+    """把异步行迭代器包装成 StreamingResponse（format: json / ndjson / csv）
+
+    format=csv 时需要传入 columns；gzip=True 时以 Content-Encoding: gzip 压缩响应体。
+    """
+    source = rows
+    rows = await prefetch(rows)
+    if format == "ndjson":
+        body = iter_ndjson(rows)
+        media_type = "application/x-ndjson"
+    elif format == "csv":
+        body = iter_csv(rows, columns)
+        media_type = "text/csv"
+    else:
+        body = iter_json_array(rows)
+        media_type = "application/json"
+
+    headers = dict(headers or {})
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    if gzip:
+        body = iter_gzip(body)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return ClosingStreamingResponse(body, source, media_type=media_type, headers=headers)
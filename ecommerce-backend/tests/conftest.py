@@ -0,0 +1,77 @@
+import pytest
+
+from database import Database
+
+
+class FakeCursor:
+    """只接受 SQL 文本的游标（与 pyodbc 相同，传入其他对象时报 TypeError）"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.arraysize = 1
+        self.closed = False
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        if not isinstance(sql, str):
+            raise TypeError(f"expected string or bytes-like object, got '{type(sql).__name__}'")
+        self.connection.executed.append((sql, tuple(params)))
+        result = self.connection.results.get(sql)
+        if callable(result):
+            result = result(tuple(params))
+        if isinstance(result, Exception):
+            raise result
+        columns, self._rows = result if result is not None else (["value"], [(1,)])
+        self.description = [(column,) for column in columns]
+        self._rows = list(self._rows)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    """results：SQL 文本 -> (列名, 行列表)、异常，或按参数返回二者之一的函数"""
+
+    def __init__(self, results):
+        self.results = results
+        self.executed = []
+        self.cursors = []
+
+    def cursor(self):
+        cursor = FakeCursor(self)
+        self.cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def make_db(monkeypatch):
+    """用假连接创建真实的 Database（连接池、注册语句游标、指标都走真实代码）"""
+    monkeypatch.setenv("DB_POOL_MIN_SIZE", "1")
+    monkeypatch.setenv("DB_POOL_MAX_SIZE", "1")
+    databases = []
+
+    def make(results):
+        connection = FakeConnection(results)
+        db = Database()
+        db._connect = lambda: connection
+        databases.append(db)
+        return db, connection
+
+    yield make
+    for db in databases:
+        db.close()
@@ -0,0 +1,43 @@
+import re
+from pathlib import Path
+
+from cart import BATCH_UPDATE_SQL
+
+# 数据库导出脚本（SSMS 生成，UTF-16 编码），包含基础表结构和触发器
+SCHEMA = Path(__file__).resolve().parents[2] / "database" / "test.sql"
+
+
+def instead_of_tables():
+    """导出脚本中定义了 INSTEAD OF 触发器的表"""
+    schema = SCHEMA.read_text(encoding="utf-16")
+    return {
+        table.lower()
+        for table in re.findall(
+            r"CREATE\s+TRIGGER\s+\S+\s+ON\s+\[dbo\]\.\[(\w+)\]\s+INSTEAD\s+OF", schema, re.IGNORECASE
+        )
+    }
+
+
+def merge_targets(sql):
+    return {
+        table.lower()
+        for table in re.findall(r"\bMERGE\s+(?:INTO\s+)?(?:\[?dbo\]?\.)?\[?(\w+)\]?", sql, re.IGNORECASE)
+    }
+
+
+def test_schema_has_cart_instead_of_trigger():
+    # trg_CheckStockBeforeCartInsert：Cart 上的 INSTEAD OF INSERT
+    assert "cart" in instead_of_tables()
+
+
+def test_batch_update_does_not_merge_into_instead_of_tables():
+    # SQL Server 拒绝 MERGE 到带 INSTEAD OF 触发器的表（Msg 5316）
+    assert not merge_targets(BATCH_UPDATE_SQL) & instead_of_tables()
+
+
+def test_batch_update_writes_cart_with_plain_statements():
+    sql = " ".join(BATCH_UPDATE_SQL.split())
+    assert "DELETE c FROM Cart c" in sql
+    assert "UPDATE c SET cart_quantity = s.target" in sql
+    assert "INSERT INTO Cart (cart_id, user_id, product_id, cart_quantity, add_time)" in sql
+    assert "WITH (UPDLOCK, HOLDLOCK)" in sql
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+import queries
+from cart_cache import CartCache
+from database import async_db
+from promotions import promotion_index
+
+
+class FakeFeed:
+    """商品没有任何变化的版本变更流"""
+
+    version = 1
+
+    async def ensure_fresh(self):
+        pass
+
+    def is_stale(self, snapshot):
+        return False
+
+
+class FakeCartTables:
+    """内存中的 CartVersion，并记录明细查询次数"""
+
+    def __init__(self, version):
+        self.version = version
+        self.view_queries = 0
+
+    async def fetch_one(self, sql, params=None):
+        assert sql is queries.CART_VERSION
+        return {"version": self.version}
+
+    async def execute_query(self, sql, params=None, row_format="dict"):
+        assert sql is queries.CART_VIEW
+        self.view_queries += 1
+        return []
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    tables = FakeCartTables(version=7)
+    monkeypatch.setattr(async_db, "fetch_one", tables.fetch_one)
+    monkeypatch.setattr(async_db, "execute_query", tables.execute_query)
+    promotion_index.load([])
+    return tables
+
+
+ROWS = [{"cart_id": 1, "user_id": 5, "product_id": 3, "cart_quantity": 2, "price": 10, "product_version": 1}]
+
+
+def test_get_after_batch_put_is_served_from_snapshot(tables):
+    cache = CartCache(feed=FakeFeed())
+
+    async def scenario():
+        # 批量修改后用同一事务中读取的版本号保存快照
+        stored = await cache.put(5, ROWS, cart_version=7)
+        first = await cache.get(5)
+        second = await cache.get(5)
+        return stored, first, second
+
+    stored, first, second = asyncio.run(scenario())
+
+    assert first is stored and second is stored
+    assert tables.view_queries == 0
+    assert (cache.hits, cache.misses, cache.stale) == (2, 0, 0)
+    assert second.to_response()["summary"]["total_amount"] == 20.0
+
+
+def test_get_reloads_after_write_from_other_worker(tables):
+    cache = CartCache(feed=FakeFeed())
+
+    async def scenario():
+        await cache.put(5, ROWS, cart_version=7)
+        tables.version = 8
+        return await cache.get(5)
+
+    reloaded = asyncio.run(scenario())
+
+    assert reloaded.cart_version == 8
+    assert tables.view_queries == 1
+    assert (cache.misses, cache.stale) == (1, 1)
+
+
+def test_read_version_and_load_through_real_database(make_db, monkeypatch):
+    # 走真实的 Database.fetch_one / execute_query（注册语句解包），只替换底层连接
+    db, connection = make_db({
+        queries.CART_VERSION.sql: (["version"], [(3,)]),
+        queries.CART_VIEW.sql: (list(ROWS[0]), [tuple(ROWS[0].values())]),
+    })
+    monkeypatch.setattr(async_db, "database", db)
+    promotion_index.load([])
+    cache = CartCache(feed=FakeFeed())
+
+    async def scenario():
+        assert await cache.read_version(5) == 3
+        first = await cache.get(5)
+        second = await cache.get(5)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert second is first and first.cart_version == 3
+    assert [sql for sql, _ in connection.executed].count(queries.CART_VIEW.sql) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
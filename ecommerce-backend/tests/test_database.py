@@ -0,0 +1,53 @@
+import pyodbc
+import pytest
+
+import metrics
+import queries
+
+
+def test_fetch_one_runs_registered_statement_on_its_cursor(make_db):
+    db, connection = make_db({queries.AUTH_ADMIN.sql: (["user_id"], [(1,)])})
+
+    assert db.fetch_one(queries.AUTH_ADMIN, (1,)) == {"user_id": 1}
+    assert db.fetch_one(queries.AUTH_ADMIN, (1,)) == {"user_id": 1}
+
+    # 两次执行都传入 SQL 文本，复用同一个专用游标
+    assert connection.executed == [(queries.AUTH_ADMIN.sql, (1,))] * 2
+    assert len(connection.cursors) == 1 and not connection.cursors[0].closed
+
+
+def test_fetch_one_returns_none_for_missing_row(make_db):
+    db, _ = make_db({queries.CART_VERSION.sql: (["version"], [])})
+
+    assert db.fetch_one(queries.CART_VERSION, (5,)) is None
+
+
+def test_fetch_one_forgets_statement_cursor_after_error(make_db):
+    db, connection = make_db({queries.AUTH_ADMIN.sql: pyodbc.ProgrammingError("42S02", "Invalid object name")})
+    errors = metrics.db_errors._values.get(("fetch_one", "auth_admin"), 0)
+
+    with pytest.raises(pyodbc.ProgrammingError):
+        db.fetch_one(queries.AUTH_ADMIN, (1,))
+
+    # 出错的专用游标被丢弃，错误按注册名计数
+    assert connection.cursors[0].closed
+    assert metrics.db_errors._values[("fetch_one", "auth_admin")] == errors + 1
+
+
+def test_fetch_one_still_accepts_sql_text(make_db):
+    db, connection = make_db({"SELECT 2 AS two": (["two"], [(2,)])})
+
+    assert db.fetch_one("SELECT 2 AS two") == {"two": 2}
+    assert connection.cursors[-1].closed
+
+
+def test_stream_batches_counts_failed_statement(make_db):
+    sql = "SELECT * FROM Payment"
+    db, _ = make_db({sql: pyodbc.ProgrammingError("42000", "Invalid column name")})
+    statement = metrics.statement_id("stream", sql)
+    errors = metrics.db_errors._values.get(("stream", statement), 0)
+
+    with pytest.raises(pyodbc.ProgrammingError):
+        list(db.stream_batches(sql))
+
+    assert metrics.db_errors._values[("stream", statement)] == errors + 1
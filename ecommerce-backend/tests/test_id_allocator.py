@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from id_allocator import IdAllocator
+
+
+class FakeSequence:
+    """模拟 sys.sp_sequence_get_range：按调用顺序返回互不重叠的号段"""
+
+    def __init__(self, start=1, delay=0.0):
+        self.value = start
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def fetch_one(self, sql, params):
+        _, size = params
+        # 放大预留期间的并发窗口
+        time.sleep(self.delay)
+        with self._lock:
+            first = self.value
+            self.value += size
+            self.calls += 1
+        return {"first_value": first}
+
+
+def test_threads_get_unique_contiguous_ids():
+    sequence = FakeSequence(delay=0.001)
+    allocator = IdAllocator("dbo.seq_Address", block_size=100, database=sequence)
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        ids = list(executor.map(lambda _: allocator.next_id(), range(10000)))
+
+    # 10000 个 ID 各不相同，且恰好占满 100 个号段，号段内没有跳号
+    assert len(set(ids)) == 10000
+    assert sorted(ids) == list(range(1, 10001))
+    assert sequence.calls == allocator.reservations == 100
+
+
+def test_take_only_hands_out_current_block():
+    sequence = FakeSequence(start=501)
+    allocator = IdAllocator("dbo.seq_Address", block_size=3, database=sequence)
+
+    assert allocator.take() is None
+    assert allocator.next_id() == 501
+    assert [allocator.take(), allocator.take(), allocator.take()] == [502, 503, None]
+    assert allocator.next_id() == 504
+    assert sequence.calls == 2
+
+
+def test_allocators_sharing_a_sequence_do_not_overlap():
+    # 相当于多个进程各自持有一个分配器
+    sequence = FakeSequence()
+    allocators = [IdAllocator("dbo.seq_Address", block_size=50, database=sequence) for _ in range(4)]
+
+    def run(allocator):
+        return [allocator.next_id() for _ in range(1000)]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(run, allocators))
+
+    ids = [value for result in results for value in result]
+    assert len(set(ids)) == 4000
+    for result in results:
+        # 同一个分配器发出的 ID 递增
+        assert result == sorted(result)
+
+
+def test_concurrent_async_inserts_get_unique_ids():
+    sequence = FakeSequence(delay=0.001)
+    allocator = IdAllocator("dbo.seq_Address", block_size=100, database=sequence)
+
+    async def main():
+        return await asyncio.gather(*(allocator.next_id_async() for _ in range(10000)))
+
+    ids = asyncio.run(main())
+    assert sorted(ids) == list(range(1, 10001))
+    assert sequence.calls == 100
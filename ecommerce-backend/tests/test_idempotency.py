@@ -0,0 +1,272 @@
+import asyncio
+import json
+
+import pyodbc
+import pytest
+from fastapi import HTTPException
+
+import database
+import idempotency
+from database import async_db
+from idempotency import IdempotencyStore
+
+
+class FakeIdempotencyTable:
+    """内存中的 dbo.IdempotencyKey，按语句模拟 idempotency.py 中的 SQL"""
+
+    def __init__(self):
+        self.rows = {}
+        self.deadlocks = 0
+
+    async def execute_update(self, sql, params=None):
+        if sql is idempotency.CLAIM_SQL:
+            if self.deadlocks:
+                self.deadlocks -= 1
+                raise pyodbc.Error("40001", "[40001] Transaction was deadlocked on lock resources (1205)")
+            user_id, key, request_hash = params[0], params[1], params[2]
+            row = self.rows.get((user_id, key))
+            if row is not None and not row["expired"]:
+                return 0
+            self.rows[(user_id, key)] = {"request_hash": request_hash, "status_code": None,
+                                         "response": None, "expired": False}
+            return 1
+        if sql is idempotency.COMPLETE_SQL:
+            status_code, response, _, user_id, key = params
+            self.rows[(user_id, key)].update(status_code=status_code, response=response)
+            return 1
+        if sql is idempotency.RELEASE_SQL:
+            row = self.rows.get(params)
+            if row is not None and row["status_code"] is None:
+                del self.rows[params]
+                return 1
+            return 0
+        raise AssertionError(f"未预期的语句: {sql}")
+
+    async def fetch_one(self, sql, params=None):
+        assert sql is idempotency.LOOKUP_SQL
+        row = self.rows.get(params)
+        return None if row is None else {k: row[k] for k in ("request_hash", "status_code", "response")}
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeIdempotencyTable()
+    monkeypatch.setattr(async_db, "execute_update", table.execute_update)
+    monkeypatch.setattr(async_db, "fetch_one", table.fetch_one)
+    monkeypatch.setenv("DB_RETRY_BASE_MS", "1")
+    return table
+
+
+def counting(result=None, error=None):
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        await asyncio.sleep(0)
+        if error is not None:
+            raise error
+        return result
+
+    return operation, calls
+
+
+def test_first_request_runs_and_retry_is_replayed(table):
+    store = IdempotencyStore()
+    request = {"endpoint": "create_order", "address_id": 1}
+    result = {"code": 200, "message": "success", "data": {"order_id": 42}}
+    operation, calls = counting(result)
+
+    assert asyncio.run(store.run(7, "key-1", request, operation)) == result
+    replayed = asyncio.run(store.run(7, "key-1", request, operation))
+
+    assert len(calls) == 1
+    assert replayed.status_code == 200
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert json.loads(replayed.body) == result
+    assert store.replays == 1
+
+
+def test_same_key_for_another_user_is_independent(table):
+    store = IdempotencyStore()
+    operation, calls = counting({"data": 1})
+    asyncio.run(store.run(7, "key-1", {}, operation))
+    asyncio.run(store.run(8, "key-1", {}, operation))
+    assert len(calls) == 2
+
+
+def test_same_key_with_different_request_is_rejected(table):
+    store = IdempotencyStore()
+    operation, calls = counting({"data": 1})
+    asyncio.run(store.run(7, "key-1", {"address_id": 1}, operation))
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(store.run(7, "key-1", {"address_id": 2}, operation))
+    assert error.value.status_code == 422
+    assert len(calls) == 1
+    assert store.conflicts == 1
+
+
+def test_concurrent_duplicate_gets_409_while_in_progress(table):
+    store = IdempotencyStore()
+
+    async def main():
+        started = asyncio.Event()
+        finish = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await finish.wait()
+            return {"data": 1}
+
+        first = asyncio.create_task(store.run(7, "key-1", {}, slow))
+        await started.wait()
+        with pytest.raises(HTTPException) as error:
+            await store.run(7, "key-1", {}, slow)
+        finish.set()
+        await first
+        return error.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 409
+    assert error.headers["Retry-After"] == "1"
+
+
+def test_client_error_is_stored_and_replayed(table):
+    store = IdempotencyStore()
+    operation, calls = counting(error=HTTPException(status_code=400, detail="购物车为空"))
+
+    with pytest.raises(HTTPException):
+        asyncio.run(store.run(7, "key-1", {}, operation))
+    replayed = asyncio.run(store.run(7, "key-1", {}, operation))
+
+    assert len(calls) == 1
+    assert replayed.status_code == 400
+    assert json.loads(replayed.body) == {"detail": "购物车为空"}
+
+
+@pytest.mark.parametrize("error", [HTTPException(status_code=503, detail="系统繁忙"), RuntimeError("连接断开")])
+def test_server_error_releases_key(table, error):
+    store = IdempotencyStore()
+    failing, _ = counting(error=error)
+    with pytest.raises(type(error)):
+        asyncio.run(store.run(7, "key-1", {}, failing))
+    assert table.rows == {}
+
+    operation, calls = counting({"data": 1})
+    assert asyncio.run(store.run(7, "key-1", {}, operation)) == {"data": 1}
+    assert len(calls) == 1
+
+
+def test_expired_key_can_be_claimed_again(table):
+    store = IdempotencyStore()
+    operation, calls = counting({"data": 1})
+    asyncio.run(store.run(7, "key-1", {}, operation))
+    table.rows[(7, "key-1")]["expired"] = True
+    asyncio.run(store.run(7, "key-1", {}, operation))
+    assert len(calls) == 2
+
+
+def test_claim_is_retried_on_deadlock(table):
+    store = IdempotencyStore()
+    table.deadlocks = 2
+    operation, calls = counting({"data": 1})
+    assert asyncio.run(store.run(7, "key-1", {}, operation)) == {"data": 1}
+    assert len(calls) == 1
+    assert table.deadlocks == 0
+
+
+def test_invalid_or_missing_key(table):
+    store = IdempotencyStore()
+    operation, calls = counting({"data": 1})
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(store.run(7, "bad key", {}, operation))
+    assert error.value.status_code == 400
+
+    asyncio.run(store.run(7, None, {}, operation))
+    asyncio.run(store.run(7, None, {}, operation))
+    assert len(calls) == 2
+    assert table.rows == {}
+
+
+def test_many_checkouts_with_duplicate_submissions_run_once(table):
+    # 1000 次结算，每个键并发提交 3 次，占用语句随机遇到死锁
+    store = IdempotencyStore()
+    executed = {}
+
+    async def checkout(key):
+        async def operation():
+            await asyncio.sleep(0)
+            executed[key] = executed.get(key, 0) + 1
+            return {"data": {"order_id": key}}
+
+        for _ in range(20):
+            try:
+                response = await store.run(7, key, {"endpoint": "create_order"}, operation)
+            except HTTPException as e:
+                assert e.status_code == 409
+                await asyncio.sleep(0.001)
+                continue
+            return response if isinstance(response, dict) else json.loads(response.body)
+        raise AssertionError("重试次数用尽")
+
+    async def main():
+        table.deadlocks = 100
+        keys = [f"order-{i}" for i in range(1000)]
+        return keys, await asyncio.gather(*(checkout(key) for key in keys for _ in range(3)))
+
+    keys, responses = asyncio.run(main())
+    assert executed == {key: 1 for key in keys}
+    assert [r["data"]["order_id"] for r in responses] == [key for key in keys for _ in range(3)]
+
+
+class TestRetry:
+    @pytest.fixture(autouse=True)
+    def fast_backoff(self, monkeypatch):
+        monkeypatch.setenv("DB_RETRY_BASE_MS", "1")
+        monkeypatch.setenv("DB_RETRY_MAX_MS", "2")
+
+    @staticmethod
+    def failing(errors, result="ok"):
+        calls = []
+
+        async def call():
+            calls.append(1)
+            if errors:
+                raise errors.pop(0)
+            return result
+
+        return call, calls
+
+    @pytest.mark.parametrize("error", [
+        pyodbc.Error("40001", "[40001] Transaction (Process ID 57) was deadlocked on lock resources (1205)"),
+        pyodbc.Error("HY000", "[HY000] Snapshot isolation transaction aborted due to update conflict (3960)"),
+        pyodbc.Error("42000", "[42000] 事务与另一个进程被死锁在 锁 资源上"),
+    ])
+    def test_retryable_error_is_retried(self, error):
+        call, calls = self.failing([error, error])
+        assert asyncio.run(async_db.retry(call, name="test")) == "ok"
+        assert len(calls) == 3
+
+    def test_other_errors_raise_immediately(self):
+        error = pyodbc.Error("23000", "[23000] Violation of PRIMARY KEY constraint (2627)")
+        call, calls = self.failing([error])
+        with pytest.raises(pyodbc.Error):
+            asyncio.run(async_db.retry(call))
+        assert len(calls) == 1
+
+        call, calls = self.failing([ValueError("x")])
+        with pytest.raises(ValueError):
+            asyncio.run(async_db.retry(call))
+        assert len(calls) == 1
+
+    def test_gives_up_after_attempts(self):
+        errors = [pyodbc.Error("40001", "deadlocked (1205)") for _ in range(5)]
+        call, calls = self.failing(errors)
+        with pytest.raises(pyodbc.Error):
+            asyncio.run(async_db.retry(call, attempts=3))
+        assert len(calls) == 3
+
+    def test_is_retryable(self):
+        assert database.is_retryable(pyodbc.Error("40001", "deadlocked (1205)"))
+        assert not database.is_retryable(pyodbc.Error("42000", "Incorrect syntax (102)"))
+        assert not database.is_retryable(RuntimeError("deadlock"))
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+import pricing
+from cart_cache import CartSnapshot
+from promotions import promotion_index
+
+
+def promotion_row(product_id, promotion_id, discount_type, discount_value, now):
+    return {
+        "product_id": product_id,
+        "promotion_id": promotion_id,
+        "discount_type": discount_type,
+        "discount_value": Decimal(discount_value),
+        "start_time": now - timedelta(days=1),
+        "end_time": now + timedelta(days=1),
+    }
+
+
+@pytest.fixture
+def index():
+    yield promotion_index
+    promotion_index.load([])
+
+
+@pytest.mark.parametrize("discount_type, discount_value, valid", [
+    (1, "0.90", True),
+    (1, "1", True),
+    (1, "90", False),  # 按百分比录入的九折，不再按 0.90 理解
+    (1, "0", False),
+    (2, "10.00", True),
+    (2, "-5", False),
+])
+def test_valid_promotion(discount_type, discount_value, valid):
+    assert pricing.valid_promotion(discount_type, Decimal(discount_value)) is valid
+
+
+def test_index_drops_out_of_range_promotions(index):
+    now = datetime.now()
+    index.load([
+        promotion_row(1, 10, 1, "90", now),
+        promotion_row(1, 11, 2, "5.00", now),
+    ], db_now=now)
+
+    assert [p["promotion_id"] for p in index.active_promotions(1)] == [11]
+    assert index.best_price(1, Decimal("100.00")) == (Decimal("95.00"), index.active_promotions(1)[0])
+
+
+def test_order_prices_match_cart_lines(index):
+    now = datetime.now()
+    index.load([promotion_row(1, 10, 1, "0.85", now)], db_now=now)
+    snapshot = CartSnapshot([
+        {"product_id": 1, "cart_quantity": 2, "price": Decimal("19.99")},
+        {"product_id": 2, "cart_quantity": 1, "price": Decimal("5.00")},
+    ], feed_version=0)
+
+    prices = {item["product_id"]: item for item in snapshot.order_prices()}
+    lines = {item["product_id"]: item for item in snapshot.to_response()["items"]}
+
+    assert prices[1] == {"product_id": 1, "list_price": "19.99", "unit_price": "16.99"}
+    assert prices[2] == {"product_id": 2, "list_price": "5.00", "unit_price": "5.00"}
+    for product_id, item in prices.items():
+        assert float(item["unit_price"]) == lines[product_id]["price"]
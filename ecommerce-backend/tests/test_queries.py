@@ -0,0 +1,23 @@
+import itertools
+
+import pytest
+
+import queries
+
+
+SALES_VARIANTS = list(itertools.product(
+    queries.PRODUCT_LIST_SEARCH, ["sales"], queries.PRODUCT_LIST_CATEGORY, queries.PRODUCT_LIST_PAGE
+))
+
+
+@pytest.mark.parametrize("variant", SALES_VARIANTS, ids=".".join)
+def test_sales_sort_orders_and_seeks_on_index_columns(variant):
+    sql = queries.registry.get("product_list." + ".".join(variant)).sql
+
+    # 排序键必须是 IX_ProductSales_Sold 的列本身，包一层 ISNULL 就只能全表扫描再排序
+    assert "INNER JOIN ProductSales s ON s.product_id = p.product_id" in sql
+    assert "ISNULL(s.sold_quantity" not in sql.replace("ISNULL(s.sold_quantity, 0) AS sold_quantity", "")
+    if variant[3] in ("offset", "first", "next"):
+        assert "ORDER BY s.sold_quantity DESC, s.product_id DESC" in sql
+    if variant[3] == "next":
+        assert "(s.sold_quantity < ? OR (s.sold_quantity = ? AND s.product_id < ?))" in sql
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import auth
+import queries
+from database import async_db
+
+
+class FakeAdminTable:
+    """内存中的 dbo.AdminUser"""
+
+    def __init__(self, *user_ids):
+        self.user_ids = set(user_ids)
+        self.lookups = 0
+
+    async def fetch_one(self, sql, params=None):
+        assert sql is queries.AUTH_ADMIN
+        self.lookups += 1
+        (user_id,) = params
+        return {"user_id": user_id} if user_id in self.user_ids else None
+
+
+@pytest.fixture
+def admins(monkeypatch):
+    table = FakeAdminTable(1)
+    monkeypatch.setattr(async_db, "fetch_one", table.fetch_one)
+    return table
+
+
+def test_user_promoted_by_spend_trigger_is_not_admin(admins):
+    # trg_UpdateUserLevelOnOrderComplete 把累计消费 >= 10000 的用户改为 user_type = 2（VIP）
+    vip = {"user_id": 42, "username": "big_spender", "user_type": 2}
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(auth.require_admin(vip))
+
+    assert exc_info.value.status_code == 403
+    assert admins.lookups == 1
+
+
+def test_listed_admin_is_allowed_regardless_of_user_type(admins):
+    admin = {"user_id": 1, "username": "admin", "user_type": 0}
+
+    assert asyncio.run(auth.require_admin(admin)) is admin
+
+
+def test_require_admin_through_real_fetch_one(make_db, monkeypatch):
+    # 走真实的 Database.fetch_one（注册语句解包、专用游标），只替换底层连接
+    db, connection = make_db({
+        queries.AUTH_ADMIN.sql: lambda params: (["user_id"], [params] if params == (1,) else []),
+    })
+    monkeypatch.setattr(async_db, "database", db)
+
+    admin = {"user_id": 1, "username": "admin", "user_type": 0}
+    assert asyncio.run(auth.require_admin(admin)) is admin
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(auth.require_admin({"user_id": 42, "username": "big_spender", "user_type": 2}))
+    assert exc_info.value.status_code == 403
+    assert connection.executed == [(queries.AUTH_ADMIN.sql, (1,)), (queries.AUTH_ADMIN.sql, (42,))]
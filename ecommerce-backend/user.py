@@ -2,11 +2,16 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
+import logging
 
-from database import db
-from auth import get_current_user
+from database import async_db
+from responses import FastJSONRoute
+from auth import get_current_user, get_current_user_claims
+from id_allocator import address_ids
 
-router = APIRouter(prefix="/user", tags=["用户管理"])
+router = APIRouter(prefix="/user", tags=["用户管理"], route_class=FastJSONRoute)
+
+logger = logging.getLogger(__name__)
 
 # ==================== 地址模型定义 ====================
 
@@ -34,14 +39,12 @@ class AddressResponse(AddressBase):
 # ==================== 获取地址列表API ====================
 
 @router.get("/addresses", response_model=dict)
-async def get_addresses(current_user: dict = Depends(get_current_user)):
+async def get_addresses(current_user: dict = Depends(get_current_user_claims)):
     """获取当前用户的地址列表"""
     try:
         user_id = current_user["user_id"]
-        print(f"📋 获取用户地址列表，用户ID: {user_id}")
-        
         # 查询地址
-        addresses = db.execute_query(
+        addresses = await async_db.execute_query(
             "SELECT * FROM Address WHERE user_id = ? ORDER BY is_default DESC, address_id DESC",
             (user_id,)
         )
@@ -56,7 +59,7 @@ async def get_addresses(current_user: dict = Depends(get_current_user)):
         }
         
     except Exception as e:
-        print(f"💥 获取地址列表异常: {str(e)}")
+        logger.exception("获取地址列表异常")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"获取地址失败: {str(e)}"
@@ -72,21 +75,20 @@ async def create_address(
     """添加新地址"""
     try:
         user_id = current_user["user_id"]
-        print(f"📝 添加地址，用户ID: {user_id}, 数据: {address_data.dict()}")
+        logger.debug("添加地址", extra={"user_id": user_id})
         
         # 转换 is_default: True/False → 1/0
         is_default_int = 1 if address_data.is_default else 0
         
         # 如果设置为默认地址，需要取消其他地址的默认状态
         if is_default_int == 1:
-            db.execute_update(
+            await async_db.execute_update(
                 "UPDATE Address SET is_default = 0 WHERE user_id = ?",
                 (user_id,)
             )
         
-        # 生成唯一的address_id
-        max_id_result = db.execute_query("SELECT ISNULL(MAX(address_id), 0) as max_id FROM Address")
-        new_address_id = max_id_result[0]["max_id"] + 1 if max_id_result else 1
+        # 从号段分配器取唯一的address_id（不再 MAX+1，避免并发主键冲突）
+        new_address_id = await address_ids.next_id_async()
         
         # 插入新地址
         sql = """
@@ -105,12 +107,12 @@ async def create_address(
             is_default_int
         )
         
-        db.execute_update(sql, params)
+        await async_db.execute_update(sql, params)
         
-        # 获取新插入的地址ID
-        new_address = db.execute_query(
-            "SELECT TOP 1 * FROM Address WHERE user_id = ? ORDER BY address_id DESC",
-            (user_id,)
+        # 获取新插入的地址
+        new_address = await async_db.execute_query(
+            "SELECT * FROM Address WHERE address_id = ?",
+            (new_address_id,)
         )
         
         if new_address:
@@ -126,7 +128,7 @@ async def create_address(
             )
             
     except Exception as e:
-        print(f"💥 添加地址异常: {str(e)}")
+        logger.exception("添加地址异常")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"添加地址失败: {str(e)}"
@@ -143,10 +145,10 @@ async def update_address(
     """修改地址"""
     try:
         user_id = current_user["user_id"]
-        print(f"📝 修改地址，地址ID: {address_id}, 用户ID: {user_id}")
+        logger.debug("修改地址", extra={"user_id": user_id, "address_id": address_id})
         
         # 1. 验证地址是否存在且属于当前用户
-        existing_address = db.execute_query(
+        existing_address = await async_db.execute_query(
             "SELECT * FROM Address WHERE address_id = ? AND user_id = ?",
             (address_id, user_id)
         )
@@ -162,7 +164,7 @@ async def update_address(
         
         # 3. 如果设置为默认地址，需要取消其他地址的默认状态
         if is_default_int == 1:
-            db.execute_update(
+            await async_db.execute_update(
                 "UPDATE Address SET is_default = 0 WHERE user_id = ? AND address_id != ?",
                 (user_id, address_id)
             )
@@ -188,11 +190,11 @@ async def update_address(
             user_id
         )
         
-        rows_affected = db.execute_update(sql, params)
+        rows_affected = await async_db.execute_update(sql, params)
         
         if rows_affected > 0:
             # 获取更新后的地址
-            updated_address = db.execute_query(
+            updated_address = await async_db.execute_query(
                 "SELECT * FROM Address WHERE address_id = ?",
                 (address_id,)
             )
@@ -211,7 +213,7 @@ async def update_address(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"💥 修改地址异常: {str(e)}")
+        logger.exception("修改地址异常")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"修改地址失败: {str(e)}"
@@ -227,10 +229,10 @@ async def delete_address(
     """删除地址"""
     try:
         user_id = current_user["user_id"]
-        print(f"🗑️ 删除地址，地址ID: {address_id}, 用户ID: {user_id}")
+        logger.debug("删除地址", extra={"user_id": user_id, "address_id": address_id})
         
         # 1. 验证地址是否存在且属于当前用户
-        existing_address = db.execute_query(
+        existing_address = await async_db.execute_query(
             "SELECT * FROM Address WHERE address_id = ? AND user_id = ?",
             (address_id, user_id)
         )
@@ -245,10 +247,10 @@ async def delete_address(
         if existing_address[0]["is_default"] == 1:
             # 可以选择不允许删除默认地址，或者允许但需要处理
             # 这里我们先允许删除，但给出警告
-            print("⚠️ 正在删除默认地址")
+            logger.info("删除默认地址", extra={"user_id": user_id, "address_id": address_id})
         
         # 3. 删除地址
-        rows_affected = db.execute_update(
+        rows_affected = await async_db.execute_update(
             "DELETE FROM Address WHERE address_id = ? AND user_id = ?",
             (address_id, user_id)
         )
@@ -271,7 +273,7 @@ async def delete_address(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"💥 删除地址异常: {str(e)}")
+        logger.exception("删除地址异常")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"删除地址失败: {str(e)}"
@@ -287,10 +289,10 @@ async def set_default_address(
     """设置默认地址"""
     try:
         user_id = current_user["user_id"]
-        print(f"⭐ 设置默认地址，地址ID: {address_id}, 用户ID: {user_id}")
+        logger.debug("设置默认地址", extra={"user_id": user_id, "address_id": address_id})
         
         # 1. 验证地址是否存在且属于当前用户
-        existing_address = db.execute_query(
+        existing_address = await async_db.execute_query(
             "SELECT * FROM Address WHERE address_id = ? AND user_id = ?",
             (address_id, user_id)
         )
@@ -313,20 +315,20 @@ async def set_default_address(
         # 注意：这里假设数据库支持事务，SQL Server默认支持
         
         # 取消所有地址的默认状态
-        db.execute_update(
+        await async_db.execute_update(
             "UPDATE Address SET is_default = 0 WHERE user_id = ?",
             (user_id,)
         )
         
         # 设置指定地址为默认
-        rows_affected = db.execute_update(
+        rows_affected = await async_db.execute_update(
             "UPDATE Address SET is_default = 1, update_time = GETDATE() WHERE address_id = ? AND user_id = ?",
             (address_id, user_id)
         )
         
         if rows_affected > 0:
             # 获取更新后的地址
-            updated_address = db.execute_query(
+            updated_address = await async_db.execute_query(
                 "SELECT * FROM Address WHERE address_id = ?",
                 (address_id,)
             )
@@ -345,7 +347,7 @@ async def set_default_address(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"💥 设置默认地址异常: {str(e)}")
+        logger.exception("设置默认地址异常")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"设置默认地址失败: {str(e)}"
@@ -53,6 +53,12 @@ export const cartApi = {
     return api.delete('/cart/batch', {
       data: product_ids
     })
+  },
+  
+  // 批量修改购物车，operations: [{ product_id, quantity, op: 'add' | 'set' | 'remove' }]
+  // 响应中直接返回修改后的购物车
+  batchUpdate(operations) {
+    return api.patch('/cart/items', operations)
   }
 }
 
@@ -31,23 +31,27 @@ export const useCartStore = defineStore('cart', () => {
     ).toFixed(2)
   )
 
+  // 用后端返回的购物车数据更新本地列表
+  const setCartData = (cartData) => {
+    cartItems.value = cartData.items.map(item => ({
+      cart_id: item.cart_id,
+      product_id: item.product_id,
+      product_name: item.product_name,
+      price: item.price || item.unit_price,
+      image_url: item.image_url,
+      stock_quantity: item.stock_quantity,
+      quantity: item.quantity,
+      selected: item.selected !== undefined ? item.selected : true
+    }))
+  }
+
   // 从后端获取购物车数据
   const fetchCart = async () => {
     try {
       const response = await cartApi.getCart()
       
       if (response.data.code === 200) {
-        const cartData = response.data.data
-        cartItems.value = cartData.items.map(item => ({
-          cart_id: item.cart_id,
-          product_id: item.product_id,
-          product_name: item.product_name,
-          price: item.price || item.unit_price,
-          image_url: item.image_url,
-          stock_quantity: item.stock_quantity,
-          quantity: item.quantity,
-          selected: item.selected !== undefined ? item.selected : true
-        }))
+        setCartData(response.data.data)
         return true
       }
       return false
@@ -107,10 +111,13 @@ export const useCartStore = defineStore('cart', () => {
         return
       }
       
-      const response = await cartApi.updateQuantity(productId, quantity)
+      // 批量接口直接返回最新购物车，不需要再请求一次 GET /cart
+      const response = await cartApi.batchUpdate([
+        { product_id: productId, quantity, op: 'set' }
+      ])
       
       if (response.data.code === 200) {
-        await fetchCart() // 更新本地数据
+        setCartData(response.data.data)
         ElMessage.success('更新数量成功')
         return true
       } else {
@@ -124,6 +131,25 @@ export const useCartStore = defineStore('cart', () => {
     }
   }
 
+  // 批量同步购物车（一次请求完成多项新增/修改/移除）
+  const syncItems = async (operations) => {
+    try {
+      const response = await cartApi.batchUpdate(operations)
+      
+      if (response.data.code === 200) {
+        setCartData(response.data.data)
+        return true
+      } else {
+        ElMessage.error(response.data.message || '同步购物车失败')
+        return false
+      }
+    } catch (error) {
+      console.error('同步购物车失败:', error)
+      ElMessage.error(error.response?.data?.detail || '同步购物车失败')
+      return false
+    }
+  }
+
   // 切换选中状态
   const toggleSelect = (productId) => {
     const item = cartItems.value.find(item => item.product_id === productId)
@@ -219,6 +245,7 @@ export const useCartStore = defineStore('cart', () => {
     selectedAmount,
     addToCart,
     updateQuantity,
+    syncItems,
     toggleSelect,
     toggleSelectAll,
     removeFromCart,